@@ -0,0 +1,280 @@
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["時間", "開盤", "最高", "最低", "收盤", "成交量"]
+# 欄位 -> (檔名, dtype)；時間以 int64 epoch 奈秒儲存
+FIELDS = {
+    "時間": ("time.i8", np.int64),
+    "開盤": ("open.f8", np.float64),
+    "最高": ("high.f8", np.float64),
+    "最低": ("low.f8", np.float64),
+    "收盤": ("close.f8", np.float64),
+    "成交量": ("volume.f8", np.float64),
+}
+
+
+def store_path(filename):
+    """CSV 對應的二進位儲存目錄，例如 ETH每小時Ｋ棒.csv -> ETH每小時Ｋ棒.bars"""
+    return os.path.splitext(filename)[0] + ".bars"
+
+
+def _meta_path(path):
+    return os.path.join(path, "meta.json")
+
+
+def read_meta(path):
+    try:
+        with open(_meta_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_meta(path, meta):
+    # 先寫暫存檔再原子替換；rows 只在資料寫入完成後才更新，中斷時多出的位元組會被忽略
+    tmp = _meta_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _meta_path(path))
+
+
+def source_signature(filename):
+    stat = os.stat(filename)
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def journal_path(filename):
+    return filename + ".journal"
+
+
+def recover_csv(filename):
+    # 上次附加寫入中途中斷時，依 journal 記錄的原始大小截斷，移除不完整的資料列
+    journal = journal_path(filename)
+    if not os.path.exists(journal):
+        return
+    with open(journal) as f:
+        size = int(f.read().strip() or 0)
+    if os.path.exists(filename) and size > 0:
+        with open(filename, "r+b") as f:
+            f.truncate(size)
+    os.remove(journal)
+
+
+def _is_stale(filename, path):
+    meta = read_meta(path)
+    if meta is None:
+        return True
+    if not os.path.exists(filename):
+        return False
+    return {k: meta.get(k) for k in ("source_size", "source_mtime_ns")} != source_signature(filename)
+
+
+def _frame_arrays(df):
+    arrays = {col: np.ascontiguousarray(df[col].to_numpy(dtype=np.float64)) for col in COLUMNS[1:]}
+    arrays["時間"] = np.ascontiguousarray(pd.to_datetime(df["時間"]).to_numpy(dtype="datetime64[ns]").view(np.int64))
+    return arrays
+
+
+def _extra_meta(meta, timeframe):
+    # K棒週期記錄在 meta 中，重新轉換或附加時保留
+    timeframe = timeframe or (meta or {}).get("timeframe")
+    return {"timeframe": timeframe} if timeframe else {}
+
+
+def write_columns(path, arrays):
+    os.makedirs(path, exist_ok=True)
+    for col, (name, dtype) in FIELDS.items():
+        arrays[col].astype(dtype).tofile(os.path.join(path, name))
+
+
+def replace_columns(path, arrays, meta):
+    """
+    整份重寫欄位檔：寫到同層的暫存目錄後再換上，不覆寫其他程序仍以 memory map 開啟的舊檔
+    舊目錄中的子目錄（resample 的合併週期）移到新目錄保留，由各自的 meta 判斷是否需要重建
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=parent)
+    try:
+        write_columns(tmp, arrays)
+        write_meta(tmp, meta)
+        if os.path.isdir(path):
+            for entry in os.scandir(path):
+                if entry.is_dir():
+                    os.replace(entry.path, os.path.join(tmp, entry.name))
+            # 目錄無法直接覆蓋非空目錄，先把舊目錄移開再換上新目錄
+            old = tmp + ".old"
+            os.replace(path, old)
+            os.replace(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def append_columns(path, rows, arrays):
+    # 先截斷到 rows（移除上次中斷留下的多餘位元組）再附加
+    for col, (name, dtype) in FIELDS.items():
+        with open(os.path.join(path, name), "r+b") as f:
+            f.truncate(rows * np.dtype(dtype).itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(arrays[col].astype(dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_columns(path, rows, mmap=True):
+    arrays = {}
+    for col, (name, dtype) in FIELDS.items():
+        file = os.path.join(path, name)
+        if rows == 0:
+            arrays[col] = np.empty(0, dtype=dtype)
+        elif mmap:
+            arrays[col] = np.memmap(file, dtype=dtype, mode="r", shape=(rows,))
+        else:
+            arrays[col] = np.fromfile(file, dtype=dtype, count=rows)
+    return arrays
+
+
+def convert_csv(filename, path=None, timeframe=None):
+    """
+    將 CSV 整份轉成二進位欄位檔（CSV 仍作為匯入/匯出格式）；timeframe 如 "1h"，記錄為基礎K棒週期
+    每次整份轉換產生新的 generation，合併週期據此得知既有範圍內的資料可能已被修正
+    """
+    path = path or store_path(filename)
+    extra = _extra_meta(read_meta(path), timeframe)
+    recover_csv(filename)
+    df = pd.read_csv(filename, parse_dates=["時間"])
+    replace_columns(path, _frame_arrays(df), {"rows": len(df), **source_signature(filename), **extra,
+                                              "generation": os.urandom(8).hex()})
+    return path
+
+
+def append_bars(filename, df_new, previous_signature, path=None, timeframe=None):
+    """
+    將新K棒附加到二進位儲存；CSV 需已先附加同樣的資料
+    previous_signature: 附加前的 source_signature(filename)，與儲存記錄不符時代表不同步，改為整份重新轉換
+    """
+    path = path or store_path(filename)
+    meta = read_meta(path)
+    if meta is None or {k: meta.get(k) for k in previous_signature} != previous_signature:
+        return convert_csv(filename, path, timeframe)
+    rows = meta["rows"]
+    append_columns(path, rows, _frame_arrays(df_new))
+    write_meta(path, {"rows": rows + len(df_new), **source_signature(filename), **_extra_meta(meta, timeframe),
+                      "generation": meta.get("generation")})
+    return path
+
+
+def read_arrays(filename, path=None, mmap=True):
+    """回傳 {欄位: ndarray}；預設以 memory map 讀取，不需解析文字"""
+    path = path or store_path(filename)
+    if _is_stale(filename, path):
+        convert_csv(filename, path)
+    return read_columns(path, read_meta(path)["rows"], mmap)
+
+
+def load_bars(filename):
+    """
+    讀取K棒資料（main.py / update_daily / optimize 共用的載入入口）
+    第一次讀取或 CSV 被外部修改時自動轉換為二進位儲存
+    """
+    return BarStore.open(filename).to_frame()
+
+
+def last_time(filename):
+    """二進位儲存中最後一根K棒的時間；無資料時回傳 None"""
+    path = store_path(filename)
+    meta = read_meta(path)
+    if meta is None or meta["rows"] == 0 or _is_stale(filename, path):
+        return None
+    time_file = os.path.join(path, FIELDS["時間"][0])
+    last = np.fromfile(time_file, dtype=np.int64, count=1, offset=(meta["rows"] - 1) * 8)[0]
+    return pd.Timestamp(int(last))
+
+
+def export_csv(filename, out):
+    load_bars(filename).to_csv(out, index=False)
+
+
+class BarStore:
+    """
+    依時間排序的K棒欄位陣列，時間以 int64 epoch 奈秒為索引
+    區間查詢以 searchsorted 找出位置後回傳切片（與原陣列共用記憶體，不複製），
+    close / high / low / times 可直接傳給 martin_backtest 與 calculate_zigzag
+    """
+
+    def __init__(self, arrays, offset=0):
+        self.arrays = arrays    # {欄位: ndarray}，與 COLUMNS 相同
+        self.offset = offset    # 第一根在完整資料中的位置，to_frame 的索引由此開始
+
+    @classmethod
+    def open(cls, filename):
+        # memory map 讀取，np.asarray 只轉成一般 ndarray 檢視，不複製資料
+        return cls({col: np.asarray(arr) for col, arr in read_arrays(filename).items()})
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(_frame_arrays(df))
+
+    def __len__(self):
+        return len(self.arrays["時間"])
+
+    def __getitem__(self, key):
+        """以位置切片，例如 store[100:200]"""
+        start, _, step = key.indices(len(self))
+        if step != 1:
+            raise ValueError("BarStore 只支援連續切片")
+        return BarStore({col: arr[key] for col, arr in self.arrays.items()}, self.offset + start)
+
+    def iter_chunks(self, chunk_size):
+        """依序回傳每 chunk_size 根一段的切片；memory map 只在讀到該段時才載入"""
+        for start in range(0, len(self), chunk_size):
+            yield self[start:start + chunk_size]
+
+    def locate(self, start=None, end=None):
+        """回傳 [start, end] 時間區間（含兩端）的位置範圍 (i, j)"""
+        t = self.arrays["時間"]
+        i = 0 if start is None else int(np.searchsorted(t, pd.Timestamp(start).value, side="left"))
+        j = len(t) if end is None else int(np.searchsorted(t, pd.Timestamp(end).value, side="right"))
+        return i, max(i, j)
+
+    def range(self, start=None, end=None):
+        i, j = self.locate(start, end)
+        return self[i:j]
+
+    @property
+    def times(self):
+        return self.arrays["時間"].view("datetime64[ns]")
+
+    @property
+    def high(self):
+        return self.arrays["最高"]
+
+    @property
+    def low(self):
+        return self.arrays["最低"]
+
+    @property
+    def close(self):
+        return self.arrays["收盤"]
+
+    def take(self, indices):
+        """取出指定位置的K棒列，索引與 to_frame 相同"""
+        indices = np.asarray(indices, dtype=np.int64)
+        data = {col: arr[indices] for col, arr in self.arrays.items()}
+        data["時間"] = data["時間"].view("datetime64[ns]")
+        return pd.DataFrame(data, columns=COLUMNS, index=indices + self.offset)
+
+    def to_frame(self):
+        """轉成 DataFrame（會複製資料，只在畫圖等需要 DataFrame 時使用）"""
+        data = dict(self.arrays)
+        data["時間"] = self.times
+        return pd.DataFrame(data, columns=COLUMNS, index=pd.RangeIndex(self.offset, self.offset + len(self)))
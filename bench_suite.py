@@ -0,0 +1,264 @@
+"""
+可重現的效能基準：以合成K棒量測主要運算，結果存成 JSON 基準檔，之後可比較是否變慢
+
+    python bench_suite.py run --sizes 10000 100000 1000000 --out bench_baseline.json
+    python bench_suite.py compare bench_baseline.json --tolerance 0.2
+
+compare 未指定 --sizes / --repeat / --seed / --workers / --optimize-max-bars 時沿用基準檔的設定重新量測；
+指定的設定與基準檔不同時會提示，兩份結果的項目不一定能直接比較
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+import bar_store
+from fake_exchange import FakeExchange
+from martin_strategy import martin_backtest_fast
+from optimize import optimize_martingale
+from update_daily import update_data
+from zigzag import calculate_zigzag
+
+COLUMNS = ["時間", "開盤", "最高", "最低", "收盤", "成交量"]
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+ZIGZAG_PARAMS = ((1.0, 3), (5.0, 10), (10.0, 20))
+# 最佳化的搜尋空間大小 -> (加碼百分比數, 止盈百分比數, 停損百分比數)
+OPTIMIZE_GRIDS = {100: (5, 5, 4), 1000: (10, 10, 10), 4000: (20, 20, 10)}
+# 多空、低/高波動（每根K棒報酬的平均與標準差）
+REGIMES = np.array([
+    (0.0004, 0.004),
+    (-0.0004, 0.004),
+    (0.0, 0.002),
+    (0.0, 0.012),
+])
+# 量測設定：記錄在結果的 meta 中，compare 重新量測時沿用
+SETTING_KEYS = ("sizes", "repeat", "seed", "workers", "optimize_max_bars")
+BACKTEST_PARAMS = dict(initial_balance=1000, leverage=10, add_pct=2.0, add_multiple=1.0, max_add_times=7,
+                       add_amount=100, add_amount_multiple=2.0, take_profit_pct=1.0, stop_loss_pct=10.0)
+
+
+def synthetic_bars(n, seed=0, start="2020-01-01", freq="1h", switch_prob=0.002, price=2000.0):
+    """
+    隨機漫步K棒，依 switch_prob 在 REGIMES 之間切換（趨勢、盤整、高波動），同一 seed 結果完全相同
+    價格取到小數 2 位、成交量 3 位，與交易所資料相同
+    """
+    rng = np.random.default_rng(seed)
+    switches = rng.random(n) < switch_prob
+    regime = rng.integers(0, len(REGIMES), size=switches.sum() + 1)[np.cumsum(switches)]
+    drift, vol = REGIMES[regime, 0], REGIMES[regime, 1]
+    returns = drift + vol * rng.standard_normal(n)
+    close = price * np.exp(np.cumsum(returns))
+    open_ = np.r_[price, close[:-1]]
+    wick = np.abs(rng.standard_normal((2, n))) * vol * 0.5
+    high = np.maximum(open_, close) * np.exp(wick[0])
+    low = np.minimum(open_, close) * np.exp(-wick[1])
+    volume = rng.lognormal(8, 0.5, n) * (vol / REGIMES[:, 1].min())
+    return pd.DataFrame({
+        "時間": pd.date_range(start, periods=n, freq=freq),
+        "開盤": open_.round(2),
+        "最高": high.round(2),
+        "最低": low.round(2),
+        "收盤": close.round(2),
+        "成交量": volume.round(3),
+    }, columns=COLUMNS)
+
+
+def best_time(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_zigzag(df, repeat):
+    return {f"calculate_zigzag[threshold={threshold},depth={depth}]":
+            best_time(lambda: calculate_zigzag(df, threshold, depth), repeat)
+            for threshold, depth in ZIGZAG_PARAMS}
+
+
+def bench_backtest(df, repeat):
+    arrays = (df["收盤"].values, df["最高"].values, df["最低"].values, df["時間"].values)
+    martin_backtest_fast(*(a[:100] for a in arrays), 1, **BACKTEST_PARAMS)  # 先觸發 JIT 編譯
+    return {f"martin_backtest[direction={direction}]":
+            best_time(lambda: martin_backtest_fast(*arrays, direction, **BACKTEST_PARAMS), repeat)
+            for direction in (1, -1)}
+
+
+def bench_optimize(df, repeat, workers):
+    results = {}
+    for size, (n_add, n_tp, n_sl) in OPTIMIZE_GRIDS.items():
+        space = {
+            "add_pct": list(np.linspace(1.0, 4.0, n_add)),
+            "take_profit_pct": list(np.linspace(1.0, 4.0, n_tp)),
+            "stop_loss_pct": list(np.linspace(1.0, 10.0, n_sl)),
+        }
+        results[f"optimize_martingale[grid={size},workers={workers}]"] = best_time(lambda: optimize_martingale(
+            df["收盤"].values, df["最高"].values, df["最低"].values, df["時間"].values,
+            initial_balance=1000, add_amount=100, workers=workers, search_space=space), repeat)
+    return results
+
+
+def bench_io(df, repeat):
+    # CSV 解析、二進位儲存載入，以及 update_data 附加 499 根新K棒的成本
+    results = {}
+    tf_ms = 3600 * 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bars.csv")
+        df.to_csv(path, index=False)
+        results["read_csv"] = best_time(lambda: pd.read_csv(path, parse_dates=["時間"]), repeat)
+        t0 = time.perf_counter()
+        bar_store.convert_csv(path, timeframe="1h")
+        results["bar_store.convert_csv"] = time.perf_counter() - t0
+        results["bar_store.load_bars"] = best_time(lambda: bar_store.load_bars(path), repeat)
+
+        last_ms = int(df["時間"].iloc[-1].value // 10**6)
+        elapsed = []
+        for r in range(repeat):
+            # 每次在新的複本上附加，避免前一次的結果影響量測
+            copy = os.path.join(tmp, f"merge{r}.csv")
+            df.to_csv(copy, index=False)
+            bar_store.convert_csv(copy, timeframe="1h")
+            exchange = FakeExchange(start=last_ms + tf_ms, now=last_ms + 500 * tf_ms)
+            t0 = time.perf_counter()
+            update_data(filename=copy, exchange=exchange)
+            elapsed.append(time.perf_counter() - t0)
+        results["update_data[+499 bars]"] = min(elapsed)
+    return results
+
+
+def run_suite(sizes=DEFAULT_SIZES, repeat=3, seed=0, workers=1, optimize_max_bars=100_000, progress=print):
+    """執行所有量測，回傳可直接存成 JSON 的 dict（秒數）"""
+    results = {}
+    for n in sizes:
+        df = synthetic_bars(n, seed=seed)
+        stages = [("zigzag", lambda: bench_zigzag(df, repeat)),
+                  ("backtest", lambda: bench_backtest(df, repeat)),
+                  ("io", lambda: bench_io(df, repeat))]
+        if n <= optimize_max_bars:
+            stages.append(("optimize", lambda: bench_optimize(df, 1, workers)))
+        for name, stage in stages:
+            if progress is not None:
+                progress(f"[{n} 根] {name}…")
+            results.update({f"{key}@{n}": value for key, value in stage().items()})
+    return {
+        "meta": {
+            "created": pd.Timestamp.now(tz="UTC").isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "sizes": list(sizes),
+            "repeat": repeat,
+            "seed": seed,
+            "workers": workers,
+            "optimize_max_bars": optimize_max_bars,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, tolerance=0.2, min_seconds=0.005):
+    """
+    逐項比較兩份結果；current 超過 baseline * (1 + tolerance) 視為變慢
+    兩者都低於 min_seconds 的項目量測誤差太大，不判定
+    """
+    rows = []
+    for key in sorted(set(baseline["results"]) | set(current["results"])):
+        before = baseline["results"].get(key)
+        after = current["results"].get(key)
+        if before is None or after is None:
+            status = "新增" if before is None else "缺少"
+            rows.append((key, before, after, np.nan, status))
+            continue
+        ratio = after / before if before > 0 else np.inf
+        if max(before, after) < min_seconds:
+            status = "略過"
+        elif ratio > 1 + tolerance:
+            status = "變慢"
+        elif ratio < 1 / (1 + tolerance):
+            status = "變快"
+        else:
+            status = "持平"
+        rows.append((key, before, after, ratio, status))
+    return pd.DataFrame(rows, columns=["項目", "基準 (s)", "目前 (s)", "比值", "結果"]).set_index("項目")
+
+
+def setting_differences(baseline_meta, current_meta):
+    """兩份結果量測設定不同的項目 {設定: (基準, 目前)}；舊基準檔沒有記錄的設定不比較"""
+    return {key: (baseline_meta[key], current_meta.get(key)) for key in SETTING_KEYS
+            if key in baseline_meta and baseline_meta[key] != current_meta.get(key)}
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save(result, path):
+    with open(path, "w") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_defaults = {"sizes": list(DEFAULT_SIZES), "repeat": 3, "seed": 0, "workers": 1, "optimize_max_bars": 100_000}
+    for name in ("run", "compare"):
+        p = sub.add_parser(name)
+        # compare 的預設值為 None，代表沿用基準檔的設定
+        defaults = run_defaults if name == "run" else dict.fromkeys(run_defaults)
+        p.add_argument("--sizes", type=int, nargs="+", default=defaults["sizes"])
+        p.add_argument("--repeat", type=int, default=defaults["repeat"])
+        p.add_argument("--seed", type=int, default=defaults["seed"])
+        p.add_argument("--workers", type=int, default=defaults["workers"])
+        p.add_argument("--optimize-max-bars", type=int, default=defaults["optimize_max_bars"])
+    sub.choices["run"].add_argument("--out", default="bench_baseline.json")
+    p = sub.choices["compare"]
+    p.add_argument("baseline")
+    p.add_argument("--current", help="已存在的結果檔；未提供時以基準檔的設定重新量測")
+    p.add_argument("--tolerance", type=float, default=0.2)
+    p.add_argument("--min-seconds", type=float, default=0.005)
+    p.add_argument("--out", help="另存這次的量測結果")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        result = run_suite(args.sizes, args.repeat, args.seed, args.workers, args.optimize_max_bars)
+        _save(result, args.out)
+        print(pd.Series(result["results"], name="秒").to_string())
+        print(f"已寫入 {args.out}")
+        return 0
+
+    baseline = _load(args.baseline)
+    settings = {key: getattr(args, key) for key in SETTING_KEYS if getattr(args, key) is not None}
+    if args.current:
+        if settings:
+            parser.error("--current 比較已存在的結果檔，不能同時指定量測設定：" + ", ".join(settings))
+        current = _load(args.current)
+    else:
+        params = {key: baseline["meta"][key] for key in SETTING_KEYS if key in baseline["meta"]}
+        params.update(settings)
+        current = run_suite(**params)
+    for key, (before, after) in setting_differences(baseline["meta"], current["meta"]).items():
+        print(f"⚠️ 量測設定 {key} 與基準檔不同（基準 {before}，目前 {after}），結果不一定可比較", file=sys.stderr)
+    if args.out:
+        _save(current, args.out)
+    report = compare(baseline, current, args.tolerance, args.min_seconds)
+    print(report.to_string(float_format=lambda v: f"{v:.4f}"))
+    slower = report.index[report["結果"] == "變慢"].tolist()
+    if slower:
+        print(f"❌ {len(slower)} 項變慢超過 {args.tolerance:.0%}：{', '.join(slower)}")
+        return 1
+    print(f"✅ 沒有超過 {args.tolerance:.0%} 的變慢項目")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from fake_exchange import FakeExchange
+from update_daily import backfill_data
+from zigzag import pivot_masks, calculate_zigzag, ZigZagState
+import plotly.graph_objects as go
+from charts import kline_figure
+from martin_strategy import martin_backtest, martin_backtest_both, martin_backtest_fast
+
+filename = "ETH每小時Ｋ棒.csv"
+
+
+def legacy_pivot_masks(highs, lows, depth):
+    # 舊版逐根切片比較（僅供基準測試與 tests/test_parity.py 對照）
+    is_pivot_high = np.zeros(len(highs), dtype=bool)
+    is_pivot_low = np.zeros(len(lows), dtype=bool)
+    for i in range(depth, len(highs) - depth):
+        is_pivot_high[i] = highs[i] == max(highs[i - depth:i + depth + 1])
+        is_pivot_low[i] = lows[i] == min(lows[i - depth:i + depth + 1])
+    return is_pivot_high, is_pivot_low
+
+
+def best_time(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_pivot_masks(df, depths=range(1, 21), repeat=3):
+    highs = df["最高"].values
+    lows = df["最低"].values
+    rows = []
+    for depth in depths:
+        legacy = best_time(legacy_pivot_masks, highs, lows, depth, repeat=repeat)
+        fast = best_time(pivot_masks, highs, lows, depth, repeat=repeat)
+        rows.append((depth, legacy * 1000, fast * 1000, legacy / fast))
+    return pd.DataFrame(rows, columns=["depth", "舊版 (ms)", "向量化 (ms)", "加速倍數"]).set_index("depth")
+
+
+def bench_zigzag_stream(df, params=((5.0, 10), (2.0, 3), (8.0, 20), (1.0, 1)), tail=500):
+    # 串流版每新增一根K棒的平均成本 vs 批次重算（輸出一致性由 tests/test_parity.py 檢查）
+    rows = []
+    for threshold, depth in params:
+        state = ZigZagState(threshold, depth).update_frame(df.iloc[:-tail])
+        t0 = time.perf_counter()
+        state.update_frame(df.iloc[-tail:])
+        per_bar = (time.perf_counter() - t0) / tail
+        batch = best_time(calculate_zigzag, df, threshold, depth)
+        rows.append((threshold, depth, batch * 1000, per_bar * 1e6))
+    return pd.DataFrame(rows, columns=["threshold", "depth", "批次重算 (ms)", "串流每根 (µs)"])
+
+
+def legacy_kline_figure(df_window, swing_points_window, chart_height=550):
+    # 原本 K 線圖分頁的畫法：每個波段各一條 Scatter
+    fig = go.Figure()
+    fig.add_trace(go.Candlestick(
+        x=df_window["時間"], open=df_window["開盤"], high=df_window["最高"], low=df_window["最低"], close=df_window["收盤"], name="K線"
+    ))
+    fig.add_trace(go.Scatter(
+        x=swing_points_window["時間"], y=swing_points_window["pivot_price"],
+        mode="markers+text", text=swing_points_window["label"], textposition=swing_points_window["text_position"],
+        marker=dict(size=8, color="white", symbol="circle"),
+        textfont=dict(color=swing_points_window["text_color"]),
+        name="ZigZag轉折點"
+    ))
+    for i in range(1, len(swing_points_window)):
+        fig.add_trace(go.Scatter(
+            x=[swing_points_window.iloc[i - 1]["時間"], swing_points_window.iloc[i]["時間"]],
+            y=[swing_points_window.iloc[i - 1]["pivot_price"], swing_points_window.iloc[i]["pivot_price"]],
+            mode="lines", line=dict(color="orange", width=2), showlegend=False
+        ))
+    fig.update_layout(
+        template="plotly_dark", height=chart_height,
+        xaxis_rangeslider_visible=False,
+        yaxis=dict(range=[df_window["最低"].min() * 0.985, df_window["最高"].max() * 1.015]),
+        xaxis=dict(range=[df_window["時間"].iloc[0], df_window["時間"].iloc[-1]]),
+        dragmode="zoom"
+    )
+    return fig
+
+
+def bench_kline_payload(df, threshold=1.0, depth=3, window=500, max_points=2000):
+    # 比較 K 線圖的 trace 數、傳到瀏覽器的 JSON 大小與建圖 + 序列化時間
+    swing_points = calculate_zigzag(df, threshold, depth)[0]
+    cases = [
+        ("舊版 全區間", legacy_kline_figure, df, {}),
+        ("舊版 500 根視窗", legacy_kline_figure, df.iloc[-window:], {}),
+        ("單一折線 500 根視窗", kline_figure, df.iloc[-window:], dict(chart_height=550)),
+        ("全區間 K棒合併", kline_figure, df, dict(chart_height=550, mode="ohlc", max_points=max_points)),
+        ("全區間 LTTB", kline_figure, df, dict(chart_height=550, mode="lttb", max_points=max_points)),
+    ]
+    rows = []
+    for name, build, bars, kwargs in cases:
+        points = swing_points[swing_points["時間"] >= bars["時間"].iloc[0]].reset_index(drop=True)
+        t0 = time.perf_counter()
+        payload = build(bars, points, **kwargs).to_json()
+        elapsed = time.perf_counter() - t0
+        rows.append((name, len(bars), len(json_traces(payload)), len(payload) / 1024, elapsed * 1000))
+    return pd.DataFrame(rows, columns=["畫法", "K棒數", "trace 數", "JSON (KB)", "建圖+序列化 (ms)"]).set_index("畫法")
+
+
+def json_traces(payload):
+    return json.loads(payload)["data"]
+
+
+def price_arrays(df):
+    return df["收盤"].values, df["最高"].values, df["最低"].values, df["時間"].values
+
+
+def bench_trade_log_memory(df):
+    # 精簡交易紀錄（compact=True）相對 martin_backtest 交易紀錄的記憶體縮減倍數
+    arrays = price_arrays(df)
+    kwargs = dict(initial_balance=1000, leverage=10, add_pct=2.0, add_multiple=1.0, max_add_times=7,
+                  add_amount=100, add_amount_multiple=2.0, take_profit_pct=1.0, stop_loss_pct=10.0)
+    legacy = martin_backtest(*arrays, 1, **kwargs)[0]
+    compact = martin_backtest_both(*arrays, **kwargs)[1][0]
+    return legacy.memory_usage(deep=True).sum() / compact.memory_usage(deep=True).sum()
+
+
+def bench_martin_backtest(df, repeat=3):
+    arrays = price_arrays(df)
+    kwargs = dict(initial_balance=1000, leverage=10, add_pct=2.0, add_multiple=1.0, max_add_times=7,
+                  add_amount=100, add_amount_multiple=2.0, take_profit_pct=1.0, stop_loss_pct=10.0)
+    rows = []
+    for direction in (1, -1):
+        legacy = best_time(lambda: martin_backtest(*arrays, direction, **kwargs), repeat=repeat)
+        fast = best_time(lambda: martin_backtest_fast(*arrays, direction, **kwargs), repeat=repeat)
+        rows.append(("做多" if direction == 1 else "做空", legacy * 1000, fast * 1000, legacy / fast))
+    # 兩個方向：各呼叫一次 vs 一次走訪
+    legacy = rows[0][1] + rows[1][1]
+    both = best_time(lambda: martin_backtest_both(*arrays, **kwargs), repeat=repeat) * 1000
+    rows.append(("做多 + 做空", legacy, both, legacy / both))
+    return pd.DataFrame(rows, columns=["方向", "martin_backtest (ms)", "快速引擎 (ms)", "加速倍數"]).set_index("方向")
+
+
+def bench_backfill(bars=20000, workers=(1, 2, 4, 8), latency=0.05, rate_limit=10):
+    # 以離線交易所替身量測分頁補齊的吞吐量（資料完整性由 tests/test_parity.py 檢查）
+    start = 1577836800000
+    tf_ms = 3600 * 1000
+    rows = []
+    for n in workers:
+        exchange = FakeExchange(start=start, now=start + bars * tf_ms, latency=latency, rate_limit=rate_limit)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bars.csv")
+            t0 = time.perf_counter()
+            backfill_data(filename=path, exchange=exchange, max_workers=n)
+            elapsed = time.perf_counter() - t0
+        rows.append((n, exchange.calls, elapsed, bars / elapsed))
+    return pd.DataFrame(rows, columns=["執行緒數", "請求次數", "耗時 (s)", "K棒/秒"]).set_index("執行緒數")
+
+
+if __name__ == "__main__":
+    df = pd.read_csv(filename, parse_dates=["時間"])
+    print(f"K棒數量：{len(df)}")
+    print(bench_pivot_masks(df).round(2).to_string())
+    print(bench_zigzag_stream(df).round(2).to_string())
+    print(bench_kline_payload(df).round(1).to_string())
+    print(f"精簡交易紀錄記憶體縮減 {bench_trade_log_memory(df.iloc[-8000:]):.1f} 倍")
+    print(bench_martin_backtest(df).round(2).to_string())
+    print(bench_backfill().round(2).to_string())
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# 快取結果由這些模組計算；原始碼有任何變動，ENGINE_VERSION 即不同，舊快取自動失效
+ENGINE_MODULES = ("zigzag.py", "martin_strategy.py", "optimize.py", "robustness.py", "symbols.py")
+# 結果格式改變但計算模組未修改時（例如外部套件升級改變輸出），手動調整這個版本號
+SCHEMA_VERSION = "2"
+
+
+def engine_version(schema_version=SCHEMA_VERSION, modules=ENGINE_MODULES, directory=None):
+    """以結果格式版本與計算模組原始碼的雜湊作為引擎版本"""
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.blake2b(schema_version.encode(), digest_size=8)
+    for name in modules:
+        h.update(name.encode())
+        try:
+            with open(os.path.join(directory, name), "rb") as f:
+                h.update(f.read())
+        except FileNotFoundError:
+            pass
+    return h.hexdigest()
+
+
+ENGINE_VERSION = engine_version()
+
+# 與程式放在同一目錄，不隨啟動時的工作目錄（streamlit run / cli / worker）各存一份
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache.sqlite")
+
+
+def fingerprint_arrays(*arrays):
+    """以內容雜湊代表一段K棒資料，資料有任何變動（含新增K棒）即得到不同指紋"""
+    h = hashlib.blake2b(digest_size=16)
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        h.update(str(arr.dtype).encode())
+        h.update(str(arr.shape).encode())
+        h.update(arr.view(np.uint8).tobytes() if arr.dtype != object else pickle.dumps(arr))
+    return h.hexdigest()
+
+
+def make_key(name, data_fingerprint, time_range, params):
+    payload = json.dumps(
+        [ENGINE_VERSION, name, data_fingerprint, [str(t) for t in time_range], params],
+        sort_keys=True, default=str, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    兩層結果快取：記憶體 LRU + SQLite 磁碟儲存（重新啟動後仍可使用）
+    以 (資料指紋, 時間範圍, 參數, ENGINE_VERSION) 為鍵；磁碟超過 max_disk_bytes 時淘汰最久未使用的項目
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_memory_items=64, max_disk_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, dataset TEXT, size INTEGER, last_access REAL, value BLOB)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS entries_dataset ON entries(dataset)")
+                conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+
+    def _connect(self):
+        # Streamlit 於不同執行緒重跑腳本，每次操作各自開啟連線
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _remember(self, key, dataset, value):
+        with self._lock:
+            self._memory[key] = (dataset, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][1]
+        if self.path is None:
+            return default
+        with self._connect() as conn:
+            row = conn.execute("SELECT dataset, value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        dataset, blob = row
+        value = pickle.loads(blob)
+        self._remember(key, dataset, value)
+        return value
+
+    def set(self, key, value, dataset=None):
+        self._remember(key, dataset, value)
+        if self.path is None:
+            return
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, dataset, size, last_access, value) VALUES (?, ?, ?, ?, ?)",
+                (key, dataset, len(blob), time.time(), blob),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_disk_bytes:
+                break
+
+    def invalidate_dataset(self, dataset):
+        """資料檔更新（例如 update_data 新增K棒）後清除該資料集的所有快取"""
+        with self._lock:
+            for key in [k for k, (ds, _) in self._memory.items() if ds == dataset]:
+                del self._memory[key]
+        if self.path is not None and os.path.exists(self.path):
+            with self._connect() as conn:
+                conn.execute("DELETE FROM entries WHERE dataset = ?", (dataset,))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.path is not None and os.path.exists(self.path):
+            with self._connect() as conn:
+                conn.execute("DELETE FROM entries")
+
+    def cached_call(self, name, func, *args, dataset=None, data_fingerprint=None, time_range=(), params=None,
+                    **kwargs):
+        """
+        以快取包裝計算函式：鍵由 name、資料指紋、時間範圍與 params 組成
+        params 未提供時使用 kwargs（需可 JSON 序列化）
+        """
+        key = make_key(name, data_fingerprint, time_range, kwargs if params is None else params)
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = func(*args, **kwargs)
+            self.set(key, value, dataset)
+        return value
+
+
+_default_cache = None
+
+
+def get_cache(path=DEFAULT_PATH):
+    # 模組層級的共用快取，Streamlit 重跑時記憶體 LRU 仍保留
+    global _default_cache
+    if _default_cache is None or _default_cache.path != path:
+        _default_cache = ResultCache(path)
+    return _default_cache
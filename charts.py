@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+KLINE_MODES = ("window", "ohlc", "lttb")
+# 轉折點超過此數量時只在滑鼠移入時顯示標籤，避免上千個文字標籤重疊
+MAX_LABELS = 300
+
+
+def _bucket_starts(n, n_out):
+    # 將 n 根K棒切成 n_out 個連續區段，回傳各區段起點
+    return np.unique(np.linspace(0, n, n_out, endpoint=False).astype(np.int64))
+
+
+def ohlc_downsample(df, max_bars=2000):
+    """
+    將K棒合併成最多 max_bars 根：開盤取區段第一根、收盤取最後一根、最高/最低取極值、成交量加總
+    與只取樣部分K棒不同，區段內的最高點與最低點不會遺失
+    """
+    n = len(df)
+    if n <= max_bars:
+        return df
+    starts = _bucket_starts(n, max_bars)
+    ends = np.append(starts[1:], n) - 1
+    data = {
+        "時間": df["時間"].to_numpy()[starts],
+        "開盤": df["開盤"].to_numpy()[starts],
+        "最高": np.maximum.reduceat(df["最高"].to_numpy(), starts),
+        "最低": np.minimum.reduceat(df["最低"].to_numpy(), starts),
+        "收盤": df["收盤"].to_numpy()[ends],
+    }
+    if "成交量" in df:
+        data["成交量"] = np.add.reduceat(df["成交量"].to_numpy(), starts)
+    return pd.DataFrame(data)
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets 降採樣，回傳保留點的位置
+    每個區段保留與前一個保留點、下一區段平均點構成最大三角形的點，能保留折線的形狀與轉折
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # 首尾固定保留，中間 n - 2 個點分成 n_out - 2 個區段
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nxt_lo, nxt_hi = edges[b + 1], edges[b + 2] if b + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[b + 1] = a
+    return keep
+
+
+def zigzag_traces(swing_points, show_labels=True):
+    """
+    轉折點與連線合併為單一 trace（原本每個波段各一條 Scatter）
+    標籤依顏色分組成固定數量的文字 trace：逐點顏色陣列在 plotly 端驗證很慢
+    """
+    times = swing_points["時間"].to_numpy()
+    prices = swing_points["pivot_price"].to_numpy()
+    labels = swing_points["label"].to_numpy()
+    traces = [go.Scatter(
+        x=times, y=prices, mode="lines+markers", hovertext=labels, hoverinfo="x+y+text",
+        line=dict(color="orange", width=2),
+        marker=dict(size=8, color="white", symbol="circle"),
+        name="ZigZag轉折點"
+    )]
+    if show_labels:
+        colors = swing_points["text_color"].to_numpy()
+        positions = swing_points["text_position"].to_numpy()
+        for color in pd.unique(colors):
+            mask = colors == color
+            traces.append(go.Scatter(
+                x=times[mask], y=prices[mask], mode="text", text=labels[mask], textposition=positions[mask],
+                textfont=dict(color=color), hoverinfo="skip", showlegend=False
+            ))
+    return traces
+
+
+def kline_figure(df_bars, swing_points, chart_height, mode="window", max_points=2000):
+    """
+    K 線圖：mode="window" 畫出 df_bars 的每根K棒；
+    "ohlc" 以 ohlc_downsample 合併成最多 max_points 根K棒；"lttb" 以 LTTB 降採樣的收盤價折線呈現
+    """
+    if mode not in KLINE_MODES:
+        raise ValueError(f"未知的K線圖模式：{mode}，可用：{KLINE_MODES}")
+    fig = go.Figure()
+    # 一律傳 numpy 陣列：plotly 驗證 pandas 時間序列的成本遠高於陣列
+    if mode == "lttb":
+        times = df_bars["時間"].to_numpy()
+        keep = lttb(times.astype("datetime64[ns]").astype(np.int64), df_bars["收盤"].to_numpy(), max_points)
+        fig.add_trace(go.Scattergl(
+            x=times[keep], y=df_bars["收盤"].to_numpy()[keep], mode="lines",
+            line=dict(color="lightgray", width=1), name="收盤價"
+        ))
+    else:
+        bars = ohlc_downsample(df_bars, max_points) if mode == "ohlc" else df_bars
+        fig.add_trace(go.Candlestick(
+            x=bars["時間"].to_numpy(), open=bars["開盤"].to_numpy(), high=bars["最高"].to_numpy(),
+            low=bars["最低"].to_numpy(), close=bars["收盤"].to_numpy(), name="K線"
+        ))
+    fig.add_traces(zigzag_traces(swing_points, show_labels=len(swing_points) <= MAX_LABELS))
+    fig.update_layout(
+        template="plotly_dark", height=chart_height,
+        xaxis_rangeslider_visible=False,
+        yaxis=dict(range=[df_bars["最低"].min() * 0.985, df_bars["最高"].max() * 1.015]),
+        xaxis=dict(range=[df_bars["時間"].iloc[0], df_bars["時間"].iloc[-1]]),
+        dragmode="zoom"
+    )
+    return fig
+
+
+def equity_figure(df_equity, chart_height, max_points=2000):
+    """
+    權益曲線與回撤：上圖為權益，下圖為回撤 (%)
+    兩條線各自以 LTTB 降採樣，回撤的最低點不會因權益曲線的取樣而遺失
+    """
+    times = df_equity.index.to_numpy()
+    x = times.astype("datetime64[ns]").astype(np.int64)
+    equity = df_equity["權益"].to_numpy()
+    drawdown = -df_equity["回撤 (%)"].to_numpy()
+    keep_equity = lttb(x, equity, max_points)
+    keep_drawdown = lttb(x, drawdown, max_points)
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3], vertical_spacing=0.04)
+    fig.add_trace(go.Scattergl(x=times[keep_equity], y=equity[keep_equity], mode="lines",
+                               line=dict(color="dodgerblue", width=1.5), name="權益"), row=1, col=1)
+    fig.add_trace(go.Scattergl(x=times[keep_drawdown], y=drawdown[keep_drawdown], mode="lines",
+                               line=dict(color="tomato", width=1), fill="tozeroy", name="回撤 (%)"), row=2, col=1)
+    fig.update_layout(template="plotly_dark", height=chart_height, dragmode="zoom",
+                      legend=dict(orientation="h", y=1.02, x=0))
+    fig.update_yaxes(title_text="USDT", row=1, col=1)
+    fig.update_yaxes(title_text="回撤 (%)", row=2, col=1)
+    return fig
+
+
+def surface_heatmap(df_surface, metric, chart_height, threshold=None, depth=None):
+    """zigzag_surface 結果的 threshold × depth 熱圖；標出目前側邊欄選取的參數"""
+    grid = df_surface.pivot(index="depth", columns="threshold", values=metric)
+    fig = go.Figure(go.Heatmap(
+        z=grid.to_numpy(), x=grid.columns.to_numpy(), y=grid.index.to_numpy(), colorscale="Viridis",
+        colorbar=dict(title=metric), hovertemplate="threshold %{x}%<br>depth %{y}<br>" + metric + " %{z}<extra></extra>",
+    ))
+    if threshold is not None and depth is not None:
+        fig.add_trace(go.Scatter(x=[threshold], y=[depth], mode="markers", showlegend=False, hoverinfo="skip",
+                                 marker=dict(symbol="x", size=14, color="red", line=dict(width=2))))
+    fig.update_layout(template="plotly_dark", height=chart_height, xaxis_title="Deviation (%)",
+                      yaxis_title="Depth", xaxis=dict(dtick=0.5), yaxis=dict(dtick=1))
+    return fig
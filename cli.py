@@ -0,0 +1,109 @@
+"""
+不經過 Streamlit 的命令列入口：由設定檔（.toml / .json）建立工作放入本機佇列，由 worker 程序執行
+結果存在佇列目錄中，儀表板的「工作結果」分頁直接讀取，不再重新計算
+
+    python -m cli optimize -c optimize.toml          # 加入佇列
+    python -m cli optimize -c optimize.toml --run    # 加入後立即在本程序執行（只執行這個工作）
+    python -m cli worker --workers 4                 # 執行佇列中所有工作（先重新排入被中止的工作）
+    python -m cli status
+    python -m cli result <工作 id>
+
+設定檔範例（optimize.toml）：
+
+    [data]
+    symbol = "ETH/USDT:USDT"      # 或 file = "ETH每小時Ｋ棒.csv"
+    timeframe = "4h"
+    start = "2023-01-01"
+
+    [optimize]
+    initial_balance = 1000
+    add_amount = 100
+    direction = 1
+    workers = 4
+    objective = "profit_over_drawdown"
+
+    [optimize.search_space]
+    add_pct = {start = 0.5, stop = 5.0, step = 0.5}
+    take_profit_pct = [0.5, 1.0, 1.5]
+
+其他區段：[backtest]（martin_backtest_fast 參數，directions = [1, -1]，hedged = true 為多空對沖帳本）、[zigzag]（threshold / depth，
+surface = true 時計算參數敏感度曲面）、[update]（offline / max_workers / symbols）、[walk_forward]
+"""
+import argparse
+import sys
+import pandas as pd
+
+from jobs import DEFAULT_ROOT, JOB_KINDS, JobQueue, load_config, run_job, run_workers
+
+
+def _print_result(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        print(result.to_string())
+    elif isinstance(result, dict):
+        for key, value in result.items():
+            print(f"== {key} ==")
+            _print_result(value)
+    elif isinstance(result, (tuple, list)):
+        for value in result:
+            _print_result(value)
+    else:
+        print(result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cli", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queue", default=DEFAULT_ROOT, help="佇列目錄")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for kind in JOB_KINDS:
+        p = sub.add_parser(kind)
+        p.add_argument("-c", "--config", required=True)
+        p.add_argument("--run", action="store_true", help="加入佇列後立即在本程序執行這個工作，佇列中較早的工作留給 worker")
+    p = sub.add_parser("worker")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--forever", action="store_true", help="佇列清空後持續等待新工作")
+    p.add_argument("--poll", type=float, default=2.0)
+    p = sub.add_parser("status")
+    p.add_argument("--status", choices=("pending", "running", "done", "failed"))
+    p = sub.add_parser("result")
+    p.add_argument("job_id")
+    args = parser.parse_args(argv)
+
+    queue = JobQueue(args.queue)
+    if args.command in JOB_KINDS:
+        try:
+            job_id = queue.submit(args.command, load_config(args.config))
+        except ValueError as exc:
+            print(f"設定檔錯誤：{exc}", file=sys.stderr)
+            return 2
+        print(job_id)
+        if args.run:
+            # 只執行剛加入的工作，佇列中較早的工作留給 worker
+            job = queue.claim(job_id)
+            if job is None:
+                # 另一個 worker 在加入與認領之間先認領了這個工作
+                print(f"工作 {job_id} 已由其他 worker 執行，完成後以 `python -m cli result {job_id}` 查看",
+                      file=sys.stderr)
+                return 0
+            if not run_job(queue, job):
+                print(queue.get(job_id)["error"], file=sys.stderr)
+                return 1
+            _print_result(queue.result(job_id))
+    elif args.command == "worker":
+        run_workers(args.queue, args.workers, args.forever, args.poll)
+    elif args.command == "status":
+        print(queue.jobs(args.status).drop(columns="error").to_string())
+    else:
+        job = queue.get(args.job_id)
+        if job["status"] == "failed":
+            print(job["error"], file=sys.stderr)
+            return 1
+        if job["status"] != "done":
+            print(f"工作尚未完成（{job['status']}）", file=sys.stderr)
+            return 1
+        _print_result(queue.result(args.job_id))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
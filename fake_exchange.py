@@ -0,0 +1,71 @@
+import threading
+import time
+import zlib
+import numpy as np
+
+try:
+    from ccxt import RateLimitExceeded
+except ImportError:  # 離線測試環境不一定安裝 ccxt
+    class RateLimitExceeded(Exception):
+        pass
+
+_TIMEFRAME_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+class FakeExchange:
+    """
+    離線用的 ccxt 交易所替身，提供 fetch_ohlcv / parse_timeframe / milliseconds / rateLimit
+    K棒由交易對與時間戳決定（同一根K棒每次取得的數值都相同，不同交易對價格走勢不同），可模擬延遲與請求頻率限制
+    start / now: 毫秒時間戳，交易所的最早K棒與「現在」
+    """
+
+    def __init__(self, start=1577836800000, now=None, latency=0.0, rate_limit=0, enforce_rate_limit=False,
+                 missing=(), seed=0, max_limit=None):
+        self.start = start
+        self.now = now if now is not None else int(time.time() * 1000)
+        self.latency = latency
+        self.rateLimit = rate_limit   # 與 ccxt 相同，兩次請求的最小間隔（毫秒）
+        self.enforce_rate_limit = enforce_rate_limit
+        self.missing = set(missing)   # 模擬交易所缺少的K棒時間戳
+        self.seed = seed
+        self.max_limit = max_limit    # 每次最多回傳的筆數（例如 okx 為 300），None 時不限制
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._last_call = None
+
+    @staticmethod
+    def parse_timeframe(timeframe):
+        return int(timeframe[:-1]) * _TIMEFRAME_SECONDS[timeframe[-1]]
+
+    def milliseconds(self):
+        return self.now
+
+    def _bar(self, ts, tf_ms, symbol_key=0):
+        rng = np.random.default_rng([self.seed, ts // tf_ms, symbol_key])
+        base = (100 + (ts // tf_ms) % 1000 * 0.1) * (1 + symbol_key % 100 / 10)
+        o, c = base + rng.normal(0, 1, 2)
+        h = max(o, c) + abs(rng.normal(0, 0.5))
+        l = min(o, c) - abs(rng.normal(0, 0.5))
+        return [ts, round(o, 2), round(h, 2), round(l, 2), round(c, 2), round(abs(rng.normal(1000, 100)), 3)]
+
+    def fetch_ohlcv(self, symbol, timeframe="1h", since=None, limit=500):
+        with self._lock:
+            now = time.monotonic()
+            if self.enforce_rate_limit and self._last_call is not None \
+                    and (now - self._last_call) * 1000 < self.rateLimit * 0.9:
+                raise RateLimitExceeded("fake exchange: too many requests")
+            self._last_call = now
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.max_limit is not None:
+            limit = min(limit, self.max_limit)
+        tf_ms = self.parse_timeframe(timeframe) * 1000
+        since = self.start if since is None else max(since, self.start)
+        first = -(-since // tf_ms) * tf_ms
+        # 與真實交易所相同，包含目前尚未收盤的K棒
+        last = self.now // tf_ms * tf_ms
+        stamps = range(first, min(last, first + (limit - 1) * tf_ms) + 1, tf_ms)
+        symbol_key = zlib.crc32(str(symbol).encode())
+        return [self._bar(ts, tf_ms, symbol_key) for ts in stamps if ts not in self.missing]
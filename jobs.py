@@ -0,0 +1,358 @@
+"""
+本機磁碟上的工作佇列：每個工作一個 JSON 檔，依狀態放在 pending / running / done / failed 目錄
+以 os.rename 原子地認領工作，多個 worker 程序可同時從同一個佇列取工作
+執行中的程序被中止時，工作留在 running；recover() 將 PID 已不存在的工作放回 pending，重新執行時由 checkpoint 繼續
+"""
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import socket
+import time
+import traceback
+import uuid
+import numpy as np
+import pandas as pd
+
+DEFAULT_ROOT = "jobs"
+STATUSES = ("pending", "running", "done", "failed")
+JOB_KINDS = ("optimize", "backtest", "zigzag", "update")
+JOB_COLUMNS = ["id", "kind", "status", "created", "started", "finished", "attempts", "error"]
+# 各工作類型可用的設定檔區段
+JOB_SECTIONS = {
+    "optimize": ("data", "optimize", "walk_forward"),
+    "backtest": ("data", "backtest"),
+    "zigzag": ("data", "zigzag"),
+    "update": ("update",),
+}
+DATA_KEYS = ("file", "symbol", "registry", "timeframe", "start", "end")
+WALK_FORWARD_KEYS = ("train_bars", "test_bars", "step", "anchored")
+BACKTEST_EXTRA_KEYS = ("direction", "directions", "hedged")
+ZIGZAG_KEYS = ("threshold", "depth", "surface", "thresholds", "depths")
+UPDATE_KEYS = ("offline", "registry", "max_workers", "symbols", "backfill")
+# 由工作佇列提供、不能寫在設定檔中的參數
+_RESERVED = {"prices_close", "prices_high", "prices_low", "times", "progress_callback", "return_report",
+             "checkpoint", "with_equity"}
+
+
+def load_config(path):
+    """讀取 JSON 或 TOML 設定檔（依副檔名判斷）"""
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+def expand_values(values):
+    """搜尋空間的候選值：清單，或 {"start", "stop", "step"}（含 stop，與 np.arange 加半格相同）"""
+    if isinstance(values, dict):
+        return np.round(np.arange(values["start"], values["stop"] + values["step"] / 2, values["step"]), 10).tolist()
+    if isinstance(values, (list, tuple)):
+        return list(values)
+    return [values]
+
+
+def _parameters(func, exclude=()):
+    # 函式接受、可由設定檔指定的參數 -> 是否必填
+    return {name: p.default is inspect.Parameter.empty for name, p in inspect.signature(func).parameters.items()
+            if name not in _RESERVED and name not in exclude}
+
+
+def _check_keys(section, given, allowed, required=()):
+    if not isinstance(given, dict):
+        raise ValueError(f"[{section}] 必須是表格（key = value）")
+    unknown = sorted(set(given) - set(allowed))
+    if unknown:
+        raise ValueError(f"[{section}] 不支援的參數：{unknown}，可用：{sorted(allowed)}")
+    missing = sorted(set(required) - set(given))
+    if missing:
+        raise ValueError(f"[{section}] 缺少必要參數：{missing}")
+
+
+def validate_config(kind, config):
+    """
+    加入佇列前檢查設定檔：各區段只能有該工作類型（與模式，例如 walk-forward）接受的參數，
+    設定錯誤在 submit 時就回報，不會等到 worker 執行時才失敗
+    """
+    from martin_strategy import martin_backtest_fast
+    from optimize import SEARCH_AXES, optimize_martingale, walk_forward_optimize
+
+    _check_keys("設定檔", config, JOB_SECTIONS[kind])
+    if kind != "update":
+        data = config.get("data", {})
+        _check_keys("data", data, DATA_KEYS)
+        if "file" not in data and "symbol" not in data:
+            raise ValueError("[data] 需指定 file 或 symbol")
+    if kind == "optimize":
+        if "walk_forward" in config:
+            _check_keys("walk_forward", config["walk_forward"], WALK_FORWARD_KEYS, ("train_bars", "test_bars"))
+            params = _parameters(walk_forward_optimize, WALK_FORWARD_KEYS)
+        else:
+            params = _parameters(optimize_martingale)
+        section = config.get("optimize", {})
+        _check_keys("optimize", section, params, [name for name, required in params.items() if required])
+        _check_keys("optimize.search_space", section.get("search_space", {}), [name for name, _ in SEARCH_AXES])
+    elif kind == "backtest":
+        params = _parameters(martin_backtest_fast, ("direction",))
+        _check_keys("backtest", config.get("backtest", {}), list(params) + list(BACKTEST_EXTRA_KEYS),
+                    [name for name, required in params.items() if required])
+    elif kind == "zigzag":
+        _check_keys("zigzag", config.get("zigzag", {}), ZIGZAG_KEYS)
+    else:
+        _check_keys("update", config.get("update", {}), UPDATE_KEYS)
+
+
+class JobQueue:
+    """工作佇列；root 下各狀態一個目錄，另有 results/（pickle 結果）與 checkpoints/"""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        for name in STATUSES + ("results", "checkpoints"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def _path(self, status, job_id):
+        return os.path.join(self.root, status, job_id + ".json")
+
+    def _write(self, status, job):
+        tmp = self._path(status, job["id"]) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp, self._path(status, job["id"]))
+
+    def _read(self, status, job_id):
+        with open(self._path(status, job_id)) as f:
+            return json.load(f)
+
+    def submit(self, kind, config):
+        """檢查設定後加入工作，回傳工作 id（依建立時間排序，先進先出）；設定不符時引發 ValueError"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"未知的工作類型：{kind}，可用：{JOB_KINDS}")
+        validate_config(kind, config)
+        job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{kind}-{uuid.uuid4().hex[:6]}"
+        self._write("pending", {"id": job_id, "kind": kind, "config": config, "created": time.time(),
+                                "attempts": 0})
+        return job_id
+
+    def claim(self, job_id=None):
+        """
+        認領最早的 pending 工作並移到 running；沒有工作時回傳 None
+        指定 job_id 時只認領該工作，已被其他 worker 認領時回傳 None
+        """
+        if job_id is not None:
+            names = [job_id + ".json"]
+        else:
+            names = sorted(os.listdir(os.path.join(self.root, "pending")))
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            job_id = name[:-5]
+            try:
+                # 只有一個程序能 rename 成功
+                os.rename(self._path("pending", job_id), self._path("running", job_id))
+            except FileNotFoundError:
+                continue
+            job = self._read("running", job_id)
+            job.update(started=time.time(), pid=os.getpid(), host=socket.gethostname(),
+                       attempts=job.get("attempts", 0) + 1)
+            self._write("running", job)
+            return job
+        return None
+
+    def _finish(self, job, status, **fields):
+        job.update(finished=time.time(), **fields)
+        self._write(status, job)
+        os.remove(self._path("running", job["id"]))
+
+    def complete(self, job, result):
+        tmp = self.result_path(job["id"]) + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.result_path(job["id"]))
+        checkpoint = self.checkpoint_path(job["id"])
+        if os.path.isdir(checkpoint):
+            shutil.rmtree(checkpoint)
+        self._finish(job, "done")
+
+    def fail(self, job, error):
+        self._finish(job, "failed", error=error)
+
+    def recover(self):
+        """將本機上 PID 已結束的 running 工作放回 pending，回傳放回的工作 id"""
+        recovered = []
+        host = socket.gethostname()
+        for name in os.listdir(os.path.join(self.root, "running")):
+            if not name.endswith(".json"):
+                continue
+            try:
+                job = self._read("running", name[:-5])
+            except FileNotFoundError:
+                # 讀取前已完成或被其他 worker 放回 pending
+                continue
+            if job.get("host") != host or _pid_alive(job.get("pid")):
+                continue
+            try:
+                # 多個 worker 同時 recover 時只有一個能 rename 成功
+                os.rename(self._path("running", job["id"]), self._path("pending", job["id"]))
+            except FileNotFoundError:
+                continue
+            recovered.append(job["id"])
+        return recovered
+
+    def result_path(self, job_id):
+        return os.path.join(self.root, "results", job_id + ".pkl")
+
+    def checkpoint_path(self, job_id):
+        return os.path.join(self.root, "checkpoints", job_id)
+
+    def result(self, job_id):
+        with open(self.result_path(job_id), "rb") as f:
+            return pickle.load(f)
+
+    def get(self, job_id):
+        for status in STATUSES:
+            if os.path.exists(self._path(status, job_id)):
+                return dict(self._read(status, job_id), status=status)
+        raise KeyError(job_id)
+
+    def jobs(self, status=None):
+        """所有（或指定狀態的）工作，依建立時間排序"""
+        rows = []
+        for s in (STATUSES if status is None else (status,)):
+            for name in os.listdir(os.path.join(self.root, s)):
+                if name.endswith(".json"):
+                    rows.append(dict(self._read(s, name[:-5]), status=s))
+        df = pd.DataFrame(rows, columns=JOB_COLUMNS)
+        for col in ("created", "started", "finished"):
+            df[col] = pd.to_datetime(df[col], unit="s")
+        return df.sort_values("id").set_index("id")
+
+
+def _pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def open_bars(data):
+    """依設定的 data 區段開啟K棒：file 或 symbol（由 symbols.json 查檔名）、timeframe、start / end"""
+    from resample import open_timeframe
+    from symbols import SymbolRegistry
+
+    filename = data.get("file") or SymbolRegistry(data.get("registry", "symbols.json")).filename(data["symbol"])
+    store = open_timeframe(filename, data.get("timeframe"))
+    if data.get("start") is not None or data.get("end") is not None:
+        store = store.range(data.get("start"), data.get("end"))
+    return filename, store
+
+
+def _run_optimize(config, checkpoint):
+    from optimize import optimize_martingale, walk_forward_optimize
+
+    _, bars = open_bars(config["data"])
+    params = dict(config["optimize"])
+    params["search_space"] = {name: expand_values(values)
+                              for name, values in params.get("search_space", {}).items()}
+    if "walk_forward" in config:
+        return walk_forward_optimize(bars.close, bars.high, bars.low, bars.times, **params, **config["walk_forward"],
+                                     checkpoint=checkpoint)
+    return optimize_martingale(bars.close, bars.high, bars.low, bars.times, **params,
+                               checkpoint=checkpoint, return_report=True)
+
+
+def _run_backtest(config, checkpoint):
+    from martin_strategy import martin_backtest_both, martin_backtest_fast
+
+    _, bars = open_bars(config["data"])
+    params = dict(config["backtest"])
+    if params.pop("hedged", False):
+        return martin_backtest_both(bars.close, bars.high, bars.low, bars.times, with_equity=True, hedged=True,
+                                    **params)
+    directions = params.pop("directions", [params.pop("direction", 1)])
+    if sorted(directions) == [-1, 1]:
+        # 兩個方向一次走訪K棒完成
+        return martin_backtest_both(bars.close, bars.high, bars.low, bars.times, with_equity=True, **params)
+    return {direction: martin_backtest_fast(bars.close, bars.high, bars.low, bars.times, direction,
+                                            with_equity=True, **params)
+            for direction in directions}
+
+
+def _run_zigzag(config, checkpoint):
+    from zigzag import calculate_zigzag, zigzag_surface
+
+    _, bars = open_bars(config["data"])
+    params = dict(config.get("zigzag", {}))
+    if params.pop("surface", False):
+        return zigzag_surface(bars, **{k: v for k, v in params.items() if k in ("thresholds", "depths")})
+    return calculate_zigzag(bars, params.get("threshold", 5.0), params.get("depth", 10))
+
+
+def _run_update(config, checkpoint):
+    from symbols import SymbolRegistry, update_all
+
+    params = dict(config.get("update", {}))
+    exchange = None
+    if params.pop("offline", False):
+        from fake_exchange import FakeExchange
+        exchange = FakeExchange()
+    registry = SymbolRegistry(params.pop("registry", "symbols.json"))
+    return update_all(registry, exchange, **params)
+
+
+RUNNERS = {"optimize": _run_optimize, "backtest": _run_backtest, "zigzag": _run_zigzag, "update": _run_update}
+
+
+def run_job(queue, job):
+    """執行一個已認領的工作；例外會記錄在 failed 工作中，不中斷 worker"""
+    try:
+        result = RUNNERS[job["kind"]](job["config"], queue.checkpoint_path(job["id"]))
+    except Exception:
+        queue.fail(job, traceback.format_exc())
+        return False
+    queue.complete(job, result)
+    return True
+
+
+def _recover(queue):
+    for job_id in queue.recover():
+        print(f"↩️ 重新排入被中止的工作 {job_id}", flush=True)
+
+
+def _worker_loop(root, forever, poll):
+    queue = JobQueue(root)
+    while True:
+        # 執行期間其他 worker 被中止時，其工作在這裡放回 pending，不需等到 worker 重新啟動
+        _recover(queue)
+        job = queue.claim()
+        if job is None:
+            if not forever:
+                return
+            time.sleep(poll)
+            continue
+        ok = run_job(queue, job)
+        print(f"{'✅' if ok else '❌'} {job['id']}", flush=True)
+
+
+def run_workers(root=DEFAULT_ROOT, workers=1, forever=False, poll=2.0):
+    """
+    以 workers 個程序執行佇列中的工作，佇列清空後結束（forever=True 時持續等待新工作）
+    開始前與每次認領工作前，先把 PID 已結束的 running 工作放回 pending
+    """
+    _recover(JobQueue(root))
+    if workers <= 1:
+        _worker_loop(root, forever, poll)
+        return
+    processes = [multiprocessing.Process(target=_worker_loop, args=(root, forever, poll)) for _ in range(workers)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
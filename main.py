@@ -1,29 +1,81 @@
+import os
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 
-from zigzag import calculate_zigzag
-from martin_strategy import martin_backtest
+from zigzag import calculate_zigzag, zigzag_surface, stream_zigzag, SURFACE_COLUMNS
+from martin_strategy import martin_backtest_both, MAINTENANCE_MARGIN_RATE
 from update_daily import update_data
-from optimize import optimize_martingale
+from optimize import optimize_martingale, walk_forward_optimize, OBJECTIVES
+from cache import get_cache, fingerprint_arrays
+from resample import available_timeframes, base_timeframe, open_timeframe
+from charts import KLINE_MODES, kline_figure, equity_figure, surface_heatmap
+from symbols import SymbolRegistry, screen_symbols, update_all
+from robustness import monte_carlo, bars_per_year
+from jobs import JobQueue
+import bar_store
+import perf
+
+# --- 交易對：每個交易對各自一份儲存，切換時只載入選取的交易對 ---
+registry = SymbolRegistry()
+symbol = st.sidebar.selectbox("交易對", registry.symbols(), key="symbol")
+filename = registry.filename(symbol)
+fetch_timeframe = registry.get(symbol)["timeframe"]   # update_data 抓取並儲存的基礎週期，較長週期由此合併
+with st.sidebar.expander("➕ 管理交易對"):
+    new_symbols = st.text_input("新增交易對（以逗號分隔，例如 BTC/USDT:USDT）")
+    if st.button("加入") and new_symbols.strip():
+        for new_symbol in new_symbols.split(","):
+            if new_symbol.strip():
+                registry.add(new_symbol.strip(), fetch_timeframe)
+        st.rerun()
+
+# --- 效能量測：各階段耗時顯示在側邊欄的 Performance 面板 ---
+if "perf_recorder" not in st.session_state:
+    st.session_state["perf_recorder"] = perf.Recorder()
+perf_recorder = st.session_state["perf_recorder"]
+perf_panel = st.sidebar.expander("⏱️ Performance")
+perf_recorder.enabled = perf_panel.checkbox("記錄各階段耗時", value=True)
+perf_profile = perf_panel.checkbox("cProfile 剖析這次重跑（較慢）", value=False)
+perf_recorder.begin(profile=perf_profile)
 
-filename = "ETH每小時Ｋ棒.csv"
 # 側邊欄按鈕
+backfill = st.sidebar.checkbox("補齊所有缺漏K棒（分頁抓取）", value=False)
 if st.sidebar.button("🔄 更新資料"):
-    df = update_data(filename=filename)
-    st.cache_data.clear()   # <<< 清除快取，確保下一次 load_data 會重新讀檔
-    st.sidebar.success(f"✅ 資料已更新到 {df['時間'].iloc[-1]}")
-else:
-    try:
-        df = pd.read_csv(filename, parse_dates=["時間"])
-    except FileNotFoundError:
-        st.error("⚠️ 尚未有資料，請先點擊『更新資料』")
-        df = pd.DataFrame()
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    df_new = update_data(symbol=symbol, timeframe=fetch_timeframe, filename=filename, backfill=backfill)
+    st.cache_resource.clear()   # <<< 清除快取，確保下一次 load_data 會重新讀檔
+    if df_new.empty:
+        st.sidebar.info("ℹ️ 目前沒有新的已收盤K棒")
+    else:
+        st.sidebar.success(f"✅ 新增 {len(df_new)} 根K棒，資料已更新到 {df_new['時間'].iloc[-1]}")
+if len(registry) > 1 and st.sidebar.button(f"🔄 更新全部 {len(registry)} 個交易對"):
+    progress_bar = st.sidebar.progress(0.0, text="更新中…")
+    df_updates = update_all(registry, max_workers=4, backfill=backfill,
+                            progress_callback=lambda done, total, name: progress_bar.progress(done / total, text=f"已完成 {name}"))
+    progress_bar.empty()
+    st.cache_resource.clear()
+    st.sidebar.dataframe(df_updates)
+
+# --- 載入資料（二進位欄位儲存，第一次讀取時自動由 CSV 轉換）---
+# cache_resource 不複製回傳值，各次重跑共用同一份 memory map 陣列；每個週期各保留一份，切換週期不需重算
+@perf.timed("載入資料", rows=len)
+@st.cache_resource
+def load_data(filename, timeframe):
+    return open_timeframe(filename, timeframe)
+
+try:
+    timeframes = available_timeframes(filename)
+    timeframe = st.sidebar.selectbox("K棒週期", timeframes, index=timeframes.index(base_timeframe(filename) or timeframes[0]))
+    store = load_data(filename, timeframe)
+except FileNotFoundError:
+    store = None
+if store is None or len(store) == 0:
+    st.error("⚠️ 尚未有資料，請先點擊『更新資料』")
+    st.stop()
 
 # 顯示最後一筆時間
-if not df.empty:
-    last_time = df["時間"].iloc[-1]
-    st.metric("最後一筆K棒時間", last_time.strftime("%Y-%m-%d %H:%M:%S")+" UTC")
+last_time = pd.Timestamp(store.times[-1])
+st.metric("最後一筆K棒時間", last_time.strftime("%Y-%m-%d %H:%M:%S")+" UTC")
 
 # --- 分頁標題 ---
 st.set_page_config(page_title="波段分析", layout="wide")
@@ -31,16 +83,9 @@ st.set_page_config(page_title="波段分析", layout="wide")
 # --- 主網頁標題 ---
 st.title("📈 波段分析")
 
-# --- 載入資料 ---
-@st.cache_data
-def load_data():
-    return pd.read_csv("ETH每小時Ｋ棒.csv", parse_dates=["時間"])
-
-df = load_data()
-
 # --- 設定時間範圍 ---
-time_min = df["時間"].min().to_pydatetime()
-time_max = df["時間"].max().to_pydatetime()
+time_min = pd.Timestamp(store.times[0]).to_pydatetime()
+time_max = pd.Timestamp(store.times[-1]).to_pydatetime()
 
 # --- 快速時間範圍選擇 ---
 quick_select = st.sidebar.radio(
@@ -79,116 +124,191 @@ threshold = st.sidebar.slider("Deviation (%)", 0.5, 10.0, 5.0, 0.5)
 depth = st.sidebar.slider("Depth (Pivot 前後比較長度)", 1, 20, 10)
 chart_height = st.sidebar.slider("調整圖表高度（單位：px）", 400, 1200, 550, step=50)
 
-df_filtered = df[(df["時間"] >= pd.Timestamp(start_time)) & (df["時間"] <= pd.Timestamp(end_time))]
+# 依時間排序的 int64 索引做 searchsorted，回傳不複製的區間切片
+bars = store.range(start_time, end_time)
 
-if len(df_filtered) < 2 * depth + 1:
+if len(bars) < 2 * depth + 1:
     st.warning("⚠️ 資料太少，請選擇更長的時間範圍")
     st.stop()
 
-# --- 建立分頁 ---
-tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
-    "📊 波段統計",
-    "📈 上漲波段清單",
-    "📉 下跌波段清單",
-    "📈 K 線圖",
-    "📈 上漲波段分佈圖",
-    "📉 下跌波段分佈圖",
-    "📒 馬丁策略回測 - 做多", 
-    "📒 馬丁策略回測 - 做空",
-    
-])
+# --- 馬丁策略參數 ---
+st.sidebar.header("💹 馬丁策略參數")
+initial_balance = st.sidebar.number_input("初始金額 (USDT)", 1, 100000, 1000, step=1)
+leverage = st.sidebar.number_input("槓桿倍數", 1, 125, 10, step=1)
+add_pct = st.sidebar.number_input("跌多少/漲多少加碼 (%)", 0.5, 50.0, 2.0, step=0.1)
+add_multiple = st.sidebar.number_input("加倉價差倍數", 0.1, 5.0, 1.0, step=0.1)
+max_add_times = st.sidebar.number_input("最大加碼次數", 1, 20, 7)
+add_amount = st.sidebar.number_input("首次加碼金額 (USDT)", 1, 100000, 100, step=1)
+add_amount_multiple = st.sidebar.number_input("加碼金額倍數", 1.0, 5.0, 2.0, step=0.1)
+take_profit_pct = st.sidebar.number_input("止盈 (%)", 0.5, 50.0, 1.0, step=0.1)
+stop_loss_pct = st.sidebar.number_input("停損 (%)", 0.5, 100.0, 10.0, step=0.1)
+direction = None
+
+# 結果快取：以資料指紋 + 時間範圍 + 參數為鍵，只調整圖表高度或滑動視窗時不必重算
+result_cache = get_cache()
+data_fingerprint = fingerprint_arrays(*bars.arrays.values())
+time_range = (start_time, end_time)
+
+# --- 馬丁策略參數最佳化 ---
+st.sidebar.header("🧪 參數最佳化")
+optimize_direction = st.sidebar.radio("最佳化方向", ("做多", "做空"), horizontal=True)
+optimize_workers = st.sidebar.number_input("平行程序數", 1, os.cpu_count() or 1, os.cpu_count() or 1, step=1)
+optimize_strategy = st.sidebar.selectbox(
+    "搜尋策略", ("grid", "coarse_to_fine", "halving"),
+    format_func={"grid": "完整網格", "coarse_to_fine": "粗到細", "halving": "逐輪淘汰"}.get,
+)
+optimize_objective = st.sidebar.selectbox("最佳化目標", list(OBJECTIVES), format_func=OBJECTIVES.get)
+optimize_max_drawdown = st.sidebar.number_input("最大回撤上限 (USDT，0 為不限制)", 0, 10_000_000, 0, step=100)
+optimize_no_liquidation = st.sidebar.checkbox("排除曾觸及爆倉價的參數組", value=False)
+if st.sidebar.button("🔍 搜尋最佳參數"):
+    progress_bar = st.sidebar.progress(0.0, text="最佳化中…")
+    optimize_kwargs = dict(
+        initial_balance=initial_balance, add_amount=add_amount, add_multiple=add_multiple,
+        direction=1 if optimize_direction == "做多" else -1, leverage=leverage,
+        max_add_times=max_add_times, add_amount_multiple=add_amount_multiple,
+        strategy=optimize_strategy, return_report=True, objective=optimize_objective,
+        max_drawdown=optimize_max_drawdown or None, allow_liquidation=not optimize_no_liquidation,
+    )
+    # 進度回呼與程序數不影響結果，不列入快取鍵
+    with perf.stage("optimize_martingale", rows=len(bars)):
+        best_params, search_report = result_cache.cached_call(
+            "optimize_martingale", optimize_martingale,
+            bars.close, bars.high, bars.low, bars.times,
+            dataset=filename, data_fingerprint=data_fingerprint, time_range=time_range, params=optimize_kwargs,
+            workers=optimize_workers,
+            progress_callback=lambda done, total: progress_bar.progress(done / total, text=f"最佳化中… {done}/{total}"),
+            **optimize_kwargs,
+        )
+    progress_bar.empty()
+    if best_params.get("符合限制") is False:
+        st.sidebar.warning("沒有符合限制的參數組，以下為分數最高者")
+    st.sidebar.dataframe(pd.Series(best_params, name="最佳參數").astype(str))
+    st.sidebar.dataframe(pd.Series(search_report, name="搜尋報告").astype(str))
+if st.sidebar.button("📥 加入工作佇列"):
+    # 交給 python -m cli worker 在背景執行，完成後在「工作結果」分頁查看
+    job_id = JobQueue().submit("optimize", {
+        "data": {"symbol": symbol, "timeframe": timeframe, "start": str(start_time), "end": str(end_time)},
+        "optimize": dict(
+            initial_balance=initial_balance, add_amount=add_amount, add_multiple=add_multiple,
+            direction=1 if optimize_direction == "做多" else -1, leverage=leverage,
+            max_add_times=max_add_times, add_amount_multiple=add_amount_multiple,
+            strategy=optimize_strategy, objective=optimize_objective, workers=int(optimize_workers),
+            max_drawdown=optimize_max_drawdown or None, allow_liquidation=not optimize_no_liquidation,
+        ),
+    })
+    st.sidebar.success(f"已加入工作 {job_id}，以 `python -m cli worker` 執行")
+
 
 # --- zigzag指標 ---回傳轉折點位置標籤、漲跌區段價差、最小最大漲跌幅
-swing_points, segment_info, inc_max, inc_min, dec_min, dec_max = calculate_zigzag(df_filtered, threshold, depth)
+# 只有波段相關分頁才需要，且只在被選取時計算
+def zigzag_result():
+    with perf.stage("calculate_zigzag", rows=len(bars)):
+        return _zigzag_result()
+
+
+def _zigzag_result():
+    if quick_select == "全區間":
+        # 全區間只會在尾端新增K棒：沿用上次的串流狀態，只推進新增的K棒
+        state_key = f"zigzag_state_{filename}_{timeframe}_{threshold}_{depth}"
+        zz_state = stream_zigzag(st.session_state.get(state_key), bars, threshold, depth)
+        st.session_state[state_key] = zz_state
+        return zz_state.result()
+    return result_cache.cached_call(
+        "calculate_zigzag", calculate_zigzag, bars,
+        dataset=filename, data_fingerprint=data_fingerprint, time_range=time_range,
+        threshold=threshold, depth=depth)
+
+
+def segments_by_direction(segment_info, label):
+    return segment_info[segment_info["方向"] == label]
+
 
 # 📊 波段統計分頁
-with tab1:
+def render_stats():
+    _, _, inc_max, inc_min, dec_min, dec_max = zigzag_result()
     df_stats = pd.DataFrame({
             "項目": ["最大", "最小"],
             "📈 上漲": [inc_max, inc_min],
             "📉 下跌": [dec_min, dec_max]
         }).set_index("項目")
-    
+
     st.markdown("### 📊 ZigZag 波段統計（含波段編號）")
     st.dataframe(df_stats, width="stretch")
 
+
 # 上漲波段清單分頁
-with tab2:
-    increases = [x for x in segment_info if x[0] == "📈 上漲"]
-    if increases:
-        df_inc = pd.DataFrame(increases, columns=["方向", "價差", "漲跌幅 (%)", "波段編號", "起始時間", "結束時間"])
+def render_inc_list():
+    df_inc = segments_by_direction(zigzag_result()[1], "📈 上漲")
+    if not df_inc.empty:
         df_inc_sorted = df_inc.sort_values(by="漲跌幅 (%)", ascending=False)
-        df_inc_sorted.set_index("方向", inplace=True)  # 方向設為索引
+        df_inc_sorted = df_inc_sorted.set_index("方向")  # 方向設為索引
         st.markdown("### 📈 上漲波段清單（由漲跌幅由大到小排列）")
         st.dataframe(df_inc_sorted)
     else:
         st.info("沒有上漲波段資料")
 
+
 # 下跌波段清單分頁
-with tab3:
-    decreases = [x for x in segment_info if x[0] == "📉 下跌"]
-    if decreases:
-        df_dec = pd.DataFrame(decreases, columns=["方向", "價差", "漲跌幅 (%)", "波段編號", "起始時間", "結束時間"])
+def render_dec_list():
+    df_dec = segments_by_direction(zigzag_result()[1], "📉 下跌")
+    if not df_dec.empty:
         df_dec_sorted = df_dec.sort_values(by="漲跌幅 (%)")
-        df_dec_sorted.set_index("方向", inplace=True)  # 方向設為索引
+        df_dec_sorted = df_dec_sorted.set_index("方向")  # 方向設為索引
         st.markdown("### 📉 下跌波段清單（由跌幅由大到小排列）")
         st.dataframe(df_dec_sorted)
     else:
         st.info("沒有下跌波段資料")
 
-# 📈 K 線圖分頁
-with tab4:
-    window_size = st.sidebar.slider("滑動視窗大小(根K棒)", 50, min(500, len(df_filtered)), 240, step=10)
-    total_bars = len(df_filtered)
-    if total_bars < window_size:
-        st.warning(f"資料不足 {window_size} 根K棒，請選擇更長的時間區間")
-        st.stop()
-
-    start_idx = st.slider("滑動視窗起始K棒編號", 0, total_bars - window_size, 0, 1)
-    end_idx = start_idx + window_size
-    df_window = df_filtered.iloc[start_idx:end_idx].reset_index(drop=True)
-    mask_in_window = (swing_points["時間"] >= df_window["時間"].iloc[0]) & (swing_points["時間"] <= df_window["時間"].iloc[-1])
-    swing_points_window = swing_points[mask_in_window].reset_index(drop=True)
-
-    fig = go.Figure()
-    fig.add_trace(go.Candlestick(
-        x=df_window["時間"], open=df_window["開盤"], high=df_window["最高"], low=df_window["最低"], close=df_window["收盤"], name="K線"
-    ))
-    fig.add_trace(go.Scatter(
-        x=swing_points_window["時間"], y=swing_points_window["pivot_price"],
-        mode="markers+text", text=swing_points_window["label"], textposition=swing_points_window["text_position"],
-        marker=dict(size=8, color="white", symbol="circle"),
-        textfont=dict(color=swing_points_window["text_color"]),
-        name="ZigZag轉折點"
-    ))
-    for i in range(1, len(swing_points_window)):
-        fig.add_trace(go.Scatter(
-            x=[swing_points_window.iloc[i - 1]["時間"], swing_points_window.iloc[i]["時間"]],
-            y=[swing_points_window.iloc[i - 1]["pivot_price"], swing_points_window.iloc[i]["pivot_price"]],
-            mode="lines", line=dict(color="orange", width=2), showlegend=False
-        ))
-    fig.update_layout(
-        template="plotly_dark", height=chart_height,
-        xaxis_rangeslider_visible=False,
-        yaxis=dict(range=[df_window["最低"].min() * 0.985, df_window["最高"].max() * 1.015]),
-        xaxis=dict(range=[df_window["時間"].iloc[0], df_window["時間"].iloc[-1]]),
-        dragmode="zoom"
+
+# 📈 K 線圖分頁：滑動視窗只重跑這個 fragment，不重跑整個頁面
+@st.fragment
+def render_kline(bars, swing_points, chart_height):
+    # 只重跑 fragment 時也記錄耗時，下次整頁重跑時顯示在 Performance 面板的紀錄中
+    with perf_recorder.fragment():
+        kline_body(bars, swing_points, chart_height)
+
+
+def kline_body(bars, swing_points, chart_height):
+    total_bars = len(bars)
+    if total_bars < 50:
+        st.warning("資料不足 50 根K棒，請選擇更長的時間區間")
+        return
+    kline_mode = st.radio(
+        "顯示方式", KLINE_MODES, horizontal=True,
+        format_func={"window": "滑動視窗", "ohlc": "全區間（K棒合併）", "lttb": "全區間（LTTB 收盤線）"}.get,
     )
-    st.plotly_chart(fig, width="stretch")
-
-# --- 新增 tab5: 上漲波段散佈圖 ---
-with tab5:
-    increases = [x for x in segment_info if x[0] == "📈 上漲"]
-    if increases:
-        df_inc = pd.DataFrame(increases, columns=["方向", "價差", "漲跌幅 (%)", "波段編號", "起始時間", "結束時間"])
-        
+    if kline_mode == "window":
+        window_size = st.slider("滑動視窗大小(根K棒)", 50, min(500, total_bars), min(240, total_bars), step=10)
+        start_idx = st.slider("滑動視窗起始K棒編號", 0, total_bars - window_size, 0, 1)
+        df_bars = bars[start_idx:start_idx + window_size].to_frame().reset_index(drop=True)
+        max_points = window_size
+    else:
+        # 全區間：降採樣到固定點數，傳到瀏覽器的資料量與選取的區間長度無關
+        df_bars = bars.to_frame()
+        max_points = st.slider("最多顯示點數", 500, 5000, 2000, step=500)
+    # 轉折點依時間排序，以 searchsorted 取視窗內的範圍
+    pivot_times = swing_points["時間"].to_numpy()
+    lo = pivot_times.searchsorted(df_bars["時間"].iloc[0].to_datetime64(), side="left")
+    hi = pivot_times.searchsorted(df_bars["時間"].iloc[-1].to_datetime64(), side="right")
+    swing_points_window = swing_points.iloc[lo:hi].reset_index(drop=True)
+
+    with perf.stage("K 線圖建圖", rows=len(df_bars)):
+        fig = kline_figure(df_bars, swing_points_window, chart_height, mode=kline_mode, max_points=max_points)
+    with perf.stage("Plotly 序列化", rows=len(df_bars)):
+        st.plotly_chart(fig, width="stretch")
+
+
+# --- tab5: 上漲波段散佈圖 ---
+def render_inc_distribution():
+    df_inc = segments_by_direction(zigzag_result()[1], "📈 上漲")
+    if not df_inc.empty:
         # 計算 80% 集中區間
         p10 = df_inc["漲跌幅 (%)"].quantile(0.05)
         p90 = df_inc["漲跌幅 (%)"].quantile(0.85)
         st.markdown(f"**📊 80% 的上漲波段漲幅落在 `{p10:.2f}%` ~ `{p90:.2f}%` 之間**")
 
         fig_inc = go.Figure()
-        fig_inc.add_trace(go.Scatter(
+        fig_inc.add_trace(go.Scattergl(
             x=df_inc["波段編號"],
             y=df_inc["漲跌幅 (%)"],
             mode="markers",
@@ -219,23 +339,23 @@ with tab5:
             height=chart_height,
             yaxis=dict(dtick=5)  # 每 5% 一條格線
         )
-        st.plotly_chart(fig_inc, width="stretch")
+        with perf.stage("Plotly 序列化", rows=len(df_inc)):
+            st.plotly_chart(fig_inc, width="stretch")
     else:
         st.info("沒有上漲波段資料")
 
-# --- 新增 tab6: 下跌波段散佈圖 ---
-with tab6:
-    decreases = [x for x in segment_info if x[0] == "📉 下跌"]
-    if decreases:
-        df_dec = pd.DataFrame(decreases, columns=["方向", "價差", "漲跌幅 (%)", "波段編號", "起始時間", "結束時間"])
-        
+
+# --- tab6: 下跌波段散佈圖 ---
+def render_dec_distribution():
+    df_dec = segments_by_direction(zigzag_result()[1], "📉 下跌")
+    if not df_dec.empty:
         # 計算 80% 集中區間
         p10 = df_dec["漲跌幅 (%)"].quantile(0.05)
         p90 = df_dec["漲跌幅 (%)"].quantile(0.85)
         st.markdown(f"**📊 80% 的下跌波段跌幅落在 `{p90:.2f}%` ~ `{p10:.2f}%` 之間**")
 
         fig_dec = go.Figure()
-        fig_dec.add_trace(go.Scatter(
+        fig_dec.add_trace(go.Scattergl(
             x=df_dec["波段編號"],
             y=df_dec["漲跌幅 (%)"],
             mode="markers",
@@ -266,55 +386,260 @@ with tab6:
             height=chart_height,
             yaxis=dict(dtick=5)  # 每 5% 一條格線
         )
-        st.plotly_chart(fig_dec, width="stretch")
+        with perf.stage("Plotly 序列化", rows=len(df_dec)):
+            st.plotly_chart(fig_dec, width="stretch")
     else:
         st.info("沒有下跌波段資料")
 
-# --- 馬丁策略參數 ---
-st.sidebar.header("💹 馬丁策略參數")
-initial_balance = st.sidebar.number_input("初始金額 (USDT)", 1, 100000, 1000, step=1)
-leverage = st.sidebar.number_input("槓桿倍數", 1, 125, 10, step=1)
-add_pct = st.sidebar.number_input("跌多少/漲多少加碼 (%)", 0.5, 50.0, 2.0, step=0.1)
-add_multiple = st.sidebar.number_input("加倉價差倍數", 0.1, 5.0, 1.0, step=0.1)
-max_add_times = st.sidebar.number_input("最大加碼次數", 1, 20, 7)
-add_amount = st.sidebar.number_input("首次加碼金額 (USDT)", 1, 100000, 100, step=1)
-add_amount_multiple = st.sidebar.number_input("加碼金額倍數", 1.0, 5.0, 2.0, step=0.1)
-take_profit_pct = st.sidebar.number_input("止盈 (%)", 0.5, 50.0, 1.0, step=0.1)
-stop_loss_pct = st.sidebar.number_input("停損 (%)", 0.5, 100.0, 10.0, step=0.1)
-direction = None
-
-# ---馬丁多頭統計 ---
-with tab7:
-    prices_close = df_filtered["收盤"].values
-    prices_high = df_filtered["最高"].values
-    prices_low = df_filtered["最低"].values
-    times = df_filtered["時間"].values
-    df_trades_long, df_stats_long = martin_backtest(
-        prices_close, prices_high, prices_low, times, direction=1, 
-        initial_balance=initial_balance, add_amount=add_amount, 
-        leverage=leverage, add_pct=add_pct,add_multiple=add_multiple, max_add_times=max_add_times, 
-        add_amount_multiple=add_amount_multiple, take_profit_pct= take_profit_pct, stop_loss_pct=stop_loss_pct)
-    
-    st.subheader("📊 做多策略統計")
-    st.dataframe(df_stats_long)
-    st.dataframe(df_trades_long)
-
-# ---馬丁空頭統計 ---
-with tab8:
-    prices_close = df_filtered["收盤"].values
-    prices_high = df_filtered["最高"].values
-    prices_low = df_filtered["最低"].values
-    times = df_filtered["時間"].values
-
-    df_trades_short, df_stats_short = martin_backtest(
-         prices_close, prices_high, prices_low, times, direction=-1, 
-        initial_balance=initial_balance, add_amount=add_amount, 
-        leverage=leverage, add_pct=add_pct,add_multiple=add_multiple, max_add_times=max_add_times, 
-        add_amount_multiple=add_amount_multiple, take_profit_pct= take_profit_pct, stop_loss_pct=stop_loss_pct)
-    
-    st.subheader("📊 做空策略統計")
-    st.dataframe(df_stats_short)
-    st.dataframe(df_trades_short)
 
+# --- 參數敏感度：threshold × depth 全網格的波段數與漲跌幅中位數 ---
+def render_surface():
+    with perf.stage("zigzag_surface", rows=len(bars)):
+        df_surface = result_cache.cached_call(
+            "zigzag_surface", zigzag_surface, bars,
+            dataset=filename, data_fingerprint=data_fingerprint, time_range=time_range, params={})
+    metric = st.radio("指標", SURFACE_COLUMNS[2:], horizontal=True, key="surface_metric")
+    with perf.stage("Plotly 序列化", rows=len(df_surface)):
+        st.plotly_chart(surface_heatmap(df_surface, metric, chart_height, threshold, depth), width="stretch")
+    with st.expander("數值表"):
+        st.dataframe(df_surface.pivot(index="depth", columns="threshold", values=metric))
+
+
+# ---馬丁多頭 / 空頭統計 ---
+def backtest_result(hedged=False):
+    # 做多與做空一次走訪K棒算出（兩個回測分頁共用同一份結果），直接傳入 BarStore 的欄位陣列，不另外複製
+    with perf.stage("martin_backtest " + ("多空對沖" if hedged else "做多 + 做空"), rows=len(bars)):
+        return result_cache.cached_call(
+            "martin_backtest_both", martin_backtest_both, bars.close, bars.high, bars.low, bars.times,
+            dataset=filename, data_fingerprint=data_fingerprint, time_range=time_range,
+            initial_balance=initial_balance, add_amount=add_amount,
+            leverage=leverage, add_pct=add_pct,add_multiple=add_multiple, max_add_times=max_add_times,
+            add_amount_multiple=add_amount_multiple, take_profit_pct= take_profit_pct, stop_loss_pct=stop_loss_pct,
+            with_equity=True, hedged=hedged)
+
+
+def stats_text(df):
+    # 次數與金額在同一欄時（單一方向的統計為 float 欄），逐列轉成文字，次數類指標顯示為整數
+    def fmt(name, value):
+        return str(int(value)) if ("次數" in name or "K棒數" in name) and pd.notna(value) else str(value)
+    return pd.DataFrame({col: [fmt(name, v) for name, v in df[col].items()] for col in df.columns}, index=df.index)
+
+
+def render_backtest(direction):
+    if direction == 0:
+        df_trades, df_stats, df_equity, df_risk = backtest_result(hedged=True)
+        st.subheader("📊 多空對沖策略統計（共用餘額）")
+    else:
+        df_trades, df_stats, df_equity, df_risk = backtest_result()[direction]
+        st.subheader("📊 做多策略統計" if direction == 1 else "📊 做空策略統計")
+    col_stats, col_risk = st.columns(2)
+    col_stats.dataframe(stats_text(df_stats))
+    col_risk.dataframe(stats_text(df_risk))
+    if df_risk.loc["觸及爆倉價次數", "數值"] > 0:
+        st.warning(f"持倉期間有 {int(df_risk.loc['觸及爆倉價次數', '數值'])} 根K棒觸及爆倉價（維持保證金率 {MAINTENANCE_MARGIN_RATE:.1%}）")
+    if "權益歸零K棒數" in df_risk.index and df_risk.loc["權益歸零K棒數", "數值"] > 0:
+        st.error(f"共用帳戶有 {df_risk.loc['權益歸零K棒數', '數值']} 根K棒權益 <= 0（帳戶已破產），回撤百分比以 100% 計")
+    if not df_equity.empty:
+        with perf.stage("Plotly 序列化", rows=len(df_equity)):
+            st.plotly_chart(equity_figure(df_equity, chart_height), width="stretch")
+    st.dataframe(df_trades)
+
+
+# --- Walk-forward：逐窗口在訓練區間最佳化、在隨後的測試區間驗證 ---
+def render_walk_forward():
+    st.subheader("🚶 Walk-forward 樣本外驗證")
+    st.caption("使用側邊欄的最佳化方向、目標與限制；每個窗口以完整網格搜尋，測試區間未參與最佳化")
+    with st.form("walk_forward_form"):
+        col1, col2, col3 = st.columns(3)
+        train_bars = col1.number_input("訓練K棒數", 100, max(len(bars) - 1, 100), min(4000, max(len(bars) // 2, 100)),
+                                       step=100)
+        test_bars = col2.number_input("測試K棒數", 10, max(len(bars) - 1, 10), min(1000, max(len(bars) // 4, 10)),
+                                      step=100)
+        anchored = col3.checkbox("擴張訓練區間（從第一根開始）", value=False)
+        submitted = st.form_submit_button("▶️ 執行 Walk-forward")
+    if submitted:
+        st.session_state["walk_forward_params"] = dict(
+            initial_balance=initial_balance, add_amount=add_amount, add_multiple=add_multiple,
+            direction=1 if optimize_direction == "做多" else -1, leverage=leverage,
+            max_add_times=max_add_times, add_amount_multiple=add_amount_multiple,
+            train_bars=int(train_bars), test_bars=int(test_bars), anchored=anchored,
+            objective=optimize_objective, max_drawdown=optimize_max_drawdown or None,
+            allow_liquidation=not optimize_no_liquidation,
+        )
+    wf_params = st.session_state.get("walk_forward_params")
+    if wf_params is None:
+        return
+    if wf_params["train_bars"] >= len(bars):
+        st.warning("訓練K棒數需小於目前時間範圍的K棒數")
+        return
+    progress_bar = st.progress(0.0, text="Walk-forward 計算中…")
+    with perf.stage("walk_forward_optimize", rows=len(bars)):
+        df_trades, df_windows, df_stats = result_cache.cached_call(
+            "walk_forward_optimize", walk_forward_optimize,
+            bars.close, bars.high, bars.low, bars.times,
+            dataset=filename, data_fingerprint=data_fingerprint, time_range=time_range, params=wf_params,
+            workers=optimize_workers,
+            progress_callback=lambda done, total: progress_bar.progress(done / total, text=f"Walk-forward 計算中… {done}/{total}"),
+            **wf_params,
+        )
+    progress_bar.empty()
+    col_stats, col_chart = st.columns([1, 2])
+    col_stats.dataframe(df_stats)
+    col_chart.bar_chart(df_windows["樣本外淨利潤"])
+    st.dataframe(df_windows)
+    st.dataframe(df_trades)
+
+
+# --- 蒙地卡羅：以區塊拔靴重抽的價格路徑檢驗目前馬丁參數的尾端風險 ---
+def render_monte_carlo():
+    st.subheader("🎲 蒙地卡羅穩健度測試")
+    st.caption("由目前時間範圍的K棒以區塊拔靴重抽報酬產生模擬路徑，使用側邊欄的馬丁策略參數")
+    n_returns = len(bars) - 1   # 可重抽的報酬數
+    if n_returns < 1:
+        st.warning("目前時間範圍的K棒數不足，至少需要 2 根K棒")
+        return
+    with st.form("monte_carlo_form"):
+        col1, col2, col3, col4, col5 = st.columns(5)
+        n_paths = col1.number_input("路徑數", 100, 100_000, 1000, step=100)
+        # 預設一年（依目前的K棒週期），時間範圍較短時以可重抽的報酬數為上限
+        n_bars = col2.number_input("每條路徑K棒數", min(100, n_returns), 1_000_000,
+                                   min(bars_per_year(timeframe), n_returns), step=100)
+        block_size = col3.number_input("區塊長度（K棒）", 1, 10_000, 24)
+        seed = col4.number_input("亂數種子", 0, 2**31 - 1, 0)
+        mc_direction = col5.radio("方向", ("做多", "做空"), horizontal=True)
+        submitted = st.form_submit_button("▶️ 執行模擬")
+    if submitted:
+        st.session_state["monte_carlo_params"] = dict(
+            direction=1 if mc_direction == "做多" else -1, initial_balance=initial_balance, leverage=leverage,
+            add_pct=add_pct, add_multiple=add_multiple, max_add_times=max_add_times, add_amount=add_amount,
+            add_amount_multiple=add_amount_multiple, take_profit_pct=take_profit_pct, stop_loss_pct=stop_loss_pct,
+            n_paths=int(n_paths), n_bars=int(n_bars), block_size=int(block_size), seed=int(seed),
+        )
+    mc_params = st.session_state.get("monte_carlo_params")
+    if mc_params is None:
+        return
+    progress_bar = st.progress(0.0, text="模擬中…")
+    with perf.stage("monte_carlo", rows=mc_params["n_paths"]):
+        df_paths, summary = result_cache.cached_call(
+            "monte_carlo", monte_carlo, bars.close, bars.high, bars.low,
+            dataset=filename, data_fingerprint=data_fingerprint, time_range=time_range, params=mc_params,
+            workers=optimize_workers,
+            progress_callback=lambda done, total: progress_bar.progress(done / total, text=f"模擬中… {done}/{total}"),
+            **mc_params,
+        )
+    progress_bar.empty()
+    st.dataframe(summary)
+    col_profit, col_drawdown = st.columns(2)
+    for col, metric, color in ((col_profit, "淨利潤", "limegreen"), (col_drawdown, "最大回撤 (USDT)", "tomato")):
+        fig = go.Figure(go.Histogram(x=df_paths[metric].to_numpy(), nbinsx=80, marker_color=color))
+        fig.update_layout(title=f"{metric} 分佈", template="plotly_dark", height=chart_height // 1.5,
+                          xaxis_title=metric, yaxis_title="路徑數")
+        col.plotly_chart(fig, width="stretch")
+    streaks = df_paths["最長連續停損"].value_counts().sort_index()
+    st.bar_chart(streaks.rename("路徑數").rename_axis("最長連續停損次數"))
+
+
+# --- 跨交易對篩選：所有交易對以目前的 ZigZag 與馬丁參數計算並排名 ---
+def render_screen():
+    st.subheader("🌐 跨交易對篩選")
+    st.caption(f"共 {len(registry)} 個交易對，使用側邊欄的 ZigZag 參數、馬丁策略參數、K棒週期與時間範圍")
+    rank_by = st.selectbox("排名依據", ["做多淨利潤", "做空淨利潤", "做多最大回撤", "做空最大回撤", "波段數",
+                                      "上漲波段中位數 (%)"])
+    if not st.button("▶️ 執行篩選"):
+        return
+    backtest_params = dict(initial_balance=initial_balance, leverage=leverage, add_pct=add_pct,
+                           add_multiple=add_multiple, max_add_times=max_add_times, add_amount=add_amount,
+                           add_amount_multiple=add_amount_multiple, take_profit_pct=take_profit_pct,
+                           stop_loss_pct=stop_loss_pct)
+    # 各交易對儲存的列數與最後時間組成資料指紋，任何交易對更新後即重新計算
+    signature = [(name, (bar_store.read_meta(bar_store.store_path(registry.filename(name))) or {}).get("rows"))
+                 for name in registry.symbols()]
+    progress_bar = st.progress(0.0, text="篩選中…")
+    with perf.stage("screen_symbols", rows=len(registry)):
+        df_screen = result_cache.cached_call(
+            "screen_symbols", screen_symbols, registry,
+            data_fingerprint=str(signature), time_range=time_range,
+            params=dict(threshold=threshold, depth=depth, backtest_params=backtest_params, timeframe=timeframe,
+                        rank_by=rank_by),
+            threshold=threshold, depth=depth, backtest_params=backtest_params, timeframe=timeframe,
+            start=start_time, end=end_time, workers=optimize_workers, rank_by=rank_by,
+            ascending=rank_by.endswith("最大回撤"),
+            progress_callback=lambda done, total, name: progress_bar.progress(done / total, text=f"已完成 {name}"),
+        )
+    progress_bar.empty()
+    st.dataframe(df_screen)
+
+
+# --- 工作結果：讀取 python -m cli 佇列中已完成的工作，不重新計算 ---
+def _show_result(result):
+    if isinstance(result, pd.DataFrame):
+        st.dataframe(result)
+    elif isinstance(result, dict) and all(isinstance(v, (int, float, str, bool)) for v in result.values()):
+        st.dataframe(pd.Series(result, name="數值").astype(str))
+    elif isinstance(result, dict):
+        for key, value in result.items():
+            st.markdown(f"**{key}**")
+            _show_result(value)
+    elif isinstance(result, (tuple, list)):
+        for value in result:
+            _show_result(value)
+    else:
+        st.write(result)
+
+
+def render_jobs():
+    st.subheader("📂 工作結果")
+    queue = JobQueue()
+    df_jobs = queue.jobs()
+    if df_jobs.empty:
+        st.info("佇列中沒有工作；以 `python -m cli optimize -c 設定檔` 加入")
+        return
+    st.dataframe(df_jobs.drop(columns="error"))
+    done = df_jobs.index[df_jobs["status"] == "done"][::-1]
+    failed = df_jobs[df_jobs["status"] == "failed"]
+    for job_id, error in failed["error"].items():
+        st.error(f"{job_id} 失敗：{error.strip().splitlines()[-1]}")
+    if len(done) == 0:
+        return
+    job_id = st.selectbox("已完成的工作", list(done))
+    with st.expander("設定"):
+        st.json(queue.get(job_id)["config"])
+    _show_result(queue.result(job_id))
 
 
+# --- 建立分頁 ---
+# 以水平選項取代 st.tabs：st.tabs 會在每次互動時執行所有分頁的內容，這裡只計算與繪製目前選取的分頁
+TABS = {
+    "📊 波段統計": render_stats,
+    "📈 上漲波段清單": render_inc_list,
+    "📉 下跌波段清單": render_dec_list,
+    "📈 K 線圖": lambda: render_kline(bars, zigzag_result()[0], chart_height),
+    "📈 上漲波段分佈圖": render_inc_distribution,
+    "📉 下跌波段分佈圖": render_dec_distribution,
+    "🗺️ 參數敏感度": render_surface,
+    "📒 馬丁策略回測 - 做多": lambda: render_backtest(1),
+    "📒 馬丁策略回測 - 做空": lambda: render_backtest(-1),
+    "📒 馬丁策略回測 - 多空對沖": lambda: render_backtest(0),
+    "🚶 Walk-forward": render_walk_forward,
+    "🎲 蒙地卡羅": render_monte_carlo,
+    "🌐 跨交易對篩選": render_screen,
+    "📂 工作結果": render_jobs,
+}
+active_tab = st.radio("分頁", list(TABS), horizontal=True, key="active_tab", label_visibility="collapsed")
+TABS[active_tab]()
+
+# --- Performance 面板：這次重跑各階段耗時與最近幾次的紀錄 ---
+last_run = perf_recorder.end()
+with perf_panel:
+    if perf_recorder.enabled and not last_run.empty:
+        st.caption(f"這次重跑：合計 {last_run['耗時 (ms)'].sum():.1f} ms")
+        st.dataframe(last_run.round(2))
+        history = perf_recorder.history_frame()
+        if len(history) > 1:
+            st.caption(f"最近 {len(history)} 次重跑 (ms)")
+            st.line_chart(history)
+            st.dataframe(history.agg(["mean", "max"]).T.round(1))
+    if perf_profile and perf_recorder.profile_stats is not None:
+        st.download_button("下載 cProfile (.prof)", perf_recorder.profile_stats, file_name="rerun.prof",
+                           mime="application/octet-stream")
+        st.code(perf_recorder.profile_text, language="text")
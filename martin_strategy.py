@@ -1,5 +1,37 @@
+import numpy as np
 import pandas as pd
 
+try:
+    from numba import njit
+except ImportError:  # 未安裝 numba 時改用純 Python 迴圈
+    njit = None
+
+TRADE_COLUMNS = ["時間", "動作", "價格", "持倉數量", "餘額", "獲利 (USDT)", "獲利 (%)", "結束原因"]
+STATS_INDEX = ["總開倉次數", "止盈次數", "停損次數", "止盈累計金額", "停損累計金額"]
+
+# 交易紀錄：預先配置的結構化陣列，每筆事件一列
+ACTION_OPEN, ACTION_ADD, ACTION_CLOSE = 0, 1, 2
+REASON_NONE, REASON_TAKE_PROFIT, REASON_STOP_LOSS, REASON_WINDOW_END = -1, 0, 1, 2
+ACTION_NAMES = np.array(["開倉", "加碼", "平倉"], dtype=object)
+REASON_NAMES = np.array(["止盈", "停損", "窗口結束"], dtype=object)
+TRADE_DTYPE = np.dtype([
+    ("bar", np.int64),          # K棒位置
+    ("action", np.int8),        # ACTION_*
+    ("price", np.float64),      # 成交價（平倉為未四捨五入的出場價）
+    ("position", np.float64),   # 事件後持倉數量
+    ("margin", np.float64),     # 開倉/加碼投入金額；平倉為釋放的保證金
+    ("avg_price", np.float64),  # 事件後持倉均價
+    ("pnl", np.float64),        # 平倉損益（未四捨五入）
+    ("pnl_pct", np.float64),    # 平倉損益 %（未四捨五入）
+    ("reason", np.int8),        # REASON_*
+])
+
+# 跨區塊延續的持倉與統計狀態
+(STATE_IN_POSITION, STATE_USED_MARGIN, STATE_POSITION_SIZE, STATE_AVG_PRICE,
+ STATE_ADD_COUNT, STATE_LAST_ADD_PRICE, STATE_TOTAL_OPEN, STATE_TAKE_PROFIT_COUNT,
+ STATE_STOP_LOSS_COUNT, STATE_TAKE_PROFIT_AMOUNT, STATE_STOP_LOSS_AMOUNT) = range(11)
+STATE_SIZE = 11
+
 def martin_backtest(prices_close, prices_high, prices_low, times, direction,
                     initial_balance, leverage, add_pct, add_multiple,
                     max_add_times, add_amount, add_amount_multiple,
@@ -97,3 +129,872 @@ def martin_backtest(prices_close, prices_high, prices_low, times, direction,
     }).set_index("指標")
 
     return df_trades, df_stats
+
+
+def _martin_kernel(prices_close, prices_high, prices_low, start, stop, direction, leverage,
+                   add_thresholds, add_amounts, first_amount, take_profit_pct, stop_loss_pct,
+                   state, log):
+    """
+    martin_backtest 的逐K棒核心，運算順序與原版完全相同
+    add_thresholds[k] / add_amounts[k]: 第 k 次加碼的觸發幅度與金額（於 Python 端預先計算）
+    state: 長度 STATE_SIZE 的 float64 陣列，就地更新，可跨區塊延續
+    log: TRADE_DTYPE 結構化陣列，回傳寫入筆數
+    """
+    in_position = state[STATE_IN_POSITION] != 0
+    used_margin = state[STATE_USED_MARGIN]
+    position_size = state[STATE_POSITION_SIZE]
+    avg_price = state[STATE_AVG_PRICE]
+    add_count = int(state[STATE_ADD_COUNT])
+    last_add_price = state[STATE_LAST_ADD_PRICE]
+    total_open = state[STATE_TOTAL_OPEN]
+    take_profit_count = state[STATE_TAKE_PROFIT_COUNT]
+    stop_loss_count = state[STATE_STOP_LOSS_COUNT]
+    take_profit_amount = state[STATE_TAKE_PROFIT_AMOUNT]
+    stop_loss_amount = state[STATE_STOP_LOSS_AMOUNT]
+    max_add_times = len(add_thresholds)
+
+    n = 0
+    for i in range(start, stop):
+        if not in_position:
+            entry_price = prices_close[i]
+            qty = (first_amount * leverage) / entry_price
+            used_margin = first_amount
+            position_size = qty
+            avg_price = entry_price
+            add_count = 0
+            last_add_price = entry_price
+            total_open += 1
+            in_position = True
+            rec = log[n]
+            rec["bar"] = i
+            rec["action"] = ACTION_OPEN
+            rec["price"] = entry_price
+            rec["position"] = position_size
+            rec["margin"] = first_amount
+            rec["avg_price"] = avg_price
+            rec["pnl"] = 0.0
+            rec["pnl_pct"] = 0.0
+            rec["reason"] = REASON_NONE
+            n += 1
+            continue
+
+        high = prices_high[i]
+        low = prices_low[i]
+
+        # 加碼條件
+        trigger_price = low if direction == 1 else high
+        if add_count < max_add_times and \
+                (trigger_price - last_add_price) / last_add_price * 100 * direction * -1 >= add_thresholds[add_count]:
+            add_amount_now = add_amounts[add_count]
+            qty = (add_amount_now * leverage) / trigger_price
+            avg_price = (avg_price * position_size + trigger_price * qty) / (position_size + qty)
+            position_size += qty
+            used_margin += add_amount_now
+            add_count += 1
+            last_add_price = trigger_price
+            rec = log[n]
+            rec["bar"] = i
+            rec["action"] = ACTION_ADD
+            rec["price"] = trigger_price
+            rec["position"] = position_size
+            rec["margin"] = add_amount_now
+            rec["avg_price"] = avg_price
+            rec["pnl"] = 0.0
+            rec["pnl_pct"] = 0.0
+            rec["reason"] = REASON_NONE
+            n += 1
+
+        # 止盈 / 停損
+        pnl_pct_high = (high - avg_price) / avg_price * 100 * direction
+        pnl_pct_low = (low - avg_price) / avg_price * 100 * direction
+        if pnl_pct_high >= take_profit_pct or pnl_pct_low <= -stop_loss_pct:
+            if pnl_pct_high >= take_profit_pct:
+                exit_price = avg_price * (1 + take_profit_pct / 100 * direction)
+                reason = REASON_TAKE_PROFIT
+            else:
+                exit_price = avg_price * (1 - stop_loss_pct / 100 * direction)
+                reason = REASON_STOP_LOSS
+            pnl = position_size * (exit_price - avg_price) * direction
+            if pnl > 0:
+                take_profit_count += 1
+                take_profit_amount += pnl
+            else:
+                stop_loss_count += 1
+                stop_loss_amount += pnl
+            rec = log[n]
+            rec["bar"] = i
+            rec["action"] = ACTION_CLOSE
+            rec["price"] = exit_price
+            rec["position"] = 0.0
+            rec["margin"] = used_margin
+            rec["avg_price"] = avg_price
+            rec["pnl"] = pnl
+            rec["pnl_pct"] = (exit_price - avg_price) / avg_price * 100 * direction
+            rec["reason"] = reason
+            n += 1
+            in_position = False
+
+    state[STATE_IN_POSITION] = 1.0 if in_position else 0.0
+    state[STATE_USED_MARGIN] = used_margin
+    state[STATE_POSITION_SIZE] = position_size
+    state[STATE_AVG_PRICE] = avg_price
+    state[STATE_ADD_COUNT] = add_count
+    state[STATE_LAST_ADD_PRICE] = last_add_price
+    state[STATE_TOTAL_OPEN] = total_open
+    state[STATE_TAKE_PROFIT_COUNT] = take_profit_count
+    state[STATE_STOP_LOSS_COUNT] = stop_loss_count
+    state[STATE_TAKE_PROFIT_AMOUNT] = take_profit_amount
+    state[STATE_STOP_LOSS_AMOUNT] = stop_loss_amount
+    return n
+
+
+_martin_kernel_jit = njit(cache=True)(_martin_kernel) if njit is not None else None
+
+
+def run_martin_kernel(prices_close, prices_high, prices_low, direction, leverage, add_pct, add_multiple,
+                      max_add_times, add_amount, add_amount_multiple, take_profit_pct, stop_loss_pct,
+                      state=None, start=0, stop=None):
+    """
+    執行核心並回傳 (交易紀錄結構化陣列, state)
+    有 numba 時使用 JIT 編譯版本，否則以純 Python 迴圈執行同一份程式碼
+    """
+    prices_close = np.ascontiguousarray(prices_close, dtype=np.float64)
+    prices_high = np.ascontiguousarray(prices_high, dtype=np.float64)
+    prices_low = np.ascontiguousarray(prices_low, dtype=np.float64)
+    if stop is None:
+        stop = len(prices_close)
+    if state is None:
+        state = np.zeros(STATE_SIZE)
+    max_add_times = int(max_add_times)
+    # 與原版相同以 Python 次方計算，確保浮點數結果一致
+    add_thresholds = np.array([add_pct * (add_multiple ** k) for k in range(max_add_times)], dtype=np.float64)
+    add_amounts = np.array([add_amount * (add_amount_multiple ** k) for k in range(max_add_times)], dtype=np.float64)
+    # 每根K棒最多產生「加碼 + 平倉」兩筆事件
+    log = np.empty(2 * max(stop - start, 0) + 1, dtype=TRADE_DTYPE)
+
+    if _martin_kernel_jit is not None:
+        n = _martin_kernel_jit(prices_close, prices_high, prices_low, start, stop, int(direction),
+                               float(leverage), add_thresholds, add_amounts, float(add_amount / 2),
+                               float(take_profit_pct), float(stop_loss_pct), state, log)
+    else:
+        n = _martin_kernel(prices_close.tolist(), prices_high.tolist(), prices_low.tolist(), start, stop,
+                           direction, leverage, add_thresholds.tolist(), add_amounts.tolist(), add_amount / 2,
+                           take_profit_pct, stop_loss_pct, state, log)
+    return log[:n], state
+
+
+def force_close(state, bar, price, direction):
+    """
+    以 price 平掉 state 中尚未平倉的持倉（例如 walk-forward 測試區間結束），回傳 REASON_WINDOW_END 的交易紀錄
+    不計入止盈/停損次數；沒有持倉時回傳空陣列
+    """
+    if state[STATE_IN_POSITION] == 0:
+        return np.empty(0, dtype=TRADE_DTYPE)
+    avg_price = state[STATE_AVG_PRICE]
+    pnl = state[STATE_POSITION_SIZE] * (price - avg_price) * direction
+    log = np.array([(bar, ACTION_CLOSE, price, 0.0, state[STATE_USED_MARGIN], avg_price, pnl,
+                     (price - avg_price) / avg_price * 100 * direction, REASON_WINDOW_END)], dtype=TRADE_DTYPE)
+    state[STATE_IN_POSITION] = 0.0
+    return log
+
+
+def trades_to_frame(log, times, initial_balance, compact=False):
+    """
+    將核心的交易紀錄轉成與 martin_backtest 相同格式的 DataFrame，回傳 (df_trades, 期末餘額)
+    compact=True 時改為型別化的欄位：動作 / 結束原因為 categorical（int8 代碼），獲利 (%) 為 float32，
+    不產生 Python 物件欄位，長歷史的交易紀錄記憶體用量約為原格式的數分之一
+    log 含 direction 欄位（多空合併帳本）時另有「方向」欄
+    """
+    columns = TRADE_COLUMNS[:1] + ["方向"] + TRADE_COLUMNS[1:] if "direction" in log.dtype.names else TRADE_COLUMNS
+    if len(log) == 0:
+        return pd.DataFrame([], columns=columns).set_index("時間"), initial_balance
+
+    is_close = log["action"] == ACTION_CLOSE
+    close_pnl = log["pnl"][is_close]
+    # 原版對 numpy 浮點數呼叫 round()，即 np.round，結果一致
+    pnl_rounded = np.round(close_pnl, 2)
+    # 餘額：開倉/加碼扣除投入金額，平倉加回保證金與損益，依序累加
+    delta = -log["margin"]
+    delta[is_close] = log["margin"][is_close] + pnl_rounded
+    balance = np.cumsum(np.concatenate(([initial_balance], delta)))[1:]
+
+    price = log["price"].copy()
+    price[is_close] = np.round(price[is_close], 2)
+    pnl = np.full(len(log), np.nan)
+    pnl[is_close] = pnl_rounded
+    pnl_pct = np.full(len(log), np.nan)
+    pnl_pct[is_close] = np.round(log["pnl_pct"][is_close], 2)
+    if compact:
+        action = pd.Categorical.from_codes(log["action"], categories=ACTION_NAMES)
+        reason = pd.Categorical.from_codes(log["reason"], categories=REASON_NAMES)   # REASON_NONE (-1) 為缺值
+        pnl_pct = pnl_pct.astype(np.float32)
+    else:
+        action = ACTION_NAMES[log["action"]]
+        reason = np.full(len(log), None, dtype=object)
+        reason[is_close] = REASON_NAMES[log["reason"][is_close]]
+
+    df_trades = pd.DataFrame({
+        "時間": np.asarray(times)[log["bar"]],
+        "方向": log["direction"] if "direction" in log.dtype.names else None,
+        "動作": action,
+        "價格": price,
+        "持倉數量": log["position"],
+        "餘額": balance,
+        "獲利 (USDT)": pnl,
+        "獲利 (%)": pnl_pct,
+        "結束原因": reason,
+    }, columns=columns).set_index("時間")
+    return df_trades, float(balance[-1])
+
+
+def _stats_values(state):
+    return [
+        int(state[STATE_TOTAL_OPEN]),
+        int(state[STATE_TAKE_PROFIT_COUNT]),
+        int(state[STATE_STOP_LOSS_COUNT]),
+        round(state[STATE_TAKE_PROFIT_AMOUNT], 2),
+        round(state[STATE_STOP_LOSS_AMOUNT], 2),
+    ]
+
+
+def stats_to_frame(state):
+    return pd.DataFrame({"指標": STATS_INDEX, "數值": _stats_values(state)}).set_index("指標")
+
+
+EQUITY_COLUMNS = ["權益", "已用保證金", "持倉數量", "回撤 (USDT)", "回撤 (%)", "爆倉價", "爆倉距離 (%)"]
+RISK_INDEX = ["最大回撤 (USDT)", "最大回撤 (%)", "最長水下K棒數", "水下時間比例 (%)", "最大使用保證金",
+              "最大浮動虧損", "觸及爆倉價次數", "最小爆倉距離 (%)"]
+# 多空合併帳本另外記錄權益 <= 0（帳戶已破產）的K棒數
+BOOK_RISK_INDEX = RISK_INDEX + ["權益歸零K棒數"]
+MAINTENANCE_MARGIN_RATE = 0.005
+
+
+def liquidation_price(position_size, avg_price, used_margin, direction, maintenance_margin_rate=MAINTENANCE_MARGIN_RATE):
+    """
+    逐倉爆倉價：保證金 + 未實現損益 降到 維持保證金率 * 持倉價值 時的價格
+    做多 (avg*q - M) / (q*(1-mmr))；做空 (avg*q + M) / (q*(1+mmr))；無持倉時為 nan
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        notional = position_size * avg_price
+        if direction == 1:
+            price = (notional - used_margin) / (position_size * (1 - maintenance_margin_rate))
+        else:
+            price = (notional + used_margin) / (position_size * (1 + maintenance_margin_rate))
+    return np.where(position_size > 0, price, np.nan)
+
+
+def _longest_run(mask):
+    # 連續為 True 的最長長度
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return int((edges[1::2] - edges[::2]).max()) if len(edges) else 0
+
+
+def _drawdown(profit, initial_balance):
+    # 回撤以損益計算（與批次回測相同的運算），高點至少為初始金額；回傳 (回撤 USDT, 回撤 %)
+    # 權益跌破 0 之後回撤百分比沒有意義，上限為 100%
+    peak = np.maximum(np.maximum.accumulate(profit), 0.0) if len(profit) else profit
+    drawdown = peak - profit
+    return drawdown, np.minimum(drawdown / (initial_balance + peak) * 100, 100.0)
+
+
+def risk_to_frame(risk, index=RISK_INDEX):
+    # object 欄位讓次數類指標維持整數，不與金額一起轉成浮點數
+    return pd.DataFrame({"數值": [risk[k] for k in index]}, index=pd.Index(index, name="指標"), dtype=object)
+
+
+def equity_curve(log, prices_close, prices_high, prices_low, direction, initial_balance,
+                 maintenance_margin_rate=MAINTENANCE_MARGIN_RATE):
+    """
+    由核心交易紀錄以陣列運算展開逐K棒的持倉，回傳 (權益曲線 dict, 風險統計 dict)
+    權益 = 初始金額 + 已實現損益（與交易紀錄相同取到小數 2 位）+ 以收盤價計算的未實現損益
+    浮動虧損與爆倉檢查使用「進入該K棒時」的持倉，對上該K棒的最低價（做多）/最高價（做空）
+    """
+    close = np.asarray(prices_close, dtype=np.float64)
+    adverse = np.asarray(prices_low if direction == 1 else prices_high, dtype=np.float64)
+    n = len(close)
+    is_close = log["action"] == ACTION_CLOSE
+    realized = np.cumsum(np.where(is_close, np.round(log["pnl"], 2), 0.0))
+    # 已用保證金：每筆交易內依序累加投入金額（與核心相同的加法順序），平倉後為 0
+    trade_id = np.cumsum(log["action"] == ACTION_OPEN)
+    used = pd.Series(np.where(is_close, 0.0, log["margin"])).groupby(trade_id).cumsum().to_numpy()
+    used[is_close] = 0.0
+    bars = np.arange(n)
+    # 每根K棒收盤時 / 開始時最後一筆事件的位置（-1 代表尚無事件）
+    k_end = np.searchsorted(log["bar"], bars, side="right") - 1
+    k_in = np.searchsorted(log["bar"], bars, side="left") - 1
+
+    def state_at(values, k):
+        return np.where(k >= 0, values[np.maximum(k, 0)] if len(values) else 0.0, 0.0)
+
+    position_end = state_at(log["position"], k_end)
+    profit = state_at(realized, k_end) + position_end * (close - state_at(log["avg_price"], k_end)) * direction
+    equity = initial_balance + profit
+    used_end = state_at(used, k_end)
+
+    position_in = state_at(log["position"], k_in)
+    avg_in = state_at(log["avg_price"], k_in)
+    used_in = state_at(used, k_in)
+    floating = position_in * (adverse - avg_in) * direction
+    liq_in = liquidation_price(position_in, avg_in, used_in, direction, maintenance_margin_rate)
+    with np.errstate(invalid="ignore"):
+        distance = (adverse - liq_in) / adverse * 100 * direction
+    liq_end = liquidation_price(position_end, state_at(log["avg_price"], k_end), used_end, direction,
+                                maintenance_margin_rate)
+
+    drawdown, drawdown_pct = _drawdown(profit, initial_balance)
+    underwater = drawdown > 0
+    held = position_in > 0
+
+    curve = {
+        "權益": equity,
+        "已用保證金": used_end,
+        "持倉數量": position_end,
+        "回撤 (USDT)": drawdown,
+        "回撤 (%)": drawdown_pct,
+        "爆倉價": liq_end,
+        "爆倉距離 (%)": np.where(held, distance, np.nan),
+        "浮動損益": floating,   # 不在 EQUITY_COLUMNS 中，供多空合併帳本加總
+    }
+    risk = {
+        "最大回撤 (USDT)": round(float(drawdown.max()) if n else 0.0, 2),
+        "最大回撤 (%)": round(float(drawdown_pct.max()) if n else 0.0, 2),
+        "最長水下K棒數": _longest_run(underwater),
+        "水下時間比例 (%)": round(float(underwater.mean() * 100) if n else 0.0, 2),
+        "最大使用保證金": round(float(used.max()) if len(used) else 0.0, 2),
+        "最大浮動虧損": round(float(floating.min()) if n else 0.0, 2),
+        "觸及爆倉價次數": int((held & (distance <= 0)).sum()),
+        "最小爆倉距離 (%)": round(float(distance[held].min()), 2) if held.any() else np.nan,
+    }
+    return curve, risk
+
+
+def martin_backtest_fast(prices_close, prices_high, prices_low, times, direction,
+                         initial_balance, leverage, add_pct, add_multiple,
+                         max_add_times, add_amount, add_amount_multiple,
+                         take_profit_pct, stop_loss_pct, with_equity=False,
+                         maintenance_margin_rate=MAINTENANCE_MARGIN_RATE):
+    """
+    與 martin_backtest 相同參數與輸出的陣列化版本
+    with_equity=True 時另外回傳逐K棒的權益曲線 DataFrame 與風險統計 DataFrame
+    """
+    log, state = run_martin_kernel(
+        prices_close, prices_high, prices_low, direction, leverage, add_pct, add_multiple,
+        max_add_times, add_amount, add_amount_multiple, take_profit_pct, stop_loss_pct)
+    df_trades, _ = trades_to_frame(log, times, initial_balance)
+    if not with_equity:
+        return df_trades, stats_to_frame(state)
+    curve, risk = equity_curve(log, prices_close, prices_high, prices_low, direction, initial_balance,
+                               maintenance_margin_rate)
+    df_equity = pd.DataFrame(curve, columns=EQUITY_COLUMNS, index=pd.Index(np.asarray(times), name="時間"))
+    return df_trades, stats_to_frame(state), df_equity, risk_to_frame(risk)
+
+
+# --- 多空同時回測：一次走訪K棒，同時推進做多與做空兩個持倉 ---
+SIDES = (1, -1)
+SIDE_NAMES = {1: "做多", -1: "做空"}
+# 多空合併帳本的交易紀錄，多一個方向欄位
+BOOK_DTYPE = np.dtype(TRADE_DTYPE.descr + [("direction", np.int8)])
+
+
+def _martin_kernel_both(prices_close, prices_high, prices_low, start, stop, leverage, add_thresholds, add_amounts,
+                        first_amount, take_profit_pct, stop_loss_pct, states, logs):
+    """
+    一次走訪 [start, stop)，每根K棒依序推進做多 (states[0] / logs[0]) 與做空 (states[1] / logs[1])
+    每個方向的運算與 _martin_kernel 迴圈內容完全相同，兩邊的狀態與紀錄互不影響；回傳 (做多筆數, 做空筆數)
+    """
+    max_add_times = len(add_thresholds)
+    counts = np.zeros(2, dtype=np.int64)
+    for i in range(start, stop):
+        high = prices_high[i]
+        low = prices_low[i]
+        for side in range(2):
+            direction = 1 - 2 * side
+            n = counts[side]
+            if states[side, STATE_IN_POSITION] == 0:
+                entry_price = prices_close[i]
+                position_size = (first_amount * leverage) / entry_price
+                states[side, STATE_IN_POSITION] = 1.0
+                states[side, STATE_USED_MARGIN] = first_amount
+                states[side, STATE_POSITION_SIZE] = position_size
+                states[side, STATE_AVG_PRICE] = entry_price
+                states[side, STATE_ADD_COUNT] = 0.0
+                states[side, STATE_LAST_ADD_PRICE] = entry_price
+                states[side, STATE_TOTAL_OPEN] += 1
+                rec = logs[side, n]
+                rec["bar"] = i
+                rec["action"] = ACTION_OPEN
+                rec["price"] = entry_price
+                rec["position"] = position_size
+                rec["margin"] = first_amount
+                rec["avg_price"] = entry_price
+                rec["pnl"] = 0.0
+                rec["pnl_pct"] = 0.0
+                rec["reason"] = REASON_NONE
+                counts[side] = n + 1
+                continue
+
+            position_size = states[side, STATE_POSITION_SIZE]
+            avg_price = states[side, STATE_AVG_PRICE]
+            add_count = int(states[side, STATE_ADD_COUNT])
+            last_add_price = states[side, STATE_LAST_ADD_PRICE]
+
+            # 加碼條件
+            trigger_price = low if direction == 1 else high
+            if add_count < max_add_times and \
+                    (trigger_price - last_add_price) / last_add_price * 100 * direction * -1 >= add_thresholds[add_count]:
+                add_amount_now = add_amounts[add_count]
+                qty = (add_amount_now * leverage) / trigger_price
+                avg_price = (avg_price * position_size + trigger_price * qty) / (position_size + qty)
+                position_size += qty
+                states[side, STATE_POSITION_SIZE] = position_size
+                states[side, STATE_AVG_PRICE] = avg_price
+                states[side, STATE_USED_MARGIN] += add_amount_now
+                states[side, STATE_ADD_COUNT] = add_count + 1
+                states[side, STATE_LAST_ADD_PRICE] = trigger_price
+                rec = logs[side, n]
+                rec["bar"] = i
+                rec["action"] = ACTION_ADD
+                rec["price"] = trigger_price
+                rec["position"] = position_size
+                rec["margin"] = add_amount_now
+                rec["avg_price"] = avg_price
+                rec["pnl"] = 0.0
+                rec["pnl_pct"] = 0.0
+                rec["reason"] = REASON_NONE
+                n += 1
+
+            # 止盈 / 停損
+            pnl_pct_high = (high - avg_price) / avg_price * 100 * direction
+            pnl_pct_low = (low - avg_price) / avg_price * 100 * direction
+            if pnl_pct_high >= take_profit_pct or pnl_pct_low <= -stop_loss_pct:
+                if pnl_pct_high >= take_profit_pct:
+                    exit_price = avg_price * (1 + take_profit_pct / 100 * direction)
+                    reason = REASON_TAKE_PROFIT
+                else:
+                    exit_price = avg_price * (1 - stop_loss_pct / 100 * direction)
+                    reason = REASON_STOP_LOSS
+                pnl = position_size * (exit_price - avg_price) * direction
+                if pnl > 0:
+                    states[side, STATE_TAKE_PROFIT_COUNT] += 1
+                    states[side, STATE_TAKE_PROFIT_AMOUNT] += pnl
+                else:
+                    states[side, STATE_STOP_LOSS_COUNT] += 1
+                    states[side, STATE_STOP_LOSS_AMOUNT] += pnl
+                rec = logs[side, n]
+                rec["bar"] = i
+                rec["action"] = ACTION_CLOSE
+                rec["price"] = exit_price
+                rec["position"] = 0.0
+                rec["margin"] = states[side, STATE_USED_MARGIN]
+                rec["avg_price"] = avg_price
+                rec["pnl"] = pnl
+                rec["pnl_pct"] = (exit_price - avg_price) / avg_price * 100 * direction
+                rec["reason"] = reason
+                n += 1
+                states[side, STATE_IN_POSITION] = 0.0
+            counts[side] = n
+    return counts[0], counts[1]
+
+
+_martin_kernel_both_jit = njit(cache=True)(_martin_kernel_both) if njit is not None else None
+
+
+def run_martin_kernel_both(prices_close, prices_high, prices_low, leverage, add_pct, add_multiple, max_add_times,
+                           add_amount, add_amount_multiple, take_profit_pct, stop_loss_pct,
+                           states=None, start=0, stop=None):
+    """
+    同時執行做多與做空，回傳 ((做多紀錄, 做空紀錄), states)；states 形狀 (2, STATE_SIZE)，可跨區塊延續
+    與 run_martin_kernel 各呼叫一次的結果完全相同，但K棒只讀取一次
+    """
+    prices_close = np.ascontiguousarray(prices_close, dtype=np.float64)
+    prices_high = np.ascontiguousarray(prices_high, dtype=np.float64)
+    prices_low = np.ascontiguousarray(prices_low, dtype=np.float64)
+    if stop is None:
+        stop = len(prices_close)
+    if states is None:
+        states = np.zeros((2, STATE_SIZE))
+    max_add_times = int(max_add_times)
+    add_thresholds = np.array([add_pct * (add_multiple ** k) for k in range(max_add_times)], dtype=np.float64)
+    add_amounts = np.array([add_amount * (add_amount_multiple ** k) for k in range(max_add_times)], dtype=np.float64)
+    logs = np.empty((2, 2 * max(stop - start, 0) + 1), dtype=TRADE_DTYPE)
+
+    if _martin_kernel_both_jit is not None:
+        n_long, n_short = _martin_kernel_both_jit(
+            prices_close, prices_high, prices_low, start, stop, float(leverage), add_thresholds, add_amounts,
+            float(add_amount / 2), float(take_profit_pct), float(stop_loss_pct), states, logs)
+    else:
+        n_long, n_short = _martin_kernel_both(
+            prices_close.tolist(), prices_high.tolist(), prices_low.tolist(), start, stop, leverage,
+            add_thresholds.tolist(), add_amounts.tolist(), add_amount / 2, take_profit_pct, stop_loss_pct,
+            states, logs)
+    return (logs[0, :n_long], logs[1, :n_short]), states
+
+
+def merge_logs(long_log, short_log):
+    """合併兩個方向的交易紀錄為 BOOK_DTYPE，依K棒排序；同一根K棒內做多在前（與核心的處理順序相同）"""
+    book = np.empty(len(long_log) + len(short_log), dtype=BOOK_DTYPE)
+    for name in TRADE_DTYPE.names:
+        book[name] = np.concatenate((long_log[name], short_log[name]))
+    book["direction"] = np.repeat(np.array(SIDES, dtype=np.int8), (len(long_log), len(short_log)))
+    return book[np.argsort(book["bar"], kind="stable")]
+
+
+def book_equity_curve(curves, initial_balance):
+    """
+    多空合併帳本的逐K棒權益與風險：兩個方向共用同一份餘額，權益 = 初始金額 + 兩邊損益合計
+    爆倉仍以各方向的逐倉持倉計算；最大使用保證金以K棒收盤時兩邊合計計算
+    策略不以餘額限制開倉，共用帳戶可能虧光：權益 <= 0 的K棒數記為「權益歸零K棒數」
+    """
+    long_curve, short_curve = curves
+    profit = long_curve["權益"] + short_curve["權益"] - 2 * initial_balance
+    drawdown, drawdown_pct = _drawdown(profit, initial_balance)
+    underwater = drawdown > 0
+    used = long_curve["已用保證金"] + short_curve["已用保證金"]
+    floating = long_curve["浮動損益"] + short_curve["浮動損益"]
+    distance = np.fmin(long_curve["爆倉距離 (%)"], short_curve["爆倉距離 (%)"])
+    held = ~np.isnan(distance)
+    n = len(profit)
+    equity = initial_balance + profit
+    curve = {
+        "權益": equity,
+        "已用保證金": used,
+        "持倉數量": long_curve["持倉數量"] - short_curve["持倉數量"],   # 淨部位
+        "回撤 (USDT)": drawdown,
+        "回撤 (%)": drawdown_pct,
+        "爆倉價": np.full(n, np.nan),
+        "爆倉距離 (%)": distance,
+    }
+    risk = {
+        "最大回撤 (USDT)": round(float(drawdown.max()) if n else 0.0, 2),
+        "最大回撤 (%)": round(float(drawdown_pct.max()) if n else 0.0, 2),
+        "最長水下K棒數": _longest_run(underwater),
+        "水下時間比例 (%)": round(float(underwater.mean() * 100) if n else 0.0, 2),
+        "最大使用保證金": round(float(used.max()) if n else 0.0, 2),
+        "最大浮動虧損": round(float(floating.min()) if n else 0.0, 2),
+        "觸及爆倉價次數": int((held & (distance <= 0)).sum()),
+        "最小爆倉距離 (%)": round(float(distance[held].min()), 2) if held.any() else np.nan,
+        "權益歸零K棒數": int((equity <= 0).sum()),
+    }
+    return curve, risk
+
+
+def martin_backtest_both(prices_close, prices_high, prices_low, times,
+                         initial_balance, leverage, add_pct, add_multiple,
+                         max_add_times, add_amount, add_amount_multiple,
+                         take_profit_pct, stop_loss_pct, with_equity=False, hedged=False, compact=True,
+                         maintenance_margin_rate=MAINTENANCE_MARGIN_RATE):
+    """
+    做多與做空一次走訪K棒完成，取代以 direction=1 / -1 各呼叫一次 martin_backtest_fast
+    hedged=False：回傳 {1: 結果, -1: 結果}，各方向獨立計算餘額，結果與 martin_backtest_fast 相同
+    hedged=True：兩個方向視為同一個帳戶的對沖部位、共用餘額，回傳單一結果；
+                 交易紀錄多「方向」欄，統計為 做多 / 做空 / 合計 三欄
+    結果為 (df_trades, df_stats)，with_equity=True 時另有 (df_equity, df_risk)
+    compact: 交易紀錄使用 categorical / float32 欄位，見 trades_to_frame
+    策略本身不以餘額限制開倉，共用餘額不改變兩邊的交易，只影響餘額、權益與回撤的計算
+    """
+    logs, states = run_martin_kernel_both(
+        prices_close, prices_high, prices_low, leverage, add_pct, add_multiple,
+        max_add_times, add_amount, add_amount_multiple, take_profit_pct, stop_loss_pct)
+    curves = risks = None
+    if with_equity:
+        curves, risks = zip(*(equity_curve(log, prices_close, prices_high, prices_low, direction, initial_balance,
+                                           maintenance_margin_rate) for log, direction in zip(logs, SIDES)))
+    index = pd.Index(np.asarray(times), name="時間")
+
+    def finish(df_trades, df_stats, curve, risk, risk_index=RISK_INDEX):
+        if not with_equity:
+            return df_trades, df_stats
+        df_equity = pd.DataFrame(curve, columns=EQUITY_COLUMNS, index=index)
+        return df_trades, df_stats, df_equity, risk_to_frame(risk, risk_index)
+
+    if not hedged:
+        return {direction: finish(trades_to_frame(logs[k], times, initial_balance, compact)[0],
+                                  stats_to_frame(states[k]), curves and curves[k], risks and risks[k])
+                for k, direction in enumerate(SIDES)}
+
+    df_trades, _ = trades_to_frame(merge_logs(*logs), times, initial_balance, compact)
+    long_values, short_values = (_stats_values(state) for state in states)
+    # 次數維持整數、金額取到小數 2 位，object 欄位避免整欄轉成浮點數
+    df_stats = pd.DataFrame({
+        SIDE_NAMES[1]: long_values,
+        SIDE_NAMES[-1]: short_values,
+        "合計": [a + b if isinstance(a, int) else round(a + b, 2) for a, b in zip(long_values, short_values)],
+    }, index=pd.Index(STATS_INDEX, name="指標"), dtype=object)
+    curve, risk = book_equity_curve(curves, initial_balance) if with_equity else (None, None)
+    return finish(df_trades, df_stats, curve, risk, BOOK_RISK_INDEX)
+
+
+class CsvTradeSink:
+    """把串流回測的交易紀錄逐段附加到 CSV（第一段寫入標題列）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+
+    def __call__(self, df_trades):
+        # 固定時間格式：一段的交易剛好都在整點 00:00 時，pandas 預設只輸出日期
+        df_trades.to_csv(self.path, mode="w" if self.rows == 0 else "a", header=self.rows == 0,
+                         date_format="%Y-%m-%d %H:%M:%S")
+        self.rows += len(df_trades)
+
+
+def martin_backtest_stream(bars, direction, initial_balance, leverage, add_pct, add_multiple,
+                           max_add_times, add_amount, add_amount_multiple, take_profit_pct, stop_loss_pct,
+                           sink=None, chunk_size=100_000):
+    """
+    分段回測不需整份載入記憶體的長歷史（例如數百萬根 1 分K）
+    bars: bar_store.BarStore（以 memory map 分段讀取），或依時間順序產生K棒區段的可迭代物件，
+          每段需有 close / high / low / times 陣列（例如由 Parquet row group 轉成的 BarStore.from_frame）
+    sink: 每段的交易紀錄（與 martin_backtest 相同格式的 DataFrame）交給 sink(df) 處理，
+          或傳入檔名以 CsvTradeSink 附加寫入；None 時只計算統計
+    持倉與統計狀態跨段延續，結果與一次回測整段相同；記憶體用量只與 chunk_size 有關
+    回傳 (df_stats, 期末餘額, 交易筆數)
+    """
+    if isinstance(sink, str):
+        sink = CsvTradeSink(sink)
+    chunks = bars.iter_chunks(chunk_size) if hasattr(bars, "iter_chunks") else bars
+    state = np.zeros(STATE_SIZE)
+    balance = initial_balance
+    n_trades = 0
+    for chunk in chunks:
+        log, state = run_martin_kernel(
+            chunk.close, chunk.high, chunk.low, direction, leverage, add_pct, add_multiple,
+            max_add_times, add_amount, add_amount_multiple, take_profit_pct, stop_loss_pct, state=state)
+        if len(log) == 0:
+            continue
+        df_trades, balance = trades_to_frame(log, chunk.times, balance)
+        n_trades += len(log)
+        if sink is not None:
+            sink(df_trades)
+    return stats_to_frame(state), balance, n_trades
+
+
+BATCH_PARAM_COLUMNS = ["add_pct", "take_profit_pct", "stop_loss_pct"]
+BATCH_OPTIONAL_COLUMNS = ["leverage", "max_add_times", "add_amount_multiple", "add_multiple"]
+BATCH_STATS_COLUMNS = ["止盈累計金額", "停損累計金額", "淨利潤", "止盈次數", "停損次數", "最大使用保證金"]
+# risk=True 時附加在 BATCH_STATS_COLUMNS 之後的風險欄位，與 equity_curve 的同名統計相同
+BATCH_RISK_COLUMNS = ["最大回撤", "最長水下K棒數", "最大浮動虧損", "觸及爆倉價次數", "最小爆倉距離 (%)"]
+
+
+def _new_batch_state(n, track_risk=False):
+    state = {
+        "in_position": np.zeros(n, dtype=bool),
+        "used_margin": np.zeros(n),
+        "position_size": np.zeros(n),
+        "avg_price": np.ones(n),
+        "add_count": np.zeros(n, dtype=np.int64),
+        "last_add_price": np.ones(n),
+        "next_threshold": np.full(n, np.inf),
+        "take_profit_count": np.zeros(n, dtype=np.int64),
+        "stop_loss_count": np.zeros(n, dtype=np.int64),
+        "take_profit_amount": np.zeros(n),
+        "stop_loss_amount": np.zeros(n),
+        "max_used_margin": np.zeros(n),
+    }
+    if track_risk:
+        # 逐K棒的權益（以損益計）與爆倉檢查，只在需要時維護
+        state.update({
+            "realized": np.zeros(n),
+            "peak_profit": np.zeros(n),
+            "max_drawdown": np.zeros(n),
+            "underwater": np.zeros(n, dtype=np.int64),
+            "max_underwater": np.zeros(n, dtype=np.int64),
+            "worst_floating": np.zeros(n),
+            "liquidation_hits": np.zeros(n, dtype=np.int64),
+            "min_liq_distance": np.full(n, np.inf),
+        })
+    return state
+
+
+def _run_batch(prices_close, prices_high, prices_low, start, stop, direction, leverage,
+               add_thresholds, add_amounts, first_amount, take_profit_pct, stop_loss_pct, state,
+               maintenance_margin_rate=MAINTENANCE_MARGIN_RATE):
+    """
+    以 NumPy 向量同時推進 N 組參數的持倉狀態，逐K棒的判斷與 _martin_kernel 相同
+    add_thresholds / add_amounts: (N, K) 表格，超過最大加碼次數的格子為 inf / 0
+    state 含風險欄位（_new_batch_state(n, track_risk=True)）時一併更新回撤、浮動虧損與爆倉檢查
+    """
+    in_position = state["in_position"]
+    used_margin = state["used_margin"]
+    position_size = state["position_size"]
+    avg_price = state["avg_price"]
+    add_count = state["add_count"]
+    last_add_price = state["last_add_price"]
+    next_threshold = state["next_threshold"]
+    max_adds = add_thresholds.shape[1]
+    track_risk = "realized" in state
+
+    for i in range(start, stop):
+        high = prices_high[i]
+        low = prices_low[i]
+        flat = np.flatnonzero(~in_position)
+
+        if track_risk:
+            # 以進入本根K棒時的持倉，對上最不利的價格
+            adverse = low if direction == 1 else high
+            held = in_position.copy()
+            floating = position_size * (adverse - avg_price) * direction
+            np.minimum(state["worst_floating"], np.where(held, floating, 0.0), out=state["worst_floating"])
+            liq = liquidation_price(position_size, avg_price, used_margin, direction, maintenance_margin_rate)
+            with np.errstate(invalid="ignore"):
+                distance = np.where(held, (adverse - liq) / adverse * 100 * direction, np.inf)
+            state["liquidation_hits"] += distance <= 0
+            np.minimum(state["min_liq_distance"], distance, out=state["min_liq_distance"])
+
+        # 加碼：只需處理觸發的參數組
+        trigger_price = low if direction == 1 else high
+        change = (trigger_price - last_add_price) / last_add_price * 100 * direction * -1
+        adds = np.flatnonzero((change >= next_threshold) & in_position)
+        if len(adds):
+            add_amount_now = add_amounts[adds, add_count[adds]]
+            qty = (add_amount_now * leverage[adds]) / trigger_price
+            size = position_size[adds]
+            avg_price[adds] = (avg_price[adds] * size + trigger_price * qty) / (size + qty)
+            position_size[adds] = size + qty
+            used_margin[adds] += add_amount_now
+            add_count[adds] += 1
+            last_add_price[adds] = trigger_price
+            next_threshold[adds] = add_thresholds[adds, np.minimum(add_count[adds], max_adds - 1)]
+            next_threshold[adds[add_count[adds] >= max_adds]] = np.inf
+            state["max_used_margin"][adds] = np.maximum(state["max_used_margin"][adds], used_margin[adds])
+
+        # 止盈 / 停損
+        pnl_pct_high = (high - avg_price) / avg_price * 100 * direction
+        pnl_pct_low = (low - avg_price) / avg_price * 100 * direction
+        hit_take_profit = pnl_pct_high >= take_profit_pct
+        exits = np.flatnonzero((hit_take_profit | (pnl_pct_low <= -stop_loss_pct)) & in_position)
+        if len(exits):
+            avg = avg_price[exits]
+            exit_price = np.where(
+                hit_take_profit[exits],
+                avg * (1 + take_profit_pct[exits] / 100 * direction),
+                avg * (1 - stop_loss_pct[exits] / 100 * direction),
+            )
+            pnl = position_size[exits] * (exit_price - avg) * direction
+            win = pnl > 0
+            if track_risk:
+                state["realized"][exits] += np.round(pnl, 2)
+            state["take_profit_count"][exits[win]] += 1
+            state["take_profit_amount"][exits[win]] += pnl[win]
+            state["stop_loss_count"][exits[~win]] += 1
+            state["stop_loss_amount"][exits[~win]] += pnl[~win]
+            in_position[exits] = False
+
+        # 開倉：本根K棒開始時空手的參數組以收盤價進場
+        if len(flat):
+            entry_price = prices_close[i]
+            position_size[flat] = (first_amount[flat] * leverage[flat]) / entry_price
+            used_margin[flat] = first_amount[flat]
+            avg_price[flat] = entry_price
+            add_count[flat] = 0
+            last_add_price[flat] = entry_price
+            next_threshold[flat] = add_thresholds[flat, 0]
+            in_position[flat] = True
+            state["max_used_margin"][flat] = np.maximum(state["max_used_margin"][flat], first_amount[flat])
+
+        if track_risk:
+            # 收盤時的權益高點與回撤
+            profit = state["realized"] + np.where(
+                in_position, position_size * (prices_close[i] - avg_price) * direction, 0.0)
+            peak = np.maximum(state["peak_profit"], profit, out=state["peak_profit"])
+            drawdown = peak - profit
+            np.maximum(state["max_drawdown"], drawdown, out=state["max_drawdown"])
+            underwater = state["underwater"]
+            underwater += 1
+            underwater[drawdown <= 0] = 0
+            np.maximum(state["max_underwater"], underwater, out=state["max_underwater"])
+    return state
+
+
+def _batch_stats(state):
+    take_profit_amount = np.round(state["take_profit_amount"], 2)
+    stop_loss_amount = np.round(state["stop_loss_amount"], 2)
+    columns = [
+        take_profit_amount,
+        stop_loss_amount,
+        take_profit_amount + stop_loss_amount,
+        state["take_profit_count"],
+        state["stop_loss_count"],
+        state["max_used_margin"],
+    ]
+    if "realized" in state:
+        columns += [
+            np.round(state["max_drawdown"], 2),
+            state["max_underwater"],
+            np.round(state["worst_floating"], 2),
+            state["liquidation_hits"],
+            np.where(np.isinf(state["min_liq_distance"]), np.nan, np.round(state["min_liq_distance"], 2)),
+        ]
+    return np.column_stack(columns)
+
+
+def _batch_tables(add_pct, leverage, add_multiple, max_add_times, add_amount, add_amount_multiple):
+    """
+    依每組參數建立 (N, K) 加碼觸發幅度與金額表，K 為最大的加碼次數
+    相同 (倍數, 次數) 的參數組共用一份以 Python 次方計算的倍數表，確保浮點數結果與原版一致
+    """
+    n = len(add_pct)
+    width = max(int(max_add_times.max()) if n else 0, 1)
+    add_thresholds = np.full((n, width), np.inf)
+    add_amounts = np.zeros((n, width))
+    for (multiple, times), rows in pd.Series(np.arange(n)).groupby([add_multiple, max_add_times]):
+        times = int(times)
+        multiples = np.array([multiple ** k for k in range(times)], dtype=np.float64)
+        add_thresholds[rows.to_numpy()[:, None], np.arange(times)] = add_pct[rows.to_numpy(), None] * multiples
+    for (multiple, times), rows in pd.Series(np.arange(n)).groupby([add_amount_multiple, max_add_times]):
+        times = int(times)
+        amounts = np.array([add_amount * (multiple ** k) for k in range(times)], dtype=np.float64)
+        add_amounts[rows.to_numpy()[:, None], np.arange(times)] = amounts
+    first_amount = np.full(n, add_amount / 2, dtype=np.float64)
+    return add_thresholds, add_amounts, first_amount
+
+
+def _batch_params(param_grid, **defaults):
+    # param_grid 可為 (N, 3) 陣列，或含 BATCH_PARAM_COLUMNS（及可選 BATCH_OPTIONAL_COLUMNS）欄位的 DataFrame / dict
+    if isinstance(param_grid, (pd.DataFrame, dict)):
+        columns = {name: np.asarray(param_grid[name], dtype=np.float64) for name in BATCH_PARAM_COLUMNS}
+        n = len(columns[BATCH_PARAM_COLUMNS[0]])
+        for name in BATCH_OPTIONAL_COLUMNS:
+            values = param_grid[name] if name in param_grid else defaults[name]
+            columns[name] = np.broadcast_to(np.asarray(values, dtype=np.float64), (n,)).copy()
+    else:
+        param_grid = np.asarray(param_grid, dtype=np.float64).reshape(-1, len(BATCH_PARAM_COLUMNS))
+        columns = dict(zip(BATCH_PARAM_COLUMNS, param_grid.T.copy()))
+        for name in BATCH_OPTIONAL_COLUMNS:
+            columns[name] = np.full(len(param_grid), defaults[name], dtype=np.float64)
+    return columns
+
+
+def martin_backtest_batch(prices_close, prices_high, prices_low, direction,
+                          leverage, add_multiple, max_add_times, add_amount, add_amount_multiple,
+                          param_grid, risk=False, maintenance_margin_rate=MAINTENANCE_MARGIN_RATE,
+                          start=0, checkpoints=None):
+    """
+    一次回測多組參數
+    param_grid: (N, 3) 陣列，欄位順序同 BATCH_PARAM_COLUMNS；
+                或 DataFrame / dict，另可含 BATCH_OPTIONAL_COLUMNS 欄位逐組覆蓋對應的固定參數
+    回傳 (N, 6) 統計矩陣，欄位同 BATCH_STATS_COLUMNS；與逐組呼叫 martin_backtest 的統計結果相同
+    risk=True 時再附加 BATCH_RISK_COLUMNS，成為 (N, 11)
+    start / checkpoints: 從第 start 根K棒空手開始；提供遞增的 checkpoints 時只走訪一次，
+                         回傳每個 checkpoint（不含）為止的統計矩陣清單，共用同一段前綴的區間不必重算
+    """
+    prices_close = np.asarray(prices_close, dtype=np.float64)
+    prices_high = np.asarray(prices_high, dtype=np.float64)
+    prices_low = np.asarray(prices_low, dtype=np.float64)
+    params = _batch_params(param_grid, leverage=leverage, add_multiple=add_multiple,
+                           max_add_times=max_add_times, add_amount_multiple=add_amount_multiple)
+    n = len(params["add_pct"])
+
+    add_thresholds, add_amounts, first_amount = _batch_tables(
+        params["add_pct"], params["leverage"], params["add_multiple"], params["max_add_times"],
+        add_amount, params["add_amount_multiple"])
+    state = _new_batch_state(n, risk)
+    stops = [len(prices_close)] if checkpoints is None else list(checkpoints)
+    results = []
+    for stop in stops:
+        _run_batch(prices_close, prices_high, prices_low, start, stop, direction, params["leverage"],
+                   add_thresholds, add_amounts, first_amount, params["take_profit_pct"],
+                   params["stop_loss_pct"], state, maintenance_margin_rate)
+        results.append(_batch_stats(state))
+        start = stop
+    return results[0] if checkpoints is None else results
@@ -1,6 +1,396 @@
 import itertools
+import json
+import math
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 import numpy as np
-from martin_strategy import martin_backtest
+from cache import fingerprint_arrays
+import pandas as pd
+from martin_strategy import (martin_backtest_batch, BATCH_STATS_COLUMNS, BATCH_RISK_COLUMNS, ACTION_CLOSE,
+                             REASON_TAKE_PROFIT, REASON_STOP_LOSS, REASON_WINDOW_END, equity_curve, force_close,
+                             run_martin_kernel, trades_to_frame)
+
+NET_PROFIT_COL = BATCH_STATS_COLUMNS.index("淨利潤")
+# risk=True 時統計矩陣的欄位
+RISK_STATS_COLUMNS = BATCH_STATS_COLUMNS + BATCH_RISK_COLUMNS
+MAX_DRAWDOWN_COL = RISK_STATS_COLUMNS.index("最大回撤")
+LIQUIDATION_COL = RISK_STATS_COLUMNS.index("觸及爆倉價次數")
+
+# 最佳化目標：名稱 -> 說明；分數越高越好
+OBJECTIVES = {
+    "net_profit": "淨利潤",
+    "profit_over_drawdown": "淨利潤 / 最大回撤",
+    "min_drawdown": "最小化最大回撤",
+}
+
+# 可搜尋的參數軸（依 itertools.product 展開的順序）與最佳結果中的欄名
+SEARCH_AXES = [
+    ("add_pct", "加碼百分比"),
+    ("take_profit_pct", "止盈百分比"),
+    ("stop_loss_pct", "停損百分比"),
+    ("leverage", "槓桿"),
+    ("max_add_times", "最大加碼次數"),
+    ("add_amount_multiple", "加碼金額倍數"),
+    ("add_multiple", "加倉價差倍數"),
+]
+SEARCH_STRATEGIES = ("grid", "coarse_to_fine", "halving")
+
+# 子程序內掛載的共享價格陣列（close, high, low）
+_shared = {}
+
+
+def _stack_prices(prices_close, prices_high, prices_low):
+    return np.stack([
+        np.asarray(prices_close, dtype=np.float64),
+        np.asarray(prices_high, dtype=np.float64),
+        np.asarray(prices_low, dtype=np.float64),
+    ])
+
+
+def _share_prices(prices):
+    # 價格只複製一次到共享記憶體，子程序直接掛載，不需每個任務 pickle
+    shm = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+    np.ndarray(prices.shape, dtype=np.float64, buffer=shm.buf)[:] = prices
+    return shm
+
+
+def _attach_prices(shm_name, shape):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared["shm"] = shm
+    _shared["prices"] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _evaluate_chunk(start, param_table, stop, direction, add_amount, risk=False):
+    # 以前 stop 根K棒回測一個參數區塊，回傳 (起始序號, 統計矩陣)
+    prices_close, prices_high, prices_low = _shared["prices"][:, :stop]
+    stats = martin_backtest_batch(prices_close, prices_high, prices_low, direction,
+                                  leverage=None, add_multiple=None, max_add_times=None,
+                                  add_amount=add_amount, add_amount_multiple=None,
+                                  param_grid=param_table, risk=risk)
+    return start, stats
+
+
+def _evaluate_prefix(key, param_table, start, stops, direction, add_amount, risk=False):
+    # 從第 start 根空手開始只走訪一次，回傳 (key, 各 stop 為止的統計矩陣)；起點相同的訓練區間共用前綴
+    prices_close, prices_high, prices_low = _shared["prices"][:, :stops[-1]]
+    stats = martin_backtest_batch(prices_close, prices_high, prices_low, direction,
+                                  leverage=None, add_multiple=None, max_add_times=None,
+                                  add_amount=add_amount, add_amount_multiple=None,
+                                  param_grid=param_table, risk=risk, start=start, checkpoints=stops)
+    return key, stats
+
+
+def _score(stats, objective, max_drawdown=None, allow_liquidation=True):
+    """
+    依最佳化目標將統計矩陣換算成分數（越高越好）；不符合限制的參數組為 -inf
+    max_drawdown: 最大回撤上限 (USDT)；allow_liquidation=False 時排除曾觸及爆倉價的參數組
+    """
+    net_profit = stats[:, NET_PROFIT_COL]
+    if objective == "net_profit":
+        scores = net_profit.astype(np.float64)
+    elif objective == "profit_over_drawdown":
+        scores = net_profit / np.maximum(stats[:, MAX_DRAWDOWN_COL], 0.01)
+    else:
+        scores = -stats[:, MAX_DRAWDOWN_COL]
+    if max_drawdown is not None:
+        scores = np.where(stats[:, MAX_DRAWDOWN_COL] <= max_drawdown, scores, -np.inf)
+    if not allow_liquidation:
+        scores = np.where(stats[:, LIQUIDATION_COL] == 0, scores, -np.inf)
+    return scores
+
+
+def _is_better(candidate, current):
+    # 分數較高者勝；同分時取序號較小者（與單核依序搜尋的結果相同）
+    if current is None:
+        return True
+    idx, score = candidate
+    best_idx, best_score = current
+    return score > best_score or (score == best_score and idx < best_idx)
+
+
+def _rank(indices, scores):
+    # 依分數由高到低排序，同分時序號小者在前
+    order = np.lexsort((indices, -scores))
+    return indices[order], scores[order]
+
+
+class _Evaluator:
+    """在單一程序或程序池上批次評估搜尋空間中的參數組（以攤平後的序號表示）"""
+
+    def __init__(self, prices, axes, direction, add_amount, workers, chunk_size, progress_callback,
+                 objective="net_profit", max_drawdown=None, allow_liquidation=True, checkpoint=None):
+        self.prices = prices
+        self.axes = axes
+        self.shape = tuple(len(values) for _, values in axes)
+        self.direction = direction
+        self.add_amount = add_amount
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.progress_callback = progress_callback
+        self.objective = objective
+        self.max_drawdown = max_drawdown
+        self.allow_liquidation = allow_liquidation
+        # 淨利以外的目標或限制需要逐K棒的權益與爆倉檢查
+        self.risk = objective != "net_profit" or max_drawdown is not None or not allow_liquidation
+        self.full_stats = {}            # 完整區間回測的序號 -> 統計列
+        self.prefix_stats = {}          # evaluate_prefixes 已完成的 (起點, 終點, 區塊起點) -> 統計矩陣
+        self.checkpoint = checkpoint    # 完整區間統計的存檔目錄，中斷後重新執行時略過已完成的參數組
+        self.restored = 0               # 本次執行由 checkpoint 還原、不需重算的評估數
+        self.restorable = set()         # checkpoint 載入、尚未被本次執行用到的完整區間序號
+        self.done = 0
+        self.planned = 0
+        self.full_runs = 0
+        self.partial_runs = 0
+        self.bar_evaluations = 0
+        self.pool = None
+        self.shm = None
+
+    def _signature(self):
+        # 資料、搜尋空間或統計欄位不同時，舊的 checkpoint 不可沿用
+        return json.dumps([fingerprint_arrays(self.prices), self.axes, self.direction, self.add_amount, self.risk],
+                          default=float)
+
+    def _load_checkpoint(self):
+        # checkpoint 為目錄：signature.json 加上每個完成區塊各一個檔案，存檔只寫新完成的區塊
+        self._checkpoint_ready = False
+        if self.checkpoint is None or not os.path.isdir(self.checkpoint):
+            return
+        try:
+            with open(os.path.join(self.checkpoint, "signature.json")) as f:
+                if f.read() != self._signature():
+                    return
+        except FileNotFoundError:
+            return
+        for name in sorted(os.listdir(self.checkpoint)):
+            if not name.endswith(".npz"):
+                continue
+            with np.load(os.path.join(self.checkpoint, name)) as data:
+                if name.startswith("full-"):
+                    self.full_stats.update(zip(data["indices"].tolist(), data["stats"]))
+                else:
+                    start, chunk_start = data["key"].tolist()
+                    for stop, stats in zip(data["stops"].tolist(), data["stats"]):
+                        self.prefix_stats[(start, stop, chunk_start)] = stats
+        self.restorable = set(self.full_stats)
+        self._checkpoint_ready = True
+
+    def _save_checkpoint(self, name, **arrays):
+        """寫入一個完成的區塊：先寫暫存檔再原子替換，中斷時最多遺失這個區塊"""
+        if not self._checkpoint_ready:
+            # 舊的 checkpoint 與這次的資料或搜尋空間不同（或為舊版單一 .npz 檔），整份捨棄
+            if os.path.isdir(self.checkpoint):
+                shutil.rmtree(self.checkpoint)
+            elif os.path.exists(self.checkpoint):
+                os.remove(self.checkpoint)
+            os.makedirs(self.checkpoint)
+            with open(os.path.join(self.checkpoint, "signature.json"), "w") as f:
+                f.write(self._signature())
+            self._checkpoint_ready = True
+        path = os.path.join(self.checkpoint, name)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+
+    def __enter__(self):
+        self._load_checkpoint()
+        if self.workers == 1:
+            _shared["prices"] = self.prices
+        else:
+            self.shm = _share_prices(self.prices)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_attach_prices,
+                                            initargs=(self.shm.name, self.prices.shape))
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.shm.close()
+            self.shm.unlink()
+        else:
+            _shared.clear()
+
+    def param_table(self, indices):
+        coords = np.unravel_index(indices, self.shape)
+        return {name: np.asarray(values, dtype=np.float64)[coord] for (name, values), coord in zip(self.axes, coords)}
+
+    def evaluate(self, indices, stop=None):
+        n_bars = self.prices.shape[1]
+        stop = n_bars if stop is None else min(stop, n_bars)
+        indices = np.asarray(indices, dtype=np.int64)
+        full = stop == n_bars
+        width = len(RISK_STATS_COLUMNS) if self.risk else len(BATCH_STATS_COLUMNS)
+        stats = np.empty((len(indices), width))
+        # 已有完整區間統計（checkpoint 載入）的參數組不需重算
+        todo = np.arange(len(indices))
+        if full and self.full_stats:
+            known = np.array([idx in self.full_stats for idx in indices.tolist()], dtype=bool)
+            if known.any():
+                stats[known] = [self.full_stats[idx] for idx in indices[known].tolist()]
+                todo = np.flatnonzero(~known)
+                # 本次執行稍早算過的參數組也在 full_stats 中，只計入 checkpoint 載入的部分
+                restored = self.restorable.intersection(indices[known].tolist())
+                self.restored += len(restored)
+                self.restorable -= restored
+        total = len(todo)
+        if full:
+            self.full_runs += total
+        else:
+            self.partial_runs += total
+        self.bar_evaluations += total * stop
+        self.planned += total
+
+        chunk_size = self.chunk_size
+        if chunk_size is None:
+            # 批次回測每根K棒有固定開銷，區塊越大越有效率；需回報進度或存 checkpoint 時再切細
+            n_chunks = self.workers * 4 if self.progress_callback is not None or self.checkpoint else self.workers
+            chunk_size = max(math.ceil(total / n_chunks), 1)
+        chunks = [(start, self.param_table(indices[todo[start:start + chunk_size]]))
+                  for start in range(0, total, chunk_size)]
+
+        def collect(result):
+            start, chunk_stats = result
+            positions = todo[start:start + len(chunk_stats)]
+            stats[positions] = chunk_stats
+            if full and self.checkpoint is not None:
+                self.full_stats.update(zip(indices[positions].tolist(), chunk_stats))
+                self._save_checkpoint(f"full-{indices[positions[0]]}.npz", indices=indices[positions],
+                                      stats=chunk_stats)
+            self.done += len(chunk_stats)
+            if self.progress_callback is not None:
+                self.progress_callback(self.done, self.planned)
+
+        if self.pool is None:
+            for start, table in chunks:
+                collect(_evaluate_chunk(start, table, stop, self.direction, self.add_amount, self.risk))
+        else:
+            futures = [self.pool.submit(_evaluate_chunk, start, table, stop, self.direction, self.add_amount,
+                                        self.risk)
+                       for start, table in chunks]
+            # 依完成順序即時收集各區塊結果
+            for future in as_completed(futures):
+                collect(future.result())
+        if full:
+            self.full_stats.update(zip(indices.tolist(), stats))
+        return _score(stats, self.objective, self.max_drawdown, self.allow_liquidation)
+
+    def evaluate_prefixes(self, prefixes):
+        """
+        prefixes: {起點: [遞增的終點, ...]}，評估整個搜尋空間在每個 [起點, 終點) 區間的統計
+        回傳 {(起點, 終點): 統計矩陣}；同一起點只走訪一次，參數組再切塊分給各程序
+        有 checkpoint 時每完成一個區塊即存檔，重新執行時略過已完成的區塊
+        """
+        indices = np.arange(math.prod(self.shape))
+        total = len(indices)
+        n_chunks = max(math.ceil(self.workers / max(len(prefixes), 1)), 1)
+        if self.checkpoint is not None:
+            n_chunks = max(n_chunks, 4)
+        chunk_size = max(math.ceil(total / n_chunks), 1)
+        width = len(RISK_STATS_COLUMNS) if self.risk else len(BATCH_STATS_COLUMNS)
+        results = {(start, stop): np.empty((total, width)) for start, stops in prefixes.items() for stop in stops}
+
+        def fill(start, chunk_start, stats_list):
+            for stop, stats in zip(sorted(prefixes[start]), stats_list):
+                results[(start, stop)][chunk_start:chunk_start + len(stats)] = stats
+
+        tasks = []
+        for start, stops in prefixes.items():
+            for chunk_start in range(0, total, chunk_size):
+                length = min(chunk_size, total - chunk_start)
+                saved = [self.prefix_stats.get((start, stop, chunk_start)) for stop in sorted(stops)]
+                if all(stats is not None and len(stats) == length for stats in saved):
+                    fill(start, chunk_start, saved)
+                    self.restored += length
+                    continue
+                tasks.append(((start, chunk_start), self.param_table(indices[chunk_start:chunk_start + length]),
+                              start, sorted(stops)))
+        self.planned += len(tasks)
+
+        def collect(result):
+            (start, chunk_start), stats_list = result
+            fill(start, chunk_start, stats_list)
+            if self.checkpoint is not None:
+                stops = sorted(prefixes[start])
+                for stop, stats in zip(stops, stats_list):
+                    self.prefix_stats[(start, stop, chunk_start)] = stats
+                self._save_checkpoint(f"prefix-{start}-{chunk_start}.npz", key=np.array([start, chunk_start]),
+                                      stops=np.array(stops), stats=np.stack(stats_list))
+            self.done += 1
+            if self.progress_callback is not None:
+                self.progress_callback(self.done, self.planned)
+
+        if self.pool is None:
+            for key, table, start, stops in tasks:
+                collect(_evaluate_prefix(key, table, start, stops, self.direction, self.add_amount, self.risk))
+        else:
+            futures = [self.pool.submit(_evaluate_prefix, key, table, start, stops, self.direction,
+                                        self.add_amount, self.risk)
+                       for key, table, start, stops in tasks]
+            for future in as_completed(futures):
+                collect(future.result())
+        self.bar_evaluations += sum(len(table["add_pct"]) * (max(stops) - start) for _, table, start, stops in tasks)
+        return results
+
+
+def _search_grid(evaluator):
+    indices = np.arange(math.prod(evaluator.shape))
+    return indices, evaluator.evaluate(indices)
+
+
+def _search_coarse_to_fine(evaluator, top_k, coarse_step):
+    # 先以間隔 coarse_step 的粗網格評估，再於前 top_k 名附近逐步縮小間隔細化
+    shape = evaluator.shape
+    evaluated = {}
+
+    def run(cells):
+        new = sorted({int(np.ravel_multi_index(cell, shape)) for cell in cells} - evaluated.keys())
+        if new:
+            evaluated.update(zip(new, evaluator.evaluate(new).tolist()))
+
+    coarse_axes = [sorted(set(range(0, size, coarse_step)) | {size - 1}) for size in shape]
+    run(itertools.product(*coarse_axes))
+
+    step = coarse_step
+    while step > 1:
+        step = max(step // 2, 1)
+        indices, _ = _rank(np.array(list(evaluated)), np.array(list(evaluated.values())))
+        cells = []
+        for idx in indices[:top_k]:
+            center = np.unravel_index(idx, shape)
+            neighbors = [[c + d for d in (-step, 0, step) if 0 <= c + d < size] for c, size in zip(center, shape)]
+            cells.extend(itertools.product(*neighbors))
+        run(cells)
+
+    return np.array(list(evaluated)), np.array(list(evaluated.values()))
+
+
+def _search_halving(evaluator, eta, min_bars, top_k):
+    # 逐輪以較短的歷史前段淘汰表現差的參數組，只有存活者才回測完整區間
+    n_bars = evaluator.prices.shape[1]
+    candidates = np.arange(math.prod(evaluator.shape))
+    rounds = 0
+    while len(candidates) // eta ** (rounds + 1) >= top_k and n_bars // eta ** (rounds + 1) >= min_bars:
+        rounds += 1
+
+    for r in range(rounds, 0, -1):
+        scores = evaluator.evaluate(candidates, stop=n_bars // eta ** r)
+        keep = max(math.ceil(len(candidates) / eta), top_k)
+        candidates = np.sort(_rank(candidates, scores)[0][:keep])
+    return candidates, evaluator.evaluate(candidates)
+
+
+def default_search_space(leverage=10, max_add_times=7, add_amount_multiple=2, add_multiple=1.0):
+    return {
+        "add_pct": list(np.arange(1.0, 4.1, 0.1)),            # 1% ~ 4%
+        "take_profit_pct": list(np.arange(1.0, 4.1, 0.1)),    # 1% ~ 4%
+        "stop_loss_pct": list(np.arange(1, 11, 1)),           # 1% ~ 10%
+        "leverage": [leverage],
+        "max_add_times": [int(max_add_times)],
+        "add_amount_multiple": [add_amount_multiple],
+        "add_multiple": [add_multiple],
+    }
+
 
 def optimize_martingale(
     prices_close, prices_high, prices_low, times,   # << 必須傳入的歷史K棒資料
@@ -10,46 +400,239 @@ def optimize_martingale(
     leverage = 10,                                  #槓桿
     max_add_times = 7,                               #最大加碼次數
     add_amount_multiple = 2 ,                       #加碼金額倍數
+    workers = 1,                                    #平行運算的程序數
+    chunk_size = None,                              #每個任務的參數組數
+    progress_callback = None,                       #progress_callback(已完成組數, 目前預計組數)
+    search_space = None,                            #{參數名: 候選值清單}，未提供的軸使用上面的固定值
+    strategy = "grid",                              #grid 全搜尋 / coarse_to_fine 粗到細 / halving 逐輪淘汰
+    top_k = 5,                                      #coarse_to_fine 細化的名次數、halving 最少存活數
+    coarse_step = 4,                                #coarse_to_fine 粗網格的間隔
+    halving_eta = 3,                                #halving 每輪保留 1/eta
+    halving_min_bars = 500,                         #halving 最短的歷史前段長度
+    return_report = False,                          #True 時回傳 (best_params, 搜尋報告)
+    objective = "net_profit",                       #最佳化目標，見 OBJECTIVES
+    max_drawdown = None,                            #最大回撤上限 (USDT)，超過者不列入
+    allow_liquidation = True,                       #False 時排除曾觸及爆倉價的參數組
+    checkpoint = None,                              #checkpoint 目錄，中斷後以相同參數重新執行即從中斷處繼續
 ):
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"未知的搜尋策略：{strategy}，可用：{SEARCH_STRATEGIES}")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"未知的最佳化目標：{objective}，可用：{tuple(OBJECTIVES)}")
+
     # ===== 搜尋空間 =====
-    add_pct_list = list(np.arange(1.0, 4.1, 0.1))         # 1% ~ 10%
-    take_profit_pct_list = list(np.arange(1.0, 4.1, 0.1)) # 1% ~ 10%
-    stop_loss_pct_list = list(np.arange(1, 11, 1))   # 1% ~ 10%
+    space = default_search_space(leverage, max_add_times, add_amount_multiple, add_multiple)
+    space.update(search_space or {})
+    axes = [(name, list(space[name])) for name, _ in SEARCH_AXES]
     # ===========================================================
 
-    best_params = None
-    best_profit = -float("inf")
-
-    for add_pct,take_profit_pct, stop_loss_pct in itertools.product(
-        add_pct_list,take_profit_pct_list, stop_loss_pct_list
-    ):
-        # martin_backtest 會回傳 (df_trades, df_stats)
-        _, df_stats = martin_backtest(
-            prices_close, prices_high, prices_low, times, direction,
-            initial_balance=initial_balance,
-            leverage=leverage,
-            add_pct=add_pct,
-            add_multiple=add_multiple,
-            max_add_times=int(max_add_times),
-            add_amount=add_amount,
-            add_amount_multiple=add_amount_multiple,
-            take_profit_pct=take_profit_pct,
-            stop_loss_pct=stop_loss_pct
-        )
-
-        # 取出止盈/停損累計金額
-        total_take_profit = float(df_stats.loc["止盈累計金額", "數值"])
-        total_stop_loss = float(df_stats.loc["停損累計金額", "數值"])
-        # 你的 backtest 把虧損累加為「負數」，因此淨利 = 止盈累計 + 停損累計
-        net_profit = total_take_profit + total_stop_loss
-
-        if net_profit > best_profit:
-            best_profit = net_profit
-            best_params = {
-                "加碼百分比": add_pct,
-                "止盈百分比": float(take_profit_pct),
-                "停損百分比": float(stop_loss_pct),
-                "淨利潤": float(net_profit),
-            }
-
-    return best_params
+    prices = _stack_prices(prices_close, prices_high, prices_low)
+    workers = max(int(workers), 1)
+    with _Evaluator(prices, axes, direction, add_amount, workers, chunk_size, progress_callback,
+                    objective, max_drawdown, allow_liquidation, checkpoint) as evaluator:
+        if strategy == "grid":
+            indices, scores = _search_grid(evaluator)
+        elif strategy == "coarse_to_fine":
+            indices, scores = _search_coarse_to_fine(evaluator, top_k, coarse_step)
+        else:
+            indices, scores = _search_halving(evaluator, halving_eta, halving_min_bars, top_k)
+
+    # 淨利 = 止盈累計 + 停損累計（虧損累加為負數）
+    best = None
+    for idx, score in zip(indices.tolist(), scores.tolist()):
+        if _is_better((idx, score), best):
+            best = (idx, score)
+    best_idx, best_score = best
+    best_stats = evaluator.full_stats[best_idx]
+    coords = np.unravel_index(best_idx, evaluator.shape)
+    values = {name: axis_values[coord] for (name, axis_values), coord in zip(axes, coords)}
+
+    best_params = {
+        "加碼百分比": values["add_pct"],
+        "止盈百分比": float(values["take_profit_pct"]),
+        "停損百分比": float(values["stop_loss_pct"]),
+    }
+    # 額外被搜尋的軸也列出最佳值
+    for name, label in SEARCH_AXES[3:]:
+        if len(space[name]) > 1:
+            best_params[label] = float(values[name])
+    best_params["淨利潤"] = float(best_stats[NET_PROFIT_COL])
+    if evaluator.risk:
+        best_params["最大回撤"] = float(best_stats[MAX_DRAWDOWN_COL])
+        best_params["觸及爆倉價次數"] = int(best_stats[LIQUIDATION_COL])
+        best_params["最佳化目標"] = OBJECTIVES[objective]
+        best_params["符合限制"] = bool(np.isfinite(best_score))
+
+    if not return_report:
+        return best_params
+    space_size = math.prod(evaluator.shape)
+    report = {
+        "搜尋策略": strategy,
+        "搜尋空間大小": space_size,
+        "完整回測次數": evaluator.full_runs,
+        "部分回測次數": evaluator.partial_runs,
+        # 只比較本次執行需要處理的部分（扣除由 checkpoint 還原的參數組）
+        "節省完整回測次數": max(space_size - evaluator.restored - evaluator.full_runs, 0),
+        "等效完整回測次數": round(evaluator.bar_evaluations / prices.shape[1], 1) if prices.shape[1] else 0.0,
+    }
+    if checkpoint is not None:
+        report["從檢查點還原"] = evaluator.restored
+    return best_params, report
+
+
+WALK_FORWARD_STATS_INDEX = ["窗口數", "樣本外淨利潤", "樣本外止盈次數", "樣本外停損次數", "窗口結束平倉次數",
+                            "獲利窗口比例 (%)", "樣本外最大回撤 (USDT)", "樣本內每K棒淨利", "樣本外每K棒淨利",
+                            "Walk-forward 效率 (%)", "期末餘額"]
+
+
+def walk_forward_windows(n_bars, train_bars, test_bars, step=None, anchored=False):
+    """
+    切出 walk-forward 窗口 [(訓練起點, 訓練終點 = 測試起點, 測試終點), ...]
+    step 預設等於 test_bars，各測試區間首尾相接；anchored=True 時訓練區間一律從第 0 根開始（擴張視窗）
+    step < test_bars 時測試區間截到下一個窗口的測試起點，樣本外各段互不重疊、依時間排列；
+    step > test_bars 時相鄰測試區間之間的K棒不屬於任何測試區間
+    """
+    step = test_bars if step is None else step
+    if train_bars <= 0 or test_bars <= 0 or step <= 0:
+        raise ValueError("train_bars、test_bars 與 step 必須為正整數")
+    windows = []
+    train_stop = train_bars
+    while train_stop < n_bars:
+        windows.append((0 if anchored else train_stop - train_bars, train_stop,
+                        min(train_stop + min(test_bars, step), n_bars)))
+        train_stop += step
+    return windows
+
+
+def walk_forward_optimize(
+    prices_close, prices_high, prices_low, times,
+    initial_balance, add_amount,
+    train_bars, test_bars,                          # 訓練 / 測試區間的K棒數
+    step = None,                                    # 窗口前進的K棒數，預設等於 test_bars
+    anchored = False,                               # True 時訓練區間從第 0 根開始擴張
+    add_multiple = 1.0,
+    direction = 1,
+    leverage = 10,
+    max_add_times = 7,
+    add_amount_multiple = 2,
+    workers = 1,
+    progress_callback = None,
+    search_space = None,
+    objective = "net_profit",
+    max_drawdown = None,
+    allow_liquidation = True,
+    checkpoint = None,                              # checkpoint 目錄，中斷後重新執行時略過已完成的訓練區塊
+):
+    """
+    Walk-forward 最佳化：每個訓練區間以完整網格找出最佳參數，套用到緊接在後、未參與最佳化的測試區間
+    訓練起點相同的窗口（anchored 擴張視窗）共用同一段前綴，整個搜尋空間只需走訪一次；
+    不同起點的窗口彼此獨立，與參數區塊一起分給程序池平行計算
+    每個測試區間從空手開始，區間結束時仍未平倉的持倉以最後一根收盤價平倉（結束原因「窗口結束」）
+    回傳 (樣本外交易紀錄, 各窗口明細, 樣本外統計)
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"未知的最佳化目標：{objective}，可用：{tuple(OBJECTIVES)}")
+    space = default_search_space(leverage, max_add_times, add_amount_multiple, add_multiple)
+    space.update(search_space or {})
+    axes = [(name, list(space[name])) for name, _ in SEARCH_AXES]
+
+    prices = _stack_prices(prices_close, prices_high, prices_low)
+    n_bars = prices.shape[1]
+    windows = walk_forward_windows(n_bars, train_bars, test_bars, step, anchored)
+    if not windows:
+        raise ValueError(f"K棒數 {n_bars} 不足以切出訓練 {train_bars} 根的 walk-forward 窗口")
+    prefixes = {}
+    for train_start, train_stop, _ in windows:
+        prefixes.setdefault(train_start, set()).add(train_stop)
+
+    workers = max(int(workers), 1)
+    with _Evaluator(prices, axes, direction, add_amount, workers, None, progress_callback,
+                    objective, max_drawdown, allow_liquidation, checkpoint) as evaluator:
+        train_stats = evaluator.evaluate_prefixes(prefixes)
+
+    indices = np.arange(math.prod(evaluator.shape))
+    labels = dict(SEARCH_AXES)
+    searched = [name for name, values in axes if len(values) > 1]
+    logs, rows = [], []
+    in_sample_profit = in_sample_bars = 0.0
+    for w, (train_start, train_stop, test_stop) in enumerate(windows, start=1):
+        stats = train_stats[(train_start, train_stop)]
+        scores = _score(stats, objective, max_drawdown, allow_liquidation)
+        best_idx = _rank(indices, scores)[0][0]
+        values = evaluator.param_table(np.array([best_idx]))
+        values = {name: float(v[0]) for name, v in values.items()}
+
+        log, state = run_martin_kernel(
+            prices[0, train_stop:test_stop], prices[1, train_stop:test_stop], prices[2, train_stop:test_stop],
+            direction, values["leverage"], values["add_pct"], values["add_multiple"], values["max_add_times"],
+            add_amount, values["add_amount_multiple"], values["take_profit_pct"], values["stop_loss_pct"])
+        log = np.concatenate([log, force_close(state, test_stop - train_stop - 1,
+                                               prices[0, test_stop - 1], direction)])
+        log["bar"] += train_stop
+        logs.append((w, log))
+
+        closed = log[log["action"] == ACTION_CLOSE]
+        oos_profit = float(np.round(closed["pnl"], 2).sum())
+        in_sample = float(stats[best_idx, NET_PROFIT_COL])
+        in_sample_profit += in_sample
+        in_sample_bars += train_stop - train_start
+        row = {
+            "窗口": w,
+            "訓練開始": times[train_start], "訓練結束": times[train_stop - 1],
+            "測試開始": times[train_stop], "測試結束": times[test_stop - 1],
+        }
+        row.update({labels[name]: values[name] for name in searched})
+        row["樣本內淨利潤"] = in_sample
+        if evaluator.risk:
+            row["樣本內目標值"] = float(scores[best_idx])
+        row["樣本外淨利潤"] = oos_profit
+        row["樣本外平倉次數"] = len(closed)
+        row["窗口結束平倉"] = bool((closed["reason"] == REASON_WINDOW_END).any())
+        rows.append(row)
+
+    # 串接所有測試區間的交易紀錄
+    window_ids = np.concatenate([np.full(len(log), w) for w, log in logs])
+    log = np.concatenate([log for _, log in logs])
+    df_trades, final_balance = trades_to_frame(log, times, initial_balance)
+    df_trades["窗口"] = window_ids
+
+    oos_start = windows[0][1]
+    oos_log = log.copy()
+    oos_log["bar"] -= oos_start
+    _, risk = equity_curve(oos_log, prices[0, oos_start:], prices[1, oos_start:], prices[2, oos_start:],
+                           direction, initial_balance)
+    closed = log[log["action"] == ACTION_CLOSE]
+    df_windows = pd.DataFrame(rows).set_index("窗口")
+    oos_profit = float(df_windows["樣本外淨利潤"].sum())
+    oos_bars = sum(test_stop - train_stop for _, train_stop, test_stop in windows)
+    in_sample_per_bar = in_sample_profit / in_sample_bars
+    oos_per_bar = oos_profit / oos_bars
+    df_stats = pd.DataFrame({
+        "指標": WALK_FORWARD_STATS_INDEX,
+        "數值": [
+            len(windows),
+            round(oos_profit, 2),
+            int((closed["reason"] == REASON_TAKE_PROFIT).sum()),
+            int((closed["reason"] == REASON_STOP_LOSS).sum()),
+            int((closed["reason"] == REASON_WINDOW_END).sum()),
+            round(float((df_windows["樣本外淨利潤"] > 0).mean() * 100), 2),
+            risk["最大回撤 (USDT)"],
+            round(in_sample_per_bar, 4),
+            round(oos_per_bar, 4),
+            round(oos_per_bar / in_sample_per_bar * 100, 2) if in_sample_per_bar > 0 else np.nan,
+            round(final_balance, 2),
+        ],
+    }).set_index("指標")
+    return df_trades, df_windows, df_stats
+
+
+if __name__ == "__main__":
+    from bar_store import load_bars
+
+    df = load_bars("ETH每小時Ｋ棒.csv")
+    best_params, report = optimize_martingale(
+        df["收盤"].values, df["最高"].values, df["最低"].values, df["時間"].values,
+        initial_balance=1000, add_amount=100, workers=os.cpu_count() or 1, return_report=True,
+    )
+    print(best_params)
+    print(report)
@@ -0,0 +1,172 @@
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import os
+import pstats
+import tempfile
+import time
+from collections import deque
+
+import pandas as pd
+
+# 目前這次執行使用的記錄器；Streamlit 每個 session 在各自的執行緒重跑，以 ContextVar 互不干擾
+_current = contextvars.ContextVar("perf_recorder", default=None)
+
+
+class _NullStage:
+    """停用時共用的空量測，可照常設定 rows"""
+
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullStage()
+
+
+def _rss_bytes():
+    # Linux 直接讀 /proc，成本只有一次小檔案讀取；其他平台不記錄記憶體變化
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _Stage:
+    """單一階段的量測；rows 可在 with 區塊內設定（例如載入後才知道K棒數）"""
+
+    __slots__ = ("recorder", "name", "rows", "start", "rss")
+
+    def __init__(self, recorder, name, rows):
+        self.recorder = recorder
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.rss = _rss_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        rss = _rss_bytes()
+        delta = rss - self.rss if rss is not None and self.rss is not None else None
+        self.recorder.records.append((self.name, elapsed, self.rows, delta))
+        return False
+
+
+class Recorder:
+    """
+    記錄每次重跑各階段的耗時、處理筆數與記憶體（RSS）變化，保留最近 history_size 次
+    enabled=False 時 stage() / timed() 只多一次查詢，不做任何量測
+    """
+
+    def __init__(self, history_size=50):
+        self.enabled = True
+        self.records = []
+        self.history = deque(maxlen=history_size)
+        self.profile_stats = None   # 上次 cProfile 的 .prof 位元組
+        self.profile_text = None
+        self._profiler = None
+
+    def begin(self, profile=False):
+        """開始一次重跑的量測，並設為目前執行緒的記錄器"""
+        self.records = []
+        _current.set(self if self.enabled else None)
+        if profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def end(self):
+        """結束這次量測，回傳這次的各階段結果"""
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.profile_stats, self.profile_text = _dump_profile(self._profiler)
+            self._profiler = None
+        _current.set(None)
+        if self.records:
+            # 同名階段（例如多張圖的 Plotly 序列化）合計
+            totals = {}
+            for name, elapsed, _, _ in self.records:
+                totals[name] = totals.get(name, 0.0) + elapsed
+            self.history.append(totals)
+        return self.last_run()
+
+    @contextlib.contextmanager
+    def fragment(self):
+        """
+        st.fragment 單獨重跑時整頁的 begin() / end() 不會執行，在 fragment 內另外記一次量測
+        整頁重跑中呼叫 fragment 時已有量測進行中，直接沿用
+        """
+        if _current.get() is not None:
+            yield self
+            return
+        self.begin()
+        try:
+            yield self
+        finally:
+            self.end()
+
+    def last_run(self):
+        df = pd.DataFrame(self.records, columns=["階段", "耗時 (ms)", "筆數", "記憶體變化 (MB)"])
+        df["耗時 (ms)"] = df["耗時 (ms)"] * 1000
+        df["記憶體變化 (MB)"] = df["記憶體變化 (MB)"].astype(float) / 2**20
+        return df.set_index("階段")
+
+    def history_frame(self):
+        """每列一次重跑、每欄一個階段的耗時 (ms)"""
+        return pd.DataFrame(list(self.history)) * 1000
+
+
+def _dump_profile(profiler, top=30):
+    with tempfile.NamedTemporaryFile(suffix=".prof", delete=False) as f:
+        path = f.name
+    try:
+        profiler.dump_stats(path)
+        with open(path, "rb") as f:
+            data = f.read()
+    finally:
+        os.remove(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+    return data, out.getvalue()
+
+
+def stage(name, rows=None):
+    """
+    量測一段程式：with perf.stage("calculate_zigzag", rows=len(bars)): ...
+    沒有啟用中的記錄器時回傳共用的空量測物件，不做任何量測
+    """
+    recorder = _current.get()
+    if recorder is None:
+        return _NULL
+    return _Stage(recorder, name, rows)
+
+
+def timed(name=None, rows=None):
+    """
+    函式版的 stage：@perf.timed("載入資料")
+    rows 可為函式，對回傳值計算筆數（例如 rows=len）
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _current.get()
+            if recorder is None:
+                return func(*args, **kwargs)
+            with _Stage(recorder, label, None) as s:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    s.rows = rows(result)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,129 @@
+import os
+import numpy as np
+import pandas as pd
+
+import bar_store
+from bar_store import BarStore, FIELDS
+from cache import fingerprint_arrays
+
+# 可選的K棒週期（奈秒）
+TIMEFRAMES = {
+    "15m": 15 * 60 * 10**9,
+    "1h": 3600 * 10**9,
+    "4h": 4 * 3600 * 10**9,
+    "1d": 86400 * 10**9,
+}
+# 判斷合併週期是否需重建時，比對基礎K棒尾端的根數
+BASE_TAIL_ROWS = 1024
+
+
+def timeframe_ns(timeframe):
+    unit = {"m": 60, "h": 3600, "d": 86400, "w": 604800}[timeframe[-1]]
+    return int(timeframe[:-1]) * unit * 10**9
+
+
+def resample_arrays(arrays, tf_ns):
+    """
+    將依時間排序的K棒欄位陣列合併成 tf_ns 週期：開盤取第一根、收盤取最後一根、最高/最低取極值、成交量加總
+    時間對齊到 UTC 的週期起點（與交易所K棒相同）；最後一個週期可能尚未走完
+    """
+    times = arrays["時間"]
+    if len(times) == 0:
+        return {col: np.empty(0, dtype=dtype) for col, (_, dtype) in FIELDS.items()}
+    buckets = times // tf_ns * tf_ns
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(times)] - 1
+    return {
+        "時間": buckets[starts],
+        "開盤": arrays["開盤"][starts],
+        "最高": np.maximum.reduceat(arrays["最高"], starts),
+        "最低": np.minimum.reduceat(arrays["最低"], starts),
+        "收盤": arrays["收盤"][ends],
+        "成交量": np.add.reduceat(arrays["成交量"], starts),
+    }
+
+
+def base_timeframe(filename):
+    """二進位儲存記錄的基礎週期；舊資料沒有記錄時由K棒間隔的眾數推斷"""
+    meta = bar_store.read_meta(bar_store.store_path(filename)) or {}
+    if meta.get("timeframe"):
+        return meta["timeframe"]
+    times = BarStore.open(filename).arrays["時間"][:1000]
+    if len(times) < 2:
+        return None
+    step = pd.Series(np.diff(times)).mode().iloc[0]
+    for name, ns in TIMEFRAMES.items():
+        if ns == step:
+            return name
+    return None
+
+
+def available_timeframes(filename):
+    """可由基礎週期合併出來的週期（含基礎週期本身）"""
+    base = base_timeframe(filename)
+    if base is None:
+        return [name for name in TIMEFRAMES]
+    base_ns = timeframe_ns(base)
+    return [name for name, ns in TIMEFRAMES.items() if ns >= base_ns and ns % base_ns == 0]
+
+
+def _aggregate_path(filename, timeframe):
+    return os.path.join(bar_store.store_path(filename), timeframe)
+
+
+def _base_tail(base, rows):
+    # 前 rows 根基礎K棒最後 BASE_TAIL_ROWS 根的內容指紋，尾端資料被修正時重建
+    start = max(rows - BASE_TAIL_ROWS, 0)
+    return fingerprint_arrays(*(base.arrays[col][start:rows] for col in FIELDS))
+
+
+def update_aggregate(filename, timeframe):
+    """
+    將基礎K棒合併成 timeframe 週期並存成二進位欄位檔，回傳目錄路徑
+    只重新合併上次以後新增的基礎K棒：重算最後一個（可能未走完的）週期後接在既有結果後面
+    基礎資料整份重新轉換（generation 改變）或尾端內容與上次不同時整份重建
+    寫入一律經 replace_columns 換上新目錄，不改寫其他程序仍以 memory map 開啟的檔案
+    """
+    base = BarStore.open(filename)
+    base_times = base.arrays["時間"]
+    path = _aggregate_path(filename, timeframe)
+    tf_ns = timeframe_ns(timeframe)
+    meta = bar_store.read_meta(path)
+    generation = bar_store.read_meta(bar_store.store_path(filename)).get("generation")
+
+    rebuild = (
+        meta is None or meta.get("base_rows", 0) > len(base)
+        or meta.get("base_rows", 0) == 0 or meta["rows"] == 0
+        or meta.get("base_generation") != generation
+        or meta.get("base_tail") != _base_tail(base, meta["base_rows"])
+    )
+    base_meta = {"timeframe": timeframe, "base_rows": len(base), "base_generation": generation,
+                 "base_tail": _base_tail(base, len(base))}
+    if rebuild:
+        aggregated = resample_arrays(base.arrays, tf_ns)
+        bar_store.replace_columns(path, aggregated, {"rows": len(aggregated["時間"]), **base_meta})
+        return path
+    if meta["base_rows"] == len(base):
+        return path
+    # 從最後一個已合併週期的起點重新合併，取代原本的最後一根
+    previous = bar_store.read_columns(path, meta["rows"], mmap=False)
+    i = int(np.searchsorted(base_times, previous["時間"][-1], side="left"))
+    tail = resample_arrays(base[i:].arrays, tf_ns)
+    aggregated = {col: np.concatenate([previous[col][:-1], tail[col]]) for col in FIELDS}
+    bar_store.replace_columns(path, aggregated, {"rows": len(aggregated["時間"]), **base_meta})
+    return path
+
+
+def open_timeframe(filename, timeframe=None):
+    """
+    以 BarStore 開啟指定週期的K棒；timeframe 為 None 或等於基礎週期時直接開啟基礎資料
+    較長的週期由 update_aggregate 增量維護，切換週期不需重新 resample 整份資料
+    """
+    base = base_timeframe(filename)
+    if timeframe is None or timeframe == base:
+        return BarStore.open(filename)
+    if base is not None and timeframe not in available_timeframes(filename):
+        raise ValueError(f"無法由 {base} K棒合併出 {timeframe} K棒")
+    path = update_aggregate(filename, timeframe)
+    rows = bar_store.read_meta(path)["rows"]
+    return BarStore({col: np.asarray(arr) for col, arr in bar_store.read_columns(path, rows).items()})
@@ -0,0 +1,183 @@
+"""
+蒙地卡羅穩健度測試：以區塊拔靴法（block bootstrap）重抽歷史K棒的報酬，產生大量模擬價格路徑，
+在每條路徑上執行馬丁策略回測，統計淨利潤、最大回撤與連續停損次數的分佈
+
+    python robustness.py --paths 10000 --bars 8760 --block 24 --workers 8
+"""
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from martin_strategy import (ACTION_CLOSE, REASON_STOP_LOSS, STATE_STOP_LOSS_AMOUNT, STATE_TAKE_PROFIT_AMOUNT,
+                             _longest_run, equity_curve, run_martin_kernel)
+from resample import base_timeframe, timeframe_ns
+
+PATH_COLUMNS = ["淨利潤", "最大回撤 (USDT)", "最長連續停損", "停損次數", "觸及爆倉價次數", "最低權益", "破產"]
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+YEAR_NS = 365 * 86400 * 10**9
+
+# 子程序內的相對報酬表（由 _init_worker 設定）
+_source = {}
+
+
+def bars_per_year(timeframe):
+    """timeframe 週期（如 "1h" / "4h" / "1d"）一年的K棒數；None 時視為 1h"""
+    return round(YEAR_NS / timeframe_ns(timeframe or "1h"))
+
+
+def relative_bars(prices_close, prices_high, prices_low):
+    """
+    每根K棒相對於前一根收盤的對數報酬 (收盤, 最高, 最低)，形狀 (n - 1, 3)
+    以前一根收盤為基準，重抽後最高/最低與收盤的相對位置（影線）保持不變
+    """
+    close = np.asarray(prices_close, dtype=np.float64)
+    prev = close[:-1]
+    return np.column_stack([
+        np.log(close[1:] / prev),
+        np.log(np.asarray(prices_high, dtype=np.float64)[1:] / prev),
+        np.log(np.asarray(prices_low, dtype=np.float64)[1:] / prev),
+    ])
+
+
+def bootstrap_path(relative, n_bars, block_size, rng, start_price):
+    """
+    移動區塊拔靴：隨機抽取長度 block_size 的連續區塊接成 n_bars 根，保留區塊內的波動聚集與趨勢
+    回傳 (close, high, low)
+    """
+    n_blocks = math.ceil(n_bars / block_size)
+    starts = rng.integers(0, len(relative) - block_size + 1, size=n_blocks)
+    idx = (starts[:, None] + np.arange(block_size)).ravel()[:n_bars]
+    sample = relative[idx]
+    log_close = np.log(start_price) + np.cumsum(sample[:, 0])
+    prev_close = np.concatenate(([np.log(start_price)], log_close[:-1]))
+    return np.exp(log_close), np.exp(prev_close + sample[:, 1]), np.exp(prev_close + sample[:, 2])
+
+
+def path_stats(prices_close, prices_high, prices_low, direction, initial_balance, params):
+    """單一路徑的回測統計，欄位同 PATH_COLUMNS"""
+    log, state = run_martin_kernel(prices_close, prices_high, prices_low, direction, **params)
+    curve, risk = equity_curve(log, prices_close, prices_high, prices_low, direction, initial_balance)
+    closes = log[log["action"] == ACTION_CLOSE]
+    stop_losses = closes["reason"] == REASON_STOP_LOSS
+    min_equity = float(curve["權益"].min()) if len(prices_close) else float(initial_balance)
+    return (
+        round(state[STATE_TAKE_PROFIT_AMOUNT], 2) + round(state[STATE_STOP_LOSS_AMOUNT], 2),
+        risk["最大回撤 (USDT)"],
+        _longest_run(stop_losses),
+        int(stop_losses.sum()),
+        risk["觸及爆倉價次數"],
+        round(min_equity, 2),
+        min_equity <= 0,
+    )
+
+
+def _init_worker(relative):
+    _source["relative"] = relative
+
+
+def _simulate_chunk(start, seeds, n_bars, block_size, start_price, direction, initial_balance, params):
+    # 每條路徑使用自己的 SeedSequence，結果與分塊方式、程序數無關
+    relative = _source["relative"]
+    rows = []
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        close, high, low = bootstrap_path(relative, n_bars, block_size, rng, start_price)
+        rows.append(path_stats(close, high, low, direction, initial_balance, params))
+    return start, rows
+
+
+def monte_carlo(prices_close, prices_high, prices_low, direction, initial_balance, leverage, add_pct, add_multiple,
+                max_add_times, add_amount, add_amount_multiple, take_profit_pct, stop_loss_pct,
+                n_paths=1000, n_bars=None, block_size=24, seed=0, workers=1, chunk_size=None,
+                progress_callback=None):
+    """
+    以歷史K棒產生 n_paths 條長度 n_bars（預設與歷史相同）的拔靴路徑並逐條回測
+    亂數由 SeedSequence(seed).spawn(n_paths) 產生，每條路徑一個獨立的串流，同一 seed 結果完全相同
+    workers > 1 時以程序池平行計算；progress_callback(已完成路徑數, 總路徑數)
+    回傳 (每條路徑一列的 DataFrame, 分佈摘要 DataFrame)
+    """
+    relative = relative_bars(prices_close, prices_high, prices_low)
+    n_bars = len(relative) if n_bars is None else int(n_bars)
+    block_size = int(min(block_size, len(relative)))
+    if block_size < 1 or n_bars < 1:
+        raise ValueError("歷史K棒數不足以進行拔靴重抽")
+    params = dict(leverage=leverage, add_pct=add_pct, add_multiple=add_multiple, max_add_times=max_add_times,
+                  add_amount=add_amount, add_amount_multiple=add_amount_multiple,
+                  take_profit_pct=take_profit_pct, stop_loss_pct=stop_loss_pct)
+    start_price = float(np.asarray(prices_close)[0])
+    seeds = np.random.SeedSequence(seed).spawn(n_paths)
+    workers = max(int(workers), 1)
+    if chunk_size is None:
+        chunk_size = max(math.ceil(n_paths / (workers * 8)), 1)
+    chunks = [(start, seeds[start:start + chunk_size]) for start in range(0, n_paths, chunk_size)]
+
+    rows = [None] * n_paths
+    done = 0
+
+    def collect(result):
+        nonlocal done
+        start, chunk_rows = result
+        rows[start:start + len(chunk_rows)] = chunk_rows
+        done += len(chunk_rows)
+        if progress_callback is not None:
+            progress_callback(done, n_paths)
+
+    args = (n_bars, block_size, start_price, direction, initial_balance, params)
+    if workers == 1:
+        _init_worker(relative)
+        for start, chunk in chunks:
+            collect(_simulate_chunk(start, chunk, *args))
+        _source.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(relative,)) as pool:
+            futures = [pool.submit(_simulate_chunk, start, chunk, *args) for start, chunk in chunks]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    df_paths = pd.DataFrame(rows, columns=PATH_COLUMNS)
+    return df_paths, summarize(df_paths, initial_balance)
+
+
+def summarize(df_paths, initial_balance):
+    """各指標的平均與分位數，另列虧損機率與破產機率"""
+    metrics = PATH_COLUMNS[:4]
+    summary = df_paths[metrics].quantile(QUANTILES).T
+    summary.columns = [f"P{round(q * 100)}" for q in QUANTILES]
+    summary.insert(0, "平均", df_paths[metrics].mean())
+    summary.loc["虧損機率 (%)", "平均"] = (df_paths["淨利潤"] < 0).mean() * 100
+    summary.loc["破產機率 (%)", "平均"] = df_paths["破產"].mean() * 100
+    summary.loc["回撤超過初始金額機率 (%)", "平均"] = (df_paths["最大回撤 (USDT)"] >= initial_balance).mean() * 100
+    return summary.round(2)
+
+
+def main(argv=None):
+    from bar_store import BarStore
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default="ETH每小時Ｋ棒.csv")
+    parser.add_argument("--paths", type=int, default=10_000)
+    parser.add_argument("--bars", type=int, help="每條路徑的K棒數，預設為資料週期的一年")
+    parser.add_argument("--block", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--direction", type=int, choices=(1, -1), default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    store = BarStore.open(args.file)
+    n_bars = args.bars or bars_per_year(base_timeframe(args.file))
+    t0 = time.perf_counter()
+    df_paths, summary = monte_carlo(
+        store.close, store.high, store.low, args.direction, initial_balance=1000, leverage=10, add_pct=2.0,
+        add_multiple=1.0, max_add_times=7, add_amount=100, add_amount_multiple=2.0, take_profit_pct=1.0,
+        stop_loss_pct=10.0, n_paths=args.paths, n_bars=n_bars, block_size=args.block, seed=args.seed,
+        workers=args.workers)
+    print(summary.to_string())
+    print(f"{args.paths} 條路徑 × {n_bars} 根K棒，耗時 {time.perf_counter() - t0:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+多交易對：交易對清單（symbols.json）、以有上限的執行緒池同時更新各交易對的K棒，以及跨交易對篩選
+
+    python symbols.py update --offline       # 以 FakeExchange 離線更新所有交易對
+    python symbols.py screen --threshold 5 --depth 10
+"""
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+import bar_store
+from martin_strategy import martin_backtest_both
+from resample import open_timeframe
+from update_daily import _Pacer, update_data
+from zigzag import calculate_zigzag
+
+REGISTRY_PATH = "symbols.json"
+DATA_DIR = "data"
+DEFAULT_SYMBOL = "ETH/USDT:USDT"
+# 既有的 ETH 1h 資料沿用原本的檔名
+LEGACY_FILES = {(DEFAULT_SYMBOL, "1h"): "ETH每小時Ｋ棒.csv"}
+SCREEN_COLUMNS = ["交易對", "K棒數", "波段數", "上漲波段中位數 (%)", "下跌波段中位數 (%)",
+                  "做多淨利潤", "做多最大回撤", "做空淨利潤", "做空最大回撤", "錯誤"]
+
+
+def default_filename(symbol, timeframe="1h", data_dir=DATA_DIR):
+    """交易對對應的 CSV 檔名，例如 BTC/USDT:USDT, 1h -> data/BTC_USDT_USDT_1h.csv"""
+    if (symbol, timeframe) in LEGACY_FILES:
+        return LEGACY_FILES[(symbol, timeframe)]
+    return os.path.join(data_dir, f"{re.sub(r'[^0-9A-Za-z]+', '_', symbol).strip('_')}_{timeframe}.csv")
+
+
+class SymbolRegistry:
+    """
+    追蹤的交易對清單，存成 JSON：{"symbols": [{"symbol", "timeframe", "filename"}, ...]}
+    每個交易對各自一個 CSV 與二進位儲存；檔案不存在時只有預設的 ETH
+    """
+
+    def __init__(self, path=REGISTRY_PATH):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for entry in json.load(f)["symbols"]:
+                    self.entries[entry["symbol"]] = entry
+        else:
+            self.add(DEFAULT_SYMBOL, save=False)
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"symbols": list(self.entries.values())}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def add(self, symbol, timeframe="1h", filename=None, save=True):
+        self.entries[symbol] = {"symbol": symbol, "timeframe": timeframe,
+                                "filename": filename or default_filename(symbol, timeframe)}
+        if save:
+            self.save()
+        return self.entries[symbol]
+
+    def remove(self, symbol, save=True):
+        self.entries.pop(symbol)
+        if save:
+            self.save()
+
+    def symbols(self):
+        return list(self.entries)
+
+    def get(self, symbol):
+        return self.entries[symbol]
+
+    def filename(self, symbol):
+        return self.entries[symbol]["filename"]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, symbol):
+        return symbol in self.entries
+
+
+class _PacedExchange:
+    """多個執行緒共用同一個交易所物件時，以共用的節流器排定所有交易對的請求"""
+
+    def __init__(self, exchange):
+        self._exchange = exchange
+        self._pacer = _Pacer(getattr(exchange, "rateLimit", 0) or 0)
+
+    def fetch_ohlcv(self, *args, **kwargs):
+        self._pacer.wait()
+        return self._exchange.fetch_ohlcv(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._exchange, name)
+
+
+def update_all(registry, exchange=None, max_workers=4, symbols=None, backfill=False, progress_callback=None,
+               **update_kwargs):
+    """
+    以最多 max_workers 個執行緒同時更新各交易對，各自寫入自己的檔案；單一交易對失敗不影響其他交易對
+    exchange: 共用的 ccxt 交易所物件（預設 ccxt.okx()），離線測試可傳入 fake_exchange.FakeExchange
+    progress_callback(已完成數, 總數, 交易對)
+    回傳每個交易對一列的摘要：新增K棒數、最新時間、錯誤訊息
+    """
+    if exchange is None:
+        import ccxt
+        exchange = ccxt.okx()
+    exchange = _PacedExchange(exchange)
+    symbols = registry.symbols() if symbols is None else list(symbols)
+
+    def run(symbol):
+        entry = registry.get(symbol)
+        directory = os.path.dirname(entry["filename"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        df_new = update_data(symbol=symbol, timeframe=entry["timeframe"], filename=entry["filename"],
+                             exchange=exchange, backfill=backfill, **update_kwargs)
+        return len(df_new), bar_store.last_time(entry["filename"])
+
+    rows = {}
+    with ThreadPoolExecutor(max_workers=max(int(max_workers), 1)) as pool:
+        futures = {pool.submit(run, symbol): symbol for symbol in symbols}
+        for done, future in enumerate(as_completed(futures), start=1):
+            symbol = futures[future]
+            try:
+                added, last = future.result()
+                rows[symbol] = (symbol, added, last, None)
+            except Exception as exc:   # 交易所錯誤、下架的交易對等只記錄下來
+                rows[symbol] = (symbol, 0, None, f"{type(exc).__name__}: {exc}")
+            if progress_callback is not None:
+                progress_callback(done, len(symbols), symbol)
+    return pd.DataFrame([rows[s] for s in symbols], columns=["交易對", "新增K棒數", "最新時間", "錯誤"]).set_index("交易對")
+
+
+def _screen_one(symbol, filename, timeframe, start, end, threshold, depth, backtest_params):
+    # 在子程序中處理一個交易對：ZigZag 波段統計 + 做多/做空回測
+    row = dict.fromkeys(SCREEN_COLUMNS)
+    row["交易對"] = symbol
+    try:
+        store = open_timeframe(filename, timeframe)
+        bars = store.range(start, end) if start is not None or end is not None else store
+        row["K棒數"] = len(bars)
+        if len(bars) < 2 * depth + 1:
+            raise ValueError("K棒數不足")
+        _, segment_info, *_ = calculate_zigzag(bars, threshold, depth)
+        pct = segment_info["漲跌幅 (%)"]
+        row["波段數"] = len(segment_info)
+        row["上漲波段中位數 (%)"] = float(pct[pct > 0].median()) if (pct > 0).any() else np.nan
+        row["下跌波段中位數 (%)"] = float(pct[pct < 0].median()) if (pct < 0).any() else np.nan
+        results = martin_backtest_both(bars.close, bars.high, bars.low, bars.times, with_equity=True,
+                                       **backtest_params)
+        for direction, label in ((1, "做多"), (-1, "做空")):
+            _, df_stats, _, df_risk = results[direction]
+            row[f"{label}淨利潤"] = round(float(df_stats.loc["止盈累計金額", "數值"] + df_stats.loc["停損累計金額", "數值"]), 2)
+            row[f"{label}最大回撤"] = float(df_risk.loc["最大回撤 (USDT)", "數值"])
+    except FileNotFoundError:
+        row["錯誤"] = "尚未有資料"
+    except ValueError as exc:
+        row["錯誤"] = str(exc)
+    except Exception as exc:   # 資料損毀等其他錯誤只記錄在該交易對，不影響其他交易對
+        row["錯誤"] = f"{type(exc).__name__}: {exc}"
+    return row
+
+
+def screen_symbols(registry, threshold=5.0, depth=10, backtest_params=None, timeframe=None, start=None, end=None,
+                   symbols=None, workers=1, rank_by="做多淨利潤", ascending=False, progress_callback=None):
+    """
+    跨交易對篩選：每個交易對各自計算 ZigZag 波段統計與做多/做空回測（含最大回撤），依 rank_by 排名
+    交易對之間彼此獨立，workers > 1 時分給程序池平行計算
+    backtest_params: martin_backtest 的 initial_balance / leverage / add_pct ... 等參數
+    timeframe: 以各交易對的儲存合併出的週期，None 為各自的基礎週期
+    """
+    symbols = registry.symbols() if symbols is None else list(symbols)
+    tasks = [(symbol, registry.filename(symbol), timeframe, start, end, threshold, depth, backtest_params)
+             for symbol in symbols]
+    rows = []
+    if workers <= 1:
+        for done, task in enumerate(tasks, start=1):
+            rows.append(_screen_one(*task))
+            if progress_callback is not None:
+                progress_callback(done, len(tasks), task[0])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_screen_one, *task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), start=1):
+                rows.append(future.result())
+                if progress_callback is not None:
+                    progress_callback(done, len(tasks), rows[-1]["交易對"])
+    df = pd.DataFrame(rows, columns=SCREEN_COLUMNS).set_index("交易對")
+    df = df.sort_values(rank_by, ascending=ascending, na_position="last", kind="stable")
+    df.insert(0, "排名", np.arange(1, len(df) + 1))
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--registry", default=REGISTRY_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("add")
+    p.add_argument("symbols", nargs="+")
+    p.add_argument("--timeframe", default="1h")
+    p = sub.add_parser("update")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--backfill", action="store_true")
+    p.add_argument("--offline", action="store_true", help="以 FakeExchange 取代交易所")
+    p = sub.add_parser("screen")
+    p.add_argument("--threshold", type=float, default=5.0)
+    p.add_argument("--depth", type=int, default=10)
+    p.add_argument("--timeframe")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--rank-by", default="做多淨利潤")
+    args = parser.parse_args(argv)
+
+    registry = SymbolRegistry(args.registry)
+    if args.command == "add":
+        for symbol in args.symbols:
+            registry.add(symbol, args.timeframe)
+        print(f"已加入 {len(args.symbols)} 個交易對，共 {len(registry)} 個")
+    elif args.command == "update":
+        exchange = None
+        if args.offline:
+            from fake_exchange import FakeExchange
+            exchange = FakeExchange()
+        print(update_all(registry, exchange, args.workers, backfill=args.backfill).to_string())
+    else:
+        backtest_params = dict(initial_balance=1000, leverage=10, add_pct=2.0, add_multiple=1.0, max_add_times=7,
+                               add_amount=100, add_amount_multiple=2.0, take_profit_pct=1.0, stop_loss_pct=10.0)
+        print(screen_symbols(registry, args.threshold, args.depth, backtest_params, args.timeframe,
+                             workers=args.workers, rank_by=args.rank_by).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def random_bars(n, start="2024-01-01", freq="1h", seed=0):
+    """隨機漫步的K棒 DataFrame（與 CSV 相同欄位）"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.005, n)) * close
+    return pd.DataFrame({
+        "時間": pd.date_range(start, periods=n, freq=freq),
+        "開盤": open_,
+        "最高": np.maximum(open_, close) + spread,
+        "最低": np.minimum(open_, close) - spread,
+        "收盤": close,
+        "成交量": rng.uniform(1, 10, n),
+    })
+
+
+@pytest.fixture
+def price_frame():
+    return random_bars(8000, seed=1)
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import bar_store
+from conftest import random_bars
+from resample import open_timeframe, resample_arrays, timeframe_ns, update_aggregate
+
+
+def write_csv(tmp_path, df):
+    filename = str(tmp_path / "bars.csv")
+    df.to_csv(filename, index=False)
+    return filename
+
+
+def csv_close(filename):
+    return pd.read_csv(filename)["收盤"].to_numpy()
+
+
+def test_stale_reconvert_recovers_interrupted_append(tmp_path):
+    filename = write_csv(tmp_path, random_bars(50, seed=2))
+    bar_store.convert_csv(filename, timeframe="1h")
+    expected = csv_close(filename)
+    # 模擬附加寫入中途中斷：journal 記錄原始大小，CSV 尾端留下不完整的一行
+    size = os.path.getsize(filename)
+    with open(bar_store.journal_path(filename), "w") as f:
+        f.write(str(size))
+    with open(filename, "ab") as f:
+        f.write(b"2024-01-03 02:00:00,1.0,2.")
+
+    arrays = bar_store.read_arrays(filename, mmap=False)
+    assert not os.path.exists(bar_store.journal_path(filename))
+    assert os.path.getsize(filename) == size
+    np.testing.assert_array_equal(arrays["收盤"], expected)
+
+
+def test_convert_keeps_open_memmap_intact(tmp_path):
+    df = random_bars(200, seed=3)
+    filename = write_csv(tmp_path, df)
+    bar_store.convert_csv(filename, timeframe="1h")
+    aggregate = update_aggregate(filename, "4h")
+    opened = bar_store.read_arrays(filename)
+    before = np.array(opened["收盤"])
+
+    # CSV 被外部改寫（較短且內容不同），讀取時整份重新轉換
+    changed = random_bars(120, seed=4)
+    changed.to_csv(filename, index=False)
+    arrays = bar_store.read_arrays(filename, mmap=False)
+
+    np.testing.assert_array_equal(np.asarray(opened["收盤"]), before)
+    np.testing.assert_array_equal(arrays["收盤"], csv_close(filename))
+    assert bar_store.read_meta(bar_store.store_path(filename))["timeframe"] == "1h"
+    assert os.path.isdir(aggregate)
+    assert sorted(os.listdir(tmp_path)) == ["bars.bars", "bars.csv"]
+    # 合併週期依基礎資料的 meta 判斷重建
+    assert bar_store.read_meta(update_aggregate(filename, "4h"))["base_rows"] == len(changed)
+    assert pd.Timestamp(int(bar_store.read_arrays(filename)["時間"][-1])) == changed["時間"].iloc[-1]
+
+
+def resampled_close(filename):
+    return resample_arrays(bar_store.read_arrays(filename, mmap=False), timeframe_ns("4h"))["收盤"]
+
+
+def test_aggregate_append_keeps_open_memmap_intact(tmp_path):
+    df = random_bars(200, seed=5)
+    filename = write_csv(tmp_path, df.iloc[:150])
+    bar_store.convert_csv(filename, timeframe="1h")
+    opened = open_timeframe(filename, "4h")
+    before = np.array(opened.close)
+
+    # 最後一個 4h 週期尚未走完時附加新K棒，合併結果的最後一根需重算
+    signature = bar_store.source_signature(filename)
+    df.iloc[150:].to_csv(filename, mode="a", header=False, index=False)
+    bar_store.append_bars(filename, df.iloc[150:], signature)
+
+    np.testing.assert_array_equal(open_timeframe(filename, "4h").close, resampled_close(filename))
+    np.testing.assert_array_equal(opened.close, before)
+
+
+def test_aggregate_rebuilds_after_correction_inside_range(tmp_path):
+    df = random_bars(200, seed=6)
+    filename = write_csv(tmp_path, df)
+    bar_store.convert_csv(filename, timeframe="1h")
+    update_aggregate(filename, "4h")
+
+    # 既有範圍中段的K棒被修正（根數與最後時間不變），重新轉換後合併週期需重建
+    df.loc[40, ["最高", "收盤"]] = df.loc[40, "最高"] * 2
+    df.to_csv(filename, index=False)
+    np.testing.assert_array_equal(open_timeframe(filename, "4h").close, resampled_close(filename))
+
+    # 尾端內容被直接改寫（generation 不變）時依尾端指紋重建
+    path = bar_store.store_path(filename)
+    with open(os.path.join(path, bar_store.FIELDS["收盤"][0]), "r+b") as f:
+        f.seek(-8, os.SEEK_END)
+        f.write(np.float64(1.0).tobytes())
+    np.testing.assert_array_equal(open_timeframe(filename, "4h").close[-1], 1.0)
@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+import bench_suite
+
+
+def test_compare_honors_settings_and_warns(tmp_path, capsys):
+    baseline, current = str(tmp_path / "baseline.json"), str(tmp_path / "current.json")
+    bench_suite.main(["run", "--sizes", "1500", "--repeat", "1", "--out", baseline])
+    bench_suite.main(["compare", baseline, "--sizes", "1200", "--out", current])
+    with open(current) as f:
+        meta = json.load(f)["meta"]
+    # 未指定的設定沿用基準檔
+    assert (meta["sizes"], meta["repeat"], meta["seed"]) == ([1200], 1, 0)
+    err = capsys.readouterr().err
+    assert "sizes" in err and "repeat" not in err
+
+    # 比較既有結果檔時不能再指定量測設定
+    with pytest.raises(SystemExit) as exc:
+        bench_suite.main(["compare", baseline, "--current", current, "--workers", "2"])
+    assert exc.value.code == 2
@@ -0,0 +1,94 @@
+import functools
+import os
+import pickle
+import time
+
+import numpy as np
+
+import cache
+
+
+def test_engine_version_tracks_module_source(tmp_path):
+    module = tmp_path / "martin_strategy.py"
+    module.write_text("STATS = ['止盈次數']\n")
+    version = cache.engine_version("1", ("martin_strategy.py",), str(tmp_path))
+    assert cache.engine_version("1", ("martin_strategy.py",), str(tmp_path)) == version
+    assert cache.engine_version("2", ("martin_strategy.py",), str(tmp_path)) != version
+    module.write_text("STATS = ['止盈次數', '停損次數']\n")
+    assert cache.engine_version("1", ("martin_strategy.py",), str(tmp_path)) != version
+
+
+def test_key_includes_engine_version(monkeypatch):
+    key = cache.make_key("martin_backtest", "abc", ("2024-01-01", "2024-02-01"), {"direction": 1})
+    monkeypatch.setattr(cache, "ENGINE_VERSION", "old")
+    assert cache.make_key("martin_backtest", "abc", ("2024-01-01", "2024-02-01"), {"direction": 1}) != key
+
+
+def disk_keys(result_cache):
+    with result_cache._connect() as conn:
+        return sorted(key for key, in conn.execute("SELECT key FROM entries"))
+
+
+def test_default_path_does_not_depend_on_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert cache.DEFAULT_PATH == os.path.join(os.path.dirname(os.path.abspath(cache.__file__)), "result_cache.sqlite")
+
+
+def test_invalidate_dataset_clears_both_tiers(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path / "cache.sqlite"))
+    result_cache.set("a1", 1, dataset="a.csv")
+    result_cache.set("a2", 2, dataset="a.csv")
+    result_cache.set("b1", 3, dataset="b.csv")
+    result_cache.invalidate_dataset("a.csv")
+    assert list(result_cache._memory) == ["b1"]
+    assert disk_keys(result_cache) == ["b1"]
+    # 新的 ResultCache 只有磁碟層，確認不會從磁碟讀回已清除的結果
+    reopened = cache.ResultCache(result_cache.path)
+    assert reopened.get("a1") is None and reopened.get("b1") == 3
+
+
+def test_evict_by_size_drops_least_recently_used(tmp_path):
+    value = np.zeros(1000)
+    size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    result_cache = cache.ResultCache(str(tmp_path / "cache.sqlite"), max_disk_bytes=int(size * 2.5))
+    result_cache.set("old", value)
+    result_cache.set("used", value)
+    time.sleep(0.01)
+    # 讀取會更新 last_access；從磁碟讀取需先清掉記憶體層
+    result_cache._memory.clear()
+    result_cache.get("old")
+    time.sleep(0.01)
+    result_cache.set("new", value)
+    assert disk_keys(result_cache) == ["new", "old"]
+
+
+def test_get_promotes_memory_entry():
+    result_cache = cache.ResultCache(None, max_memory_items=2)
+    result_cache.set("a", 1)
+    result_cache.set("b", 2)
+    assert result_cache.get("a") == 1
+    result_cache.set("c", 3)
+    assert list(result_cache._memory) == ["a", "c"]
+    assert result_cache.get("b") is None
+
+
+def test_cached_call_hit_and_miss(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path / "cache.sqlite"))
+    calls = []
+
+    def compute(x, scale=1):
+        calls.append((x, scale))
+        return x * scale
+
+    call = functools.partial(result_cache.cached_call, "compute", compute, dataset="a.csv", data_fingerprint="f1")
+    assert call(2, scale=3) == 6
+    assert call(2, scale=3) == 6
+    assert calls == [(2, 3)]
+    # kwargs 或資料指紋不同即為不同的鍵
+    assert call(2, scale=4) == 8
+    assert result_cache.cached_call("compute", compute, 2, data_fingerprint="f2", scale=3) == 6
+    assert len(calls) == 3
+    # 記憶體層清空後由磁碟層命中
+    result_cache._memory.clear()
+    assert call(2, scale=3) == 6
+    assert len(calls) == 3
@@ -0,0 +1,161 @@
+import json
+
+import pandas as pd
+import pytest
+
+import cli
+import jobs
+from conftest import random_bars
+from jobs import JobQueue, validate_config
+from optimize import walk_forward_optimize
+
+SEARCH_SPACE = {"add_pct": [1.0, 2.0, 3.0], "take_profit_pct": [1.0, 2.0], "stop_loss_pct": [5, 10]}
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    filename = str(tmp_path / "bars.csv")
+    random_bars(1200, seed=5).to_csv(filename, index=False)
+    return filename
+
+
+def write_config(tmp_path, config):
+    path = tmp_path / "job.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def walk_forward_config(data_file):
+    # 一般的 optimize 設定（含 strategy / chunk_size）加上 walk_forward 區段
+    return {
+        "data": {"file": data_file},
+        "optimize": {"initial_balance": 1000, "add_amount": 100, "search_space": SEARCH_SPACE},
+        "walk_forward": {"train_bars": 600, "test_bars": 200},
+    }
+
+
+def test_cli_walk_forward_job(tmp_path, data_file, capsys):
+    queue_dir = str(tmp_path / "queue")
+    config = walk_forward_config(data_file)
+    assert cli.main(["--queue", queue_dir, "optimize", "-c", write_config(tmp_path, config), "--run"]) == 0
+    queue = JobQueue(queue_dir)
+    job_id = queue.jobs("done").index[0]
+    df_trades, df_windows, df_stats = queue.result(job_id)
+    assert len(df_windows) == 3
+    assert df_stats.loc["窗口數", "數值"] == 3
+
+
+def test_walk_forward_rejects_grid_only_keys(tmp_path, data_file, capsys):
+    config = walk_forward_config(data_file)
+    config["optimize"].update(strategy="halving", chunk_size=10)
+    with pytest.raises(ValueError, match="strategy"):
+        validate_config("optimize", config)
+    queue_dir = str(tmp_path / "queue")
+    assert cli.main(["--queue", queue_dir, "optimize", "-c", write_config(tmp_path, config)]) == 2
+    assert "strategy" in capsys.readouterr().err
+    assert JobQueue(queue_dir).jobs().empty
+
+
+@pytest.mark.parametrize("kind, config, message", [
+    ("optimize", {"data": {"file": "x.csv"}, "optimize": {"initial_balance": 1000}}, "add_amount"),
+    ("optimize", {"data": {"file": "x.csv"}, "optimize": {"initial_balance": 1, "add_amount": 1},
+                  "walk_forward": {"train_bars": 10}}, "test_bars"),
+    ("optimize", {"data": {}, "optimize": {"initial_balance": 1, "add_amount": 1}}, "file 或 symbol"),
+    ("backtest", {"data": {"file": "x.csv"}, "backtest": {"initial_balance": 1}}, "缺少必要參數"),
+    ("zigzag", {"data": {"file": "x.csv"}, "zigzag": {"treshold": 5}}, "treshold"),
+    ("update", {"update": {"offline": True}, "optimize": {}}, "optimize"),
+])
+def test_validate_config_errors(kind, config, message):
+    with pytest.raises(ValueError, match=message):
+        validate_config(kind, config)
+
+
+def test_walk_forward_checkpoint_resume(tmp_path, data_file):
+    df = pd.read_csv(data_file, parse_dates=["時間"])
+    prices = (df["收盤"].values, df["最高"].values, df["最低"].values, df["時間"].values)
+    kwargs = dict(initial_balance=1000, add_amount=100, train_bars=300, test_bars=300, search_space=SEARCH_SPACE)
+    expected = walk_forward_optimize(*prices, **kwargs)
+
+    checkpoint = str(tmp_path / "wf")
+    planned = []
+
+    def interrupt(done, total):
+        planned.append(total)
+        if done == 3:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        walk_forward_optimize(*prices, **kwargs, checkpoint=checkpoint, progress_callback=interrupt)
+    resumed = []
+    actual = walk_forward_optimize(*prices, **kwargs, checkpoint=checkpoint,
+                                   progress_callback=lambda done, total: resumed.append(total))
+    # 中斷前完成的 3 個區塊由 checkpoint 還原，不再重算
+    assert resumed[-1] == planned[-1] - 3
+    for a, b in zip(actual, expected):
+        pd.testing.assert_frame_equal(a, b)
+
+
+def _claim_all(root, results):
+    queue = JobQueue(root)
+    claimed = []
+    while (job := queue.claim()) is not None:
+        claimed.append(job["id"])
+    results.put(claimed)
+
+
+def test_concurrent_claimers_claim_each_job_once(tmp_path):
+    import multiprocessing
+
+    root = str(tmp_path / "queue")
+    queue = JobQueue(root)
+    config = {"data": {"file": "x.csv"}, "zigzag": {}}
+    submitted = {queue.submit("zigzag", config) for _ in range(40)}
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_claim_all, args=(root, results)) for _ in range(4)]
+    for p in workers:
+        p.start()
+    claimed = [job_id for _ in workers for job_id in results.get(timeout=30)]
+    for p in workers:
+        p.join()
+    assert sorted(claimed) == sorted(submitted)
+    assert queue.claim() is None
+
+
+def test_run_when_other_worker_claims_first(tmp_path, data_file, monkeypatch, capsys):
+    # 送出後、認領前被另一個 worker 取走：--run 不能以 None 執行工作
+    root = str(tmp_path / "queue")
+    submit = JobQueue.submit
+
+    def submit_then_steal(self, kind, config):
+        job_id = submit(self, kind, config)
+        assert JobQueue(root).claim()["id"] == job_id
+        return job_id
+
+    monkeypatch.setattr(JobQueue, "submit", submit_then_steal)
+    config = {"data": {"file": data_file}, "zigzag": {"threshold": 3.0, "depth": 5}}
+    assert cli.main(["--queue", root, "zigzag", "-c", write_config(tmp_path, config), "--run"]) == 0
+    assert "其他 worker" in capsys.readouterr().err
+    assert len(JobQueue(root).jobs("running")) == 1
+
+
+def test_run_only_runs_submitted_job(tmp_path, data_file):
+    root = str(tmp_path / "queue")
+    config = {"data": {"file": data_file}, "zigzag": {"threshold": 3.0, "depth": 5}}
+    earlier = JobQueue(root).submit("zigzag", config)
+    assert cli.main(["--queue", root, "zigzag", "-c", write_config(tmp_path, config), "--run"]) == 0
+    queue = JobQueue(root)
+    assert list(queue.jobs("pending").index) == [earlier]
+    assert len(queue.jobs("done")) == 1
+
+
+def test_worker_loop_recovers_jobs_of_stopped_workers(tmp_path, data_file, monkeypatch):
+    # worker 執行期間另一個 worker 被中止：之後的迴圈即把它的工作放回 pending 並執行
+    root = str(tmp_path / "queue")
+    queue = JobQueue(root)
+    config = {"data": {"file": data_file}, "zigzag": {"threshold": 3.0, "depth": 5}}
+    stopped = queue.submit("zigzag", config)
+    queue.claim()
+    monkeypatch.setattr(jobs, "_pid_alive", lambda pid: False)
+    jobs._worker_loop(root, forever=False, poll=0)
+    assert list(queue.jobs("done").index) == [stopped]
+    assert queue.jobs("running").empty
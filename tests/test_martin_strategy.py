@@ -0,0 +1,33 @@
+import pytest
+
+from conftest import random_bars
+from martin_strategy import BOOK_RISK_INDEX, martin_backtest_both
+
+PARAMS = dict(leverage=10, add_pct=2.0, add_multiple=1.0, max_add_times=7, add_amount=100,
+              add_amount_multiple=2.0, take_profit_pct=1.0, stop_loss_pct=10.0)
+
+
+def run_hedged(initial_balance):
+    df = random_bars(8000, seed=3)
+    return martin_backtest_both(df["收盤"].values, df["最高"].values, df["最低"].values, df["時間"].values,
+                                initial_balance=initial_balance, with_equity=True, hedged=True, **PARAMS)
+
+
+def test_hedged_stats_keep_counts_as_int():
+    _, df_stats, _, df_risk = run_hedged(1000)
+    for name in ("總開倉次數", "止盈次數", "停損次數"):
+        assert all(type(v) is int for v in df_stats.loc[name])
+        assert df_stats.loc[name, "合計"] == df_stats.loc[name, "做多"] + df_stats.loc[name, "做空"]
+    assert df_stats.loc["止盈累計金額", "合計"] == pytest.approx(
+        df_stats.loc["止盈累計金額", "做多"] + df_stats.loc["止盈累計金額", "做空"])
+    for name in ("最長水下K棒數", "觸及爆倉價次數", "權益歸零K棒數"):
+        assert type(df_risk.loc[name, "數值"]) is int
+
+
+def test_bankrupt_book_caps_drawdown():
+    # 初始金額遠小於加碼金額，共用帳戶會虧光
+    _, _, df_equity, df_risk = run_hedged(10)
+    assert list(df_risk.index) == BOOK_RISK_INDEX
+    assert df_risk.loc["權益歸零K棒數", "數值"] == int((df_equity["權益"] <= 0).sum()) > 0
+    assert df_risk.loc["最大回撤 (%)", "數值"] == 100.0
+    assert df_equity["回撤 (%)"].max() <= 100.0
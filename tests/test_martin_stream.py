@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_store import BarStore
+from conftest import random_bars
+from martin_strategy import martin_backtest_fast, martin_backtest_stream
+
+PARAMS = dict(initial_balance=1000, leverage=10, add_pct=1.5, add_multiple=1.0, max_add_times=5, add_amount=100,
+              add_amount_multiple=2.0, take_profit_pct=1.0, stop_loss_pct=3.0)
+
+
+@pytest.fixture(scope="module")
+def frame():
+    return random_bars(3000, seed=4)
+
+
+def holding_mask(df, df_trades):
+    # 進入每根K棒時是否持倉（開倉後、平倉前）；用來確認區塊邊界落在持倉中
+    bars = df["時間"].searchsorted(df_trades.index)
+    held = np.zeros(len(df) + 1, dtype=int)
+    opened = None
+    for bar, action in zip(bars, df_trades["動作"]):
+        if action == "開倉":
+            opened = bar
+        elif action == "平倉":
+            held[opened + 1] += 1
+            held[bar + 1] -= 1
+    return np.cumsum(held)[:len(df)] > 0
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+@pytest.mark.parametrize("chunk_size", [1, 7, 97, 1000, 5000])
+def test_stream_matches_fast(tmp_path, frame, direction, chunk_size):
+    expected_trades, expected_stats = martin_backtest_fast(
+        frame["收盤"].values, frame["最高"].values, frame["最低"].values, frame["時間"].values, direction, **PARAMS)
+    assert set(expected_trades["動作"]) >= {"開倉", "加碼", "平倉"}
+    assert (expected_trades["結束原因"] == "停損").any()
+    if chunk_size < len(frame):
+        held = holding_mask(frame, expected_trades)
+        assert held[chunk_size::chunk_size].any()
+
+    path = str(tmp_path / "trades.csv")
+    stats, balance, n_trades = martin_backtest_stream(BarStore.from_frame(frame), direction, sink=path,
+                                                      chunk_size=chunk_size, **PARAMS)
+    pd.testing.assert_frame_equal(stats, expected_stats, check_exact=True)
+    assert n_trades == len(expected_trades)
+    assert balance == expected_trades["餘額"].iloc[-1]
+    # 逐段附加的 CSV 與一次回測整段輸出的 CSV 完全相同
+    expected_path = str(tmp_path / "expected.csv")
+    expected_trades.to_csv(expected_path)
+    with open(path) as actual, open(expected_path) as expected:
+        assert actual.read() == expected.read()
+
+
+def test_stream_sink_receives_frames(frame):
+    chunks = []
+    stats, _, _ = martin_backtest_stream(BarStore.from_frame(frame), 1, sink=chunks.append, chunk_size=250, **PARAMS)
+    expected_trades, expected_stats = martin_backtest_fast(
+        frame["收盤"].values, frame["最高"].values, frame["最低"].values, frame["時間"].values, 1, **PARAMS)
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected_trades, check_exact=True)
+    pd.testing.assert_frame_equal(stats, expected_stats, check_exact=True)
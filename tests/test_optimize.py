@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import random_bars
+from optimize import optimize_martingale, walk_forward_optimize, walk_forward_windows
+
+SEARCH_SPACE = {"add_pct": [1.0, 2.0, 3.0], "take_profit_pct": [1.0, 2.0], "stop_loss_pct": [5, 10]}
+
+
+def run_walk_forward(frame, **kwargs):
+    return walk_forward_optimize(
+        frame["收盤"].values, frame["最高"].values, frame["最低"].values, frame["時間"].values,
+        initial_balance=1000, add_amount=100, search_space=SEARCH_SPACE, **kwargs)
+
+
+def run_optimize(frame, **kwargs):
+    return optimize_martingale(
+        frame["收盤"].values, frame["最高"].values, frame["最低"].values, frame["時間"].values,
+        initial_balance=1000, add_amount=100, search_space=SEARCH_SPACE, return_report=True, **kwargs)
+
+
+def test_report_counts_checkpoint_restores_separately(tmp_path):
+    frame = random_bars(1200, seed=7)
+    checkpoint = str(tmp_path / "opt")
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(done, total):
+        # 完成兩個區塊（6 組參數）後中斷
+        if done == 6:
+            raise Interrupted
+
+    with pytest.raises(Interrupted):
+        run_optimize(frame, checkpoint=checkpoint, chunk_size=3, progress_callback=interrupt)
+    best, report = run_optimize(frame, checkpoint=checkpoint, chunk_size=3)
+    assert report["從檢查點還原"] == 6
+    assert report["完整回測次數"] == 6
+    assert report["節省完整回測次數"] == 0
+
+    # 完整還原時本次沒有任何工作，也沒有任何節省
+    assert run_optimize(frame, checkpoint=checkpoint) == (best, {**report, "完整回測次數": 0, "從檢查點還原": 12,
+                                                                 "等效完整回測次數": 0.0})
+
+
+def test_report_without_checkpoint():
+    frame = random_bars(1200, seed=7)
+    _, report = run_optimize(frame, strategy="coarse_to_fine", coarse_step=2)
+    assert "從檢查點還原" not in report
+    assert report["節省完整回測次數"] == report["搜尋空間大小"] - report["完整回測次數"]
+
+
+@pytest.mark.parametrize("step", [100, 150, 300])
+def test_walk_forward_windows_do_not_overlap(step):
+    windows = walk_forward_windows(1000, 400, 200, step)
+    assert [train_stop for _, train_stop, _ in windows] == list(range(400, 1000, step))
+    for (_, _, test_stop), (_, next_start, _) in zip(windows, windows[1:]):
+        assert test_stop <= next_start
+    assert all(test_stop - train_stop <= min(step, 200) for _, train_stop, test_stop in windows)
+
+
+@pytest.mark.parametrize("step", [150, 300])
+def test_walk_forward_step_differs_from_test_bars(step):
+    frame = random_bars(1200, seed=7)
+    df_trades, df_windows, df_stats = run_walk_forward(frame, train_bars=400, test_bars=200, step=step)
+    # 樣本外交易紀錄依時間排列，且每筆交易落在所屬窗口的測試區間內
+    assert df_trades.index.is_monotonic_increasing
+    for w, row in df_windows.iterrows():
+        times = df_trades.index[df_trades["窗口"] == w].to_series()
+        assert times.between(row["測試開始"], row["測試結束"]).all()
+    assert df_stats.loc["樣本外淨利潤", "數值"] == pytest.approx(df_windows["樣本外淨利潤"].sum())
+
+
+def test_overlapping_step_matches_trimmed_test_bars():
+    # step < test_bars 等同測試區間只到下一個窗口的測試起點
+    frame = random_bars(1200, seed=7)
+    overlapping = run_walk_forward(frame, train_bars=400, test_bars=300, step=150)
+    trimmed = run_walk_forward(frame, train_bars=400, test_bars=150)
+    for left, right in zip(overlapping, trimmed):
+        pd.testing.assert_frame_equal(left, right)
+
+
+def test_checkpoint_writes_one_file_per_chunk(tmp_path):
+    frame = random_bars(1200, seed=7)
+    checkpoint = str(tmp_path / "opt")
+    run_optimize(frame, checkpoint=checkpoint, chunk_size=5)
+    # 每個區塊只寫自己的統計，不重寫先前已完成的區塊
+    chunks = sorted(name for name in os.listdir(checkpoint) if name != "signature.json")
+    assert chunks == ["full-0.npz", "full-10.npz", "full-5.npz"]
+    sizes = [len(np.load(os.path.join(checkpoint, name))["indices"]) for name in chunks]
+    assert sizes == [5, 2, 5]
+
+    # 資料不同時捨棄舊的區塊
+    _, report = run_optimize(frame.iloc[:1000], checkpoint=checkpoint, chunk_size=8)
+    assert report["從檢查點還原"] == 0
+    assert sorted(os.listdir(checkpoint)) == ["full-0.npz", "full-8.npz", "signature.json"]
@@ -0,0 +1,143 @@
+"""
+快速路徑與原始實作的一致性檢查（原本在 benchmark.py 中以 assert 執行，benchmark.py 現在只負責計時）
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import martin_strategy
+import zigzag
+from benchmark import legacy_pivot_masks
+from conftest import random_bars
+from fake_exchange import FakeExchange
+from martin_strategy import martin_backtest, martin_backtest_batch, martin_backtest_both, martin_backtest_fast
+from update_daily import backfill_data
+from zigzag import ZigZagState, calculate_zigzag, pivot_mask_ladder, pivot_masks, zigzag_surface
+
+MARTIN_GRID = list(itertools.product([1, -1], [0.7, 2.0], [0.5, 1.0, 3.3], [2.0, 10.0], [0, 3, 7], [1.0, 1.5], [1, 2.0]))
+SURFACE_THRESHOLDS = (0.5, 1.0, 2.5, 5.0, 10.0)
+SURFACE_DEPTHS = (1, 2, 3, 7, 20)
+BOTH_GRID = list(itertools.product([0.7, 2.0], [0.5, 1.0, 3.3], [2.0, 10.0], [0, 3, 7]))
+
+
+@pytest.fixture(scope="module")
+def bars():
+    return random_bars(3000, seed=11)
+
+
+def price_arrays(df):
+    return df["收盤"].values, df["最高"].values, df["最低"].values, df["時間"].values
+
+
+def backtest_params(add_pct=2.0, take_profit_pct=1.0, stop_loss_pct=10.0, max_add_times=7,
+                    add_multiple=1.0, add_amount_multiple=2.0):
+    return dict(initial_balance=1000, leverage=10, add_pct=add_pct, add_multiple=add_multiple,
+                max_add_times=max_add_times, add_amount=100, add_amount_multiple=add_amount_multiple,
+                take_profit_pct=take_profit_pct, stop_loss_pct=stop_loss_pct)
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3, 5, 10, 20])
+def test_pivot_masks_match_legacy(bars, depth):
+    highs, lows = bars["最高"].values, bars["最低"].values
+    for expected, actual in zip(legacy_pivot_masks(highs, lows, depth), pivot_masks(highs, lows, depth)):
+        np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("n", [3000, 25])
+def test_pivot_mask_ladder_matches_pivot_masks(bars, n):
+    # n = 25 時較大的 depth 視窗涵蓋整段資料，沒有任何轉折點
+    highs, lows = bars["最高"].values[:n], bars["最低"].values[:n]
+    depths = []
+    for depth, is_pivot_high, is_pivot_low in pivot_mask_ladder(highs, lows, 20):
+        expected = pivot_masks(highs, lows, depth)
+        np.testing.assert_array_equal(is_pivot_high, expected[0], err_msg=f"depth={depth}")
+        np.testing.assert_array_equal(is_pivot_low, expected[1], err_msg=f"depth={depth}")
+        depths.append(depth)
+    assert depths == list(range(1, 21))
+
+
+@pytest.mark.parametrize("kernel", ["jit", "python"])
+@pytest.mark.parametrize("depth", SURFACE_DEPTHS)
+def test_zigzag_surface_matches_calculate_zigzag(bars, monkeypatch, kernel, depth):
+    # 曲面每一格需與 calculate_zigzag 的 segment_info 相同（含 JIT 與純 Python 兩種走訪路徑）
+    if kernel == "python":
+        monkeypatch.setattr(zigzag, "_zigzag_sweep_jit", None)
+    elif zigzag._zigzag_sweep_jit is None:
+        pytest.skip("numba 未安裝")
+    surface = zigzag_surface(bars, SURFACE_THRESHOLDS, SURFACE_DEPTHS).set_index(["depth", "threshold"])
+    for threshold in SURFACE_THRESHOLDS:
+        segment_info = calculate_zigzag(bars, threshold, depth)[1]
+        pct = segment_info["漲跌幅 (%)"]
+        rising = segment_info["方向"] == "📈 上漲"
+        expected = [len(segment_info), int(rising.sum()), int((~rising).sum()),
+                    pct[rising].median(), pct[~rising].median()]
+        actual = surface.loc[(depth, threshold)].tolist()
+        np.testing.assert_array_equal(actual, expected, err_msg=f"threshold={threshold}")
+
+
+@pytest.mark.parametrize("threshold, depth", [(5.0, 10), (2.0, 3), (8.0, 20), (1.0, 1)])
+def test_zigzag_stream_matches_batch(bars, threshold, depth):
+    state = ZigZagState(threshold, depth).update_frame(bars.iloc[:-500])
+    actual = state.update_frame(bars.iloc[-500:]).result()
+    expected = calculate_zigzag(bars, threshold, depth)
+    pd.testing.assert_frame_equal(actual[0], expected[0])
+    pd.testing.assert_frame_equal(actual[1], expected[1])
+    assert actual[2:] == expected[2:]
+
+
+@pytest.mark.parametrize("kernel", ["jit", "python"])
+@pytest.mark.parametrize("direction, add_pct, take_profit_pct, stop_loss_pct, max_add_times, add_multiple, "
+                         "add_amount_multiple", MARTIN_GRID)
+def test_martin_fast_matches_legacy(bars, monkeypatch, kernel, direction, add_pct, take_profit_pct, stop_loss_pct,
+                                    max_add_times, add_multiple, add_amount_multiple):
+    # 快速引擎需與 martin_backtest 逐欄逐值完全相同（含 JIT 與純 Python 兩種路徑）
+    if kernel == "python":
+        monkeypatch.setattr(martin_strategy, "_martin_kernel_jit", None)
+    elif martin_strategy._martin_kernel_jit is None:
+        pytest.skip("numba 未安裝")
+    params = backtest_params(add_pct, take_profit_pct, stop_loss_pct, max_add_times, add_multiple, add_amount_multiple)
+    expected = martin_backtest(*price_arrays(bars), direction, **params)
+    actual = martin_backtest_fast(*price_arrays(bars), direction, **params)
+    pd.testing.assert_frame_equal(actual[0], expected[0], check_exact=True)
+    pd.testing.assert_frame_equal(actual[1], expected[1], check_exact=True)
+
+
+@pytest.mark.parametrize("add_pct, take_profit_pct, stop_loss_pct, max_add_times", BOTH_GRID)
+def test_both_matches_separate_directions(bars, add_pct, take_profit_pct, stop_loss_pct, max_add_times):
+    # 多空一次走訪的結果需與兩個方向各自執行 martin_backtest 相同
+    params = backtest_params(add_pct, take_profit_pct, stop_loss_pct, max_add_times)
+    both = martin_backtest_both(*price_arrays(bars), compact=False, **params)
+    for direction in (1, -1):
+        expected = martin_backtest(*price_arrays(bars), direction, **params)
+        pd.testing.assert_frame_equal(both[direction][0], expected[0], check_exact=True)
+        pd.testing.assert_frame_equal(both[direction][1], expected[1], check_exact=True)
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_batch_matches_fast(bars, direction):
+    # 批次回測的統計需與逐組呼叫 martin_backtest_fast 相同
+    close, high, low, times = price_arrays(bars)
+    grid = np.array(list(itertools.product(np.arange(1.0, 4.1, 0.5), np.arange(1.0, 4.1, 0.7), range(1, 11, 3))))
+    stats = martin_backtest_batch(close, high, low, direction, leverage=10, add_multiple=1.0, max_add_times=7,
+                                  add_amount=100, add_amount_multiple=2.0, param_grid=grid)
+    for row, (add_pct, take_profit_pct, stop_loss_pct) in zip(stats, grid):
+        _, df_stats = martin_backtest_fast(close, high, low, times, direction,
+                                           **backtest_params(add_pct, take_profit_pct, stop_loss_pct))
+        values = df_stats["數值"]
+        expected = [values["止盈累計金額"], values["停損累計金額"], values["止盈次數"], values["停損次數"]]
+        assert [row[0], row[1], row[3], row[4]] == expected
+
+
+@pytest.mark.parametrize("max_limit", [None, 300, 7])
+@pytest.mark.parametrize("workers", [1, 4])
+def test_backfill_has_no_gaps_or_duplicates(tmp_path, workers, max_limit):
+    # max_limit：交易所每次回傳的筆數少於請求的 limit（okx 最多 300 筆）
+    start, tf_ms, n_bars = 1577836800000, 3600 * 1000, 3000
+    exchange = FakeExchange(start=start, now=start + n_bars * tf_ms, max_limit=max_limit)
+    filename = str(tmp_path / "bars.csv")
+    backfill_data(filename=filename, exchange=exchange, max_workers=workers)
+    stamps = pd.read_csv(filename, parse_dates=["時間"])["時間"].astype("int64") // 10**6
+    assert len(stamps) == n_bars
+    assert stamps.is_unique and (np.diff(stamps) == tf_ms).all()
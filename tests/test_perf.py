@@ -0,0 +1,31 @@
+import perf
+
+
+def run_stage(name):
+    with perf.stage(name):
+        pass
+
+
+def test_fragment_rerun_is_recorded():
+    recorder = perf.Recorder()
+    recorder.begin()
+    with recorder.fragment():
+        run_stage("K 線圖建圖")
+    run_stage("回測")
+    assert list(recorder.end().index) == ["K 線圖建圖", "回測"]
+
+    # fragment 單獨重跑：整頁量測已結束，fragment 自行記錄一次
+    with recorder.fragment():
+        run_stage("K 線圖建圖")
+    run_stage("fragment 以外")
+    assert list(recorder.last_run().index) == ["K 線圖建圖"]
+    assert len(recorder.history) == 2
+    assert list(recorder.history_frame().columns) == ["K 線圖建圖", "回測"]
+
+
+def test_disabled_fragment_records_nothing():
+    recorder = perf.Recorder()
+    recorder.enabled = False
+    with recorder.fragment():
+        run_stage("K 線圖建圖")
+    assert recorder.last_run().empty and not recorder.history
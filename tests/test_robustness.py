@@ -0,0 +1,8 @@
+import pytest
+
+from robustness import bars_per_year
+
+
+@pytest.mark.parametrize("timeframe, expected", [("15m", 35040), ("1h", 8760), ("4h", 2190), ("1d", 365), (None, 8760)])
+def test_bars_per_year_follows_timeframe(timeframe, expected):
+    assert bars_per_year(timeframe) == expected
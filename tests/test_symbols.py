@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import random_bars
+from symbols import SymbolRegistry, screen_symbols
+
+BACKTEST_PARAMS = dict(initial_balance=1000, leverage=10, add_pct=2.0, add_multiple=1.0, max_add_times=7,
+                       add_amount=100, add_amount_multiple=2.0, take_profit_pct=1.0, stop_loss_pct=10.0)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_failing_symbol_does_not_stop_screen(tmp_path, workers):
+    registry = SymbolRegistry(str(tmp_path / "symbols.json"))
+    for seed, symbol in enumerate(["BTC/USDT:USDT", "SOL/USDT:USDT"]):
+        filename = str(tmp_path / f"{symbol[:3]}.csv")
+        random_bars(600, seed=seed).to_csv(filename, index=False)
+        registry.add(symbol, filename=filename)
+    # 檔案路徑是目錄，讀取時丟出 IsADirectoryError
+    broken = tmp_path / "BAD.csv"
+    broken.mkdir()
+    registry.add("BAD/USDT:USDT", filename=str(broken))
+
+    df = screen_symbols(registry, backtest_params=BACKTEST_PARAMS,
+                        symbols=["BTC/USDT:USDT", "BAD/USDT:USDT", "SOL/USDT:USDT"], workers=workers)
+    assert df.loc["BAD/USDT:USDT", "錯誤"].startswith("IsADirectoryError")
+    assert df.loc["BAD/USDT:USDT", "排名"] == 3
+    for symbol in ("BTC/USDT:USDT", "SOL/USDT:USDT"):
+        assert df.loc[symbol, "錯誤"] is None
+        assert df.loc[symbol, "波段數"] > 0
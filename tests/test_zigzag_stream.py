@@ -0,0 +1,41 @@
+import pandas as pd
+
+import bar_store
+from conftest import random_bars
+from resample import open_timeframe
+from zigzag import ZigZagState, calculate_zigzag, stream_zigzag
+
+
+def assert_same_swings(actual, expected):
+    pd.testing.assert_frame_equal(actual[0], expected[0], check_exact=True)
+    pd.testing.assert_frame_equal(actual[1], expected[1], check_exact=True)
+    assert actual[2:] == expected[2:]
+
+
+def test_stream_matches_batch_after_append():
+    df = random_bars(3000)
+    state = ZigZagState.from_frame(df.iloc[:2000], threshold=2.0, depth=3)
+    bars = bar_store.BarStore.from_frame(df)
+    assert_same_swings(stream_zigzag(state, bars, 2.0, 3).result(), calculate_zigzag(df, 2.0, 3))
+
+
+def test_resampled_last_bucket_rewrite(tmp_path):
+    # 1h 基礎K棒合併成 4h：最後一個 4h 週期未走完，更新後重新合併的最後一根需取代舊值
+    df = random_bars(2402, seed=3)
+    filename = str(tmp_path / "bars.csv")
+    df.iloc[:2402 - 3].to_csv(filename, index=False)
+    bar_store.convert_csv(filename, timeframe="1h")
+    bars = open_timeframe(filename, "4h")
+    state = stream_zigzag(None, bars, 2.0, 3)
+    assert_same_swings(state.result(), calculate_zigzag(bars, 2.0, 3))
+
+    # 新增的K棒大幅改寫最後一個週期的最高/最低
+    df_new = df.iloc[2402 - 3:].copy()
+    df_new["最高"] *= 1.2
+    df_new["最低"] *= 0.8
+    signature = bar_store.source_signature(filename)
+    df_new.to_csv(filename, mode="a", header=False, index=False)
+    bar_store.append_bars(filename, df_new, signature, timeframe="1h")
+    bars = open_timeframe(filename, "4h")
+    assert not state.continues(bars)
+    assert_same_swings(stream_zigzag(state, bars, 2.0, 3).result(), calculate_zigzag(bars, 2.0, 3))
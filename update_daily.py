@@ -1,35 +1,256 @@
 # update_data.py
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import ccxt
 import pandas as pd
 from datetime import datetime
 
-def update_data(symbol="ETH/USDT:USDT", timeframe="1h", filename="ETH每小時Ｋ棒.csv"):
-    exchange = ccxt.okx()
+import bar_store
+from cache import get_cache
 
-    # 讀取已存在的檔案（如果有）
+COLUMNS = ["時間", "開盤", "最高", "最低", "收盤", "成交量"]
+
+
+def read_last_time(filename, block_size=4096):
+    """只讀檔尾取得最後一筆K棒時間，不解析整個檔案；檔案不存在時回傳 None"""
+    with open(filename, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        pos = end
+        # 往前讀到至少包含一整行資料為止
+        while pos > 0 and data.rstrip(b"\r\n").count(b"\n") < 1:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.rstrip(b"\r\n").split(b"\n")
+    last = lines[-1].decode("utf-8").strip()
+    if not last or last.startswith(COLUMNS[0]):
+        return None
+    return pd.Timestamp(last.split(",", 1)[0])
+
+
+def _append_rows(filename, df_rows):
+    # 先寫 journal 記錄原始大小，附加並 fsync 後才刪除 journal；中途中斷時由 bar_store.recover_csv 還原
+    size = os.path.getsize(filename)
+    journal = bar_store.journal_path(filename)
+    with open(journal, "w") as f:
+        f.write(str(size))
+        f.flush()
+        os.fsync(f.fileno())
+
+    payload = df_rows.to_csv(header=False, index=False, lineterminator="\n").encode("utf-8")
+    with open(filename, "r+b") as f:
+        if size > 0:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                payload = b"\n" + payload
+        f.seek(size)
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(journal)
+
+
+def _write_new_file(filename, df):
+    # 首次建立檔案：寫到暫存檔後再原子替換
+    tmp = filename + ".tmp"
+    df.to_csv(tmp, index=False)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def _last_time(filename):
+    # 優先使用二進位儲存的最後時間，不同步或不存在時才讀 CSV 檔尾
+    t = bar_store.last_time(filename)
+    return t if t is not None else read_last_time(filename)
+
+
+def _check_timeframe(filename, timeframe):
+    # 每個檔案只存一種K棒週期；要改用較細的基礎週期（例如 15m）請寫入另一個檔案
+    stored = (bar_store.read_meta(bar_store.store_path(filename)) or {}).get("timeframe")
+    if stored is not None and stored != timeframe:
+        raise ValueError(f"{filename} 儲存的是 {stored} K棒，不能寫入 {timeframe} K棒")
+
+
+def _commit_rows(filename, df_new, timeframe=None):
+    # CSV 保留為匯出格式並同步附加；二進位儲存為主要讀取來源
+    if not os.path.exists(filename) and bar_store.read_meta(bar_store.store_path(filename)):
+        bar_store.export_csv(filename, filename)  # CSV 遺失時先由二進位儲存還原
+    if os.path.exists(filename) and os.path.getsize(filename) > 0:
+        signature = bar_store.source_signature(filename)
+        _append_rows(filename, df_new)
+        bar_store.append_bars(filename, df_new, signature, timeframe=timeframe)
+    else:
+        _write_new_file(filename, df_new)
+        bar_store.convert_csv(filename, timeframe=timeframe)
+
+
+class _Pacer:
+    """多執行緒共用的請求節流器：依交易所 rateLimit（毫秒）排定每次請求的最早時間"""
+
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _fetch_ohlcv(exchange, pacer, symbol, timeframe, since, limit, retries=5):
+    # 單次請求；遇到頻率限制或網路錯誤時指數退避重試
+    for attempt in range(retries):
+        pacer.wait()
+        try:
+            return exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        except (ccxt.RateLimitExceeded, ccxt.NetworkError):
+            if attempt == retries - 1:
+                raise
+            time.sleep(pacer.interval * 2 ** attempt)
+
+
+def _fetch_page(exchange, pacer, symbol, timeframe, since, until, limit, tf_ms):
+    # 抓取 [since, until) 區間的K棒；交易所每次回傳的筆數可能少於 limit（例如 okx 最多 300 筆），
+    # 從最後一根的下一根繼續抓，直到涵蓋 until 或交易所不再回傳新資料
+    rows = []
+    while since < until:
+        ohlcv = _fetch_ohlcv(exchange, pacer, symbol, timeframe, since, limit)
+        new = [row for row in ohlcv if row[0] >= since]
+        if not new:
+            break
+        rows.extend(row for row in new if row[0] < until)
+        since = new[-1][0] + tf_ms
+    return rows
+
+
+def _checkpoint_path(filename):
+    return filename + ".backfill.json"
+
+
+def backfill_data(symbol="ETH/USDT:USDT", timeframe="1h", filename="ETH每小時Ｋ棒.csv", exchange=None,
+                  start=None, limit=500, max_workers=4, batch_pages=None):
+    """
+    分頁補齊從檔案最後一根（或 start / 交易所最早K棒）到目前為止的所有已收盤K棒
+    以 max_workers 個執行緒並行抓取，依交易所 rateLimit 節流；
+    每批頁面依序附加寫入並更新 checkpoint，中斷後重新呼叫即從上次進度繼續
+    回傳本次新增的K棒
+    """
+    exchange = exchange or ccxt.okx()
+    tf_ms = exchange.parse_timeframe(timeframe) * 1000
+    batch_pages = batch_pages or max_workers * 4
+    pacer = _Pacer(getattr(exchange, "rateLimit", 0) or 0)
+
+    _check_timeframe(filename, timeframe)
+    bar_store.recover_csv(filename)
+    try:
+        last_time = _last_time(filename)
+    except FileNotFoundError:
+        last_time = None
+
+    # 起點：檔案最後一根之後 > checkpoint 記錄 > 指定 start > 交易所最早的K棒
+    since = int(last_time.value // 10**6) + tf_ms if last_time is not None else None
+    checkpoint = _checkpoint_path(filename)
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            state = json.load(f)
+        if state.get("symbol") == symbol and state.get("timeframe") == timeframe:
+            since = max(since or 0, state["next_since"])
+    if since is None:
+        if start is not None:
+            since = int(pd.Timestamp(start).value // 10**6)
+        else:
+            first = exchange.fetch_ohlcv(symbol, timeframe, since=0, limit=1)
+            if not first:
+                return pd.DataFrame(columns=COLUMNS)
+            since = first[0][0]
+    since = since // tf_ms * tf_ms
+    # 只補到最後一根已收盤的K棒
+    end = exchange.milliseconds() // tf_ms * tf_ms
+    page_ms = limit * tf_ms
+    pages = list(range(since, end, page_ms))
+
+    added = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for b in range(0, len(pages), batch_pages):
+            batch = pages[b:b + batch_pages]
+            results = pool.map(
+                lambda page: _fetch_page(exchange, pacer, symbol, timeframe, page, min(page + page_ms, end), limit,
+                                         tf_ms),
+                batch,
+            )
+            rows = [row for page_rows in results for row in page_rows]
+            df_new = pd.DataFrame(rows, columns=COLUMNS).drop_duplicates(subset=["時間"]).sort_values("時間")
+            df_new["時間"] = pd.to_datetime(df_new["時間"], unit="ms")
+            if last_time is not None:
+                df_new = df_new[df_new["時間"] > last_time]
+            if not df_new.empty:
+                _commit_rows(filename, df_new, timeframe)
+                last_time = df_new["時間"].iloc[-1]
+                added.append(df_new)
+            # 記錄下一批的起點，空白頁（交易所無資料）也不會重抓
+            with open(checkpoint, "w") as f:
+                json.dump({"symbol": symbol, "timeframe": timeframe,
+                           "next_since": min(batch[-1] + page_ms, end)}, f)
+
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    df_added = pd.concat(added, ignore_index=True) if added else pd.DataFrame(columns=COLUMNS)
+    if added:
+        get_cache().invalidate_dataset(filename)
+    print(f"✅ 已補齊 {len(df_added)} 根K棒到 {filename}, 最新時間：{last_time}")
+    return df_added
+
+
+def update_data(symbol="ETH/USDT:USDT", timeframe="1h", filename="ETH每小時Ｋ棒.csv", exchange=None,
+                backfill=False, **backfill_kwargs):
+    """
+    抓取最新K棒並以附加方式寫入 CSV，回傳本次新增的K棒
+    只讀取檔尾找最後時間，只對重疊區間去重，不重寫整個檔案
+    backfill=True 時改以 backfill_data 分頁補齊所有缺漏區間
+    exchange: ccxt 交易所物件（預設 ccxt.okx()），離線測試可傳入 fake_exchange.FakeExchange
+    timeframe 會記錄在二進位儲存中，作為 resample 產生較長週期的基礎週期（可用較細的週期如 15m 另存一個檔案）
+    """
+    exchange = exchange or ccxt.okx()
+    if backfill:
+        return backfill_data(symbol, timeframe, filename, exchange=exchange, **backfill_kwargs)
+
+    _check_timeframe(filename, timeframe)
+    bar_store.recover_csv(filename)
     try:
-        df_old = pd.read_csv(filename, parse_dates=["時間"])
-        since = int(df_old["時間"].iloc[-1].timestamp() * 1000) + 1
+        last_time = _last_time(filename)
     except FileNotFoundError:
-        df_old = pd.DataFrame()
-        since = None  # 從頭抓
+        last_time = None
+    since = int(last_time.timestamp() * 1000) + 1 if last_time is not None else None  # None 代表從頭抓
 
     # 抓取最新資料
     ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=500)
-    df_new = pd.DataFrame(ohlcv, columns=["時間", "開盤", "最高", "最低", "收盤", "成交量"])
+    df_new = pd.DataFrame(ohlcv, columns=COLUMNS)
     df_new["時間"] = pd.to_datetime(df_new["時間"], unit="ms")
 
-    # 合併舊資料
-    if not df_old.empty:
-        df = pd.concat([df_old, df_new])
-        df = df.drop_duplicates(subset=["時間"]).reset_index(drop=True)
-    else:
-        df = df_new
-
-    df = df.iloc[:-1]
+    # 最後一根K棒尚未收盤，不寫入
+    df_new = df_new.iloc[:-1]
+    # 只需對與既有資料重疊的區間去重
+    if last_time is not None:
+        df_new = df_new[df_new["時間"] > last_time]
+    df_new = df_new.drop_duplicates(subset=["時間"]).reset_index(drop=True)
 
     # 存檔
-    df.to_csv(filename, index=False)
-    print(f"✅ 已更新資料到 {filename}, 最新時間：{df['時間'].iloc[-1]}")
+    if df_new.empty:
+        print(f"ℹ️ {filename} 沒有新的已收盤K棒，最新時間：{last_time}")
+        return df_new
+    _commit_rows(filename, df_new, timeframe)
+    get_cache().invalidate_dataset(filename)
+    print(f"✅ 已更新資料到 {filename}, 最新時間：{df_new['時間'].iloc[-1]}")
 
-    return df
+    return df_new
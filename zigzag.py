@@ -1,133 +1,402 @@
+from collections import deque
+import numpy as np
 import pandas as pd
 
+from bar_store import BarStore
+
+try:
+    from numba import njit
+except ImportError:  # 未安裝 numba 時改用純 Python 迴圈
+    njit = None
+
+SEGMENT_COLUMNS = ["方向", "價差", "漲跌幅 (%)", "波段編號", "起始時間", "結束時間"]
+# 側邊欄可選的 threshold / depth，參數敏感度熱圖的預設網格
+SURFACE_THRESHOLDS = tuple(np.round(np.arange(0.5, 10.01, 0.5), 1).tolist())
+SURFACE_DEPTHS = tuple(range(1, 21))
+SURFACE_COLUMNS = ["depth", "threshold", "波段數", "上漲波段數", "下跌波段數", "上漲中位數 (%)", "下跌中位數 (%)"]
+
+
+def pivot_masks(highs, lows, depth):
+    """
+    一次計算整段資料的轉折高/低點遮罩
+    以長度 2*depth+1 的置中滾動最大/最小值（O(n)）取代逐根切片比較，
+    只有 depth <= i < len - depth 的K棒可能為 True，與逐根比較結果完全相同
+    """
+    window = 2 * depth + 1
+    roll_max = pd.Series(highs).rolling(window, center=True).max().to_numpy()
+    roll_min = pd.Series(lows).rolling(window, center=True).min().to_numpy()
+    is_pivot_high = highs == roll_max
+    is_pivot_low = lows == roll_min
+    return is_pivot_high, is_pivot_low
+
+
+def _advance(direction, last_pivot_price, zigzag_idx, i, is_pivot_high, is_pivot_low, high, low, threshold):
+    """轉折點狀態機走一步（批次與串流共用），回傳更新後的 (direction, last_pivot_price)"""
+    if direction == 0:
+        if is_pivot_high:
+            direction = -1
+            last_pivot_price = high
+            zigzag_idx.append(i)
+        elif is_pivot_low:
+            direction = 1
+            last_pivot_price = low
+            zigzag_idx.append(i)
+    elif direction == 1:
+        if is_pivot_high:
+            change = (high - last_pivot_price) / last_pivot_price * 100
+            if change >= threshold:
+                last_pivot_price = high
+                zigzag_idx.append(i)
+                direction = -1
+        elif is_pivot_low and low < last_pivot_price:
+            last_pivot_price = low
+            zigzag_idx[-1] = i
+    elif direction == -1:
+        if is_pivot_low:
+            change = (last_pivot_price - low) / last_pivot_price * 100
+            if change >= threshold:
+                last_pivot_price = low
+                zigzag_idx.append(i)
+                direction = 1
+        elif is_pivot_high and high > last_pivot_price:
+            last_pivot_price = high
+            zigzag_idx[-1] = i
+    return direction, last_pivot_price
+
+
 def calculate_zigzag(df, threshold=5.0, depth=10):
     """
     計算 ZigZag 轉折點與波段統計
-    df: K棒資料 (需有 '最高', '最低', '收盤', '時間')
+    df: K棒資料 (需有 '最高', '最低', '收盤', '時間')，或 bar_store.BarStore（直接使用欄位陣列，不需建立 DataFrame）
     threshold: Deviation (%)
     depth: Pivot 前後比較長度
     """
-    highs = df["最高"].values
-    lows = df["最低"].values
-    closes = df["收盤"].values
+    if isinstance(df, BarStore):
+        zigzag_idx, _, _ = _find_pivots(df.high, df.low, df.close, threshold, depth)
+        return _build_swings(df.take(zigzag_idx))
+    zigzag_idx, _, _ = _find_pivots(df["最高"].values, df["最低"].values, df["收盤"].values, threshold, depth)
+    return _build_swings(df.iloc[np.asarray(zigzag_idx)].copy())
+
+
+def _find_pivots(highs, lows, closes, threshold, depth):
+    """批次走訪所有K棒，回傳 (轉折點位置, direction, last_pivot_price)"""
+    is_pivot_high, is_pivot_low = pivot_masks(highs, lows, depth)
 
     zigzag_idx = []
     direction = 0
     last_pivot_price = closes[depth]
     zigzag_idx.append(depth)
 
-    for i in range(depth, len(closes) - depth):
-        window_highs = highs[i - depth:i + depth + 1]
-        window_lows = lows[i - depth:i + depth + 1]
-        is_pivot_high = highs[i] == max(window_highs)
-        is_pivot_low = lows[i] == min(window_lows)
+    # 只需走訪至少符合一種轉折條件的K棒，其餘K棒不會改變狀態
+    candidates = np.flatnonzero(is_pivot_high | is_pivot_low)
+    for i in candidates.tolist():
+        direction, last_pivot_price = _advance(direction, last_pivot_price, zigzag_idx, i, is_pivot_high[i],
+                                               is_pivot_low[i], highs[i], lows[i], threshold)
+    return zigzag_idx, direction, last_pivot_price
 
-        if direction == 0:
-            if is_pivot_high:
-                direction = -1
-                last_pivot_price = highs[i]
-                zigzag_idx.append(i)
-            elif is_pivot_low:
-                direction = 1
-                last_pivot_price = lows[i]
-                zigzag_idx.append(i)
-        elif direction == 1:
-            if is_pivot_high:
-                change = (highs[i] - last_pivot_price) / last_pivot_price * 100
-                if change >= threshold:
-                    last_pivot_price = highs[i]
-                    zigzag_idx.append(i)
-                    direction = -1
-            elif is_pivot_low and lows[i] < last_pivot_price:
-                last_pivot_price = lows[i]
-                zigzag_idx[-1] = i
-        elif direction == -1:
-            if is_pivot_low:
-                change = (last_pivot_price - lows[i]) / last_pivot_price * 100
-                if change >= threshold:
-                    last_pivot_price = lows[i]
-                    zigzag_idx.append(i)
-                    direction = 1
-            elif is_pivot_high and highs[i] > last_pivot_price:
-                last_pivot_price = highs[i]
-                zigzag_idx[-1] = i
-
-    # 標籤處理
-    swing_points = df.iloc[zigzag_idx].copy()
-    swing_prices = []
-    labels = []
-    for i in range(len(zigzag_idx)):
-        idx = zigzag_idx[i]
-        if i == 0:
-            swing_prices.append(closes[idx])
-            labels.append("⬆ 初始")
-        else:
-            prev_idx = zigzag_idx[i - 1]
-            if df["收盤"].iloc[idx] > df["收盤"].iloc[prev_idx]:
-                swing_prices.append(df["最高"].iloc[idx])
-                labels.append("⬆ 高點")
-            else:
-                swing_prices.append(df["最低"].iloc[idx])
-                labels.append("⬇ 低點")
-    swing_points["pivot_price"] = swing_prices
-
-    # 標籤加序號
-    segment_no = []
-    up_no = 1
-    down_no = 1
-    new_labels = []
-    for i, label in enumerate(labels):
-        if i == 0:
-            segment_no.append(None)
-            new_labels.append(label)
-        else:
-            prev_price = swing_points["pivot_price"].iloc[i - 1]
-            curr_price = swing_points["pivot_price"].iloc[i]
-            price_diff = curr_price - prev_price
-            sign = "+" if price_diff >= 0 else "-"
-            diff_str = f"{sign}{abs(price_diff):.2f}"
-            if curr_price > prev_price:
-                segment_no.append(up_no)
-                new_labels.append(f"{label} {up_no} ({diff_str})")
-                up_no += 1
-            else:
-                segment_no.append(down_no)
-                new_labels.append(f"{label} {down_no} ({diff_str})")
-                down_no += 1
-    swing_points["label"] = new_labels
-    swing_points["segment_no"] = segment_no
+
+def _build_swings(swing_points):
+    """由轉折點所在的K棒列建立標籤、波段表與最大/最小統計"""
+    # 標籤處理：以陣列運算取代逐列 iloc
+    n = len(swing_points)
+    pivot_closes = swing_points["收盤"].to_numpy()
+    is_high = np.zeros(n, dtype=bool)
+    is_high[1:] = pivot_closes[1:] > pivot_closes[:-1]
+    pivot_price = np.where(is_high, swing_points["最高"].to_numpy(), swing_points["最低"].to_numpy()).astype(float)
+    pivot_price[0] = pivot_closes[0]
+    swing_points["pivot_price"] = pivot_price
+
+    # 標籤加序號：上漲/下跌各自累計編號
+    price_diff = np.diff(pivot_price)
+    rising = price_diff > 0
+    segment_no = np.where(rising, np.cumsum(rising), np.cumsum(~rising))
+    base_labels = np.where(is_high[1:], "⬆ 高點", "⬇ 低點")
+    labels = ["⬆ 初始"] + [
+        f"{label} {no} ({'+' if diff >= 0 else '-'}{abs(diff):.2f})"
+        for label, no, diff in zip(base_labels.tolist(), segment_no.tolist(), price_diff.tolist())
+    ]
+    swing_points["label"] = labels
+    swing_points["segment_no"] = np.concatenate(([np.nan], segment_no))
 
     # 顏色與位置
-    swing_points["text_color"] = ["red" if "高點" in l else "limegreen" if "低點" in l else "dodgerblue" for l in swing_points["label"]]
-    swing_points["text_position"] = ["bottom center" if "低點" in l else "top center" for l in swing_points["label"]]
-
-    # 波段統計資料
-    segment_info = []
-    for i in range(1, len(swing_points)):
-        prev = swing_points.iloc[i - 1]
-        curr = swing_points.iloc[i]
-        price_diff = curr["pivot_price"] - prev["pivot_price"]
-        pct_change = price_diff / prev["pivot_price"] * 100
-        direction_str = "📈 上漲" if price_diff > 0 else "📉 下跌"
-        seg_no = curr["segment_no"]
-        if seg_no is not None:
-            seg_no = int(seg_no)
-        segment_info.append((direction_str, round(price_diff, 2), round(pct_change, 2), seg_no, prev["時間"], curr["時間"]))
-
-    if segment_info:
-        increases = [x for x in segment_info if x[0] == "📈 上漲"]
-        decreases = [x for x in segment_info if x[0] == "📉 下跌"]
-
-        def get_max_min(data):
-            if not data:
-                return "無", "無"
-            max_seg = max(data, key=lambda x: x[2])
-            min_seg = min(data, key=lambda x: x[2])
-            max_str = f"#{max_seg[3]}｜價差: {max_seg[1]}｜漲跌幅: {max_seg[2]}%"
-            min_str = f"#{min_seg[3]}｜價差: {min_seg[1]}｜漲跌幅: {min_seg[2]}%"
-            return max_str, min_str
-
-        inc_max, inc_min = get_max_min(increases)
-        dec_max, dec_min = get_max_min(decreases)
+    text_color = np.where(is_high, "red", "limegreen").tolist()
+    text_color[0] = "dodgerblue"
+    swing_points["text_color"] = text_color
+    swing_points["text_position"] = np.where(is_high | (np.arange(n) == 0), "top center", "bottom center")
+
+    # 波段統計資料：每列一個波段，主程式各分頁可直接篩選
+    pivot_times = swing_points["時間"].to_numpy()
+    segment_info = pd.DataFrame({
+        "方向": np.where(rising, "📈 上漲", "📉 下跌"),
+        "價差": np.round(price_diff, 2),
+        "漲跌幅 (%)": np.round(price_diff / pivot_price[:-1] * 100, 2),
+        "波段編號": segment_no,
+        "起始時間": pivot_times[:-1],
+        "結束時間": pivot_times[1:],
+    }, columns=SEGMENT_COLUMNS)
+
+    increases = segment_info[segment_info["方向"] == "📈 上漲"]
+    decreases = segment_info[segment_info["方向"] == "📉 下跌"]
+
+    def get_max_min(data):
+        if data.empty:
+            return "無", "無"
+        max_seg = data.loc[data["漲跌幅 (%)"].idxmax()]
+        min_seg = data.loc[data["漲跌幅 (%)"].idxmin()]
+        max_str = f"#{max_seg['波段編號']}｜價差: {max_seg['價差']}｜漲跌幅: {max_seg['漲跌幅 (%)']}%"
+        min_str = f"#{min_seg['波段編號']}｜價差: {min_seg['價差']}｜漲跌幅: {min_seg['漲跌幅 (%)']}%"
+        return max_str, min_str
+
+    inc_max, inc_min = get_max_min(increases)
+    dec_max, dec_min = get_max_min(decreases)
 
     return swing_points, segment_info, inc_max, inc_min, dec_min, dec_max
+
+
+class ZigZagState:
+    """
+    串流版 ZigZag：保存方向、last_pivot_price 與尚可被取代的最後轉折點，逐根 update(bar) 推進
+    第 i 根K棒要等到第 i + depth 根進來、前後視窗完整後才判斷是否為轉折點，
+    每根新K棒只需檢查最近 2*depth+1 根，成本與歷史長度無關；result() 與 calculate_zigzag 對同一段資料的輸出相同
+    """
+
+    def __init__(self, threshold=5.0, depth=10):
+        self.threshold = threshold
+        self.depth = depth
+        self.n = 0                      # 已收到的K棒數
+        self.direction = 0
+        self.last_pivot_price = None
+        self.zigzag_idx = []
+        self.columns = None
+        self.first_time = None          # 第一根K棒的時間，用來確認後續資料接續同一段歷史
+        self._window = deque(maxlen=2 * depth + 1)   # 最近 2*depth+1 根的 (index, values, high, low)
+        self._pivot_rows = {}           # 轉折點位置 -> (index, values)
+
+    @classmethod
+    def from_frame(cls, df, threshold=5.0, depth=10):
+        """以批次運算建立已讀完 df 的狀態（比逐根 update 快），之後再以 update 接續新K棒"""
+        state = cls(threshold, depth)
+        if len(df) <= depth:
+            return state.update_frame(df)
+        zigzag_idx, state.direction, state.last_pivot_price = _find_pivots(
+            df["最高"].values, df["最低"].values, df["收盤"].values, threshold, depth)
+        state.zigzag_idx = zigzag_idx
+        state.columns = list(df.columns)
+        state.first_time = df["時間"].iloc[0]
+        state.n = len(df)
+        tail = df.iloc[-(2 * depth + 1):]
+        for index, values in zip(tail.index, tail[state.columns].itertuples(index=False, name=None)):
+            state._window.append((index, values, values[state.columns.index("最高")],
+                                  values[state.columns.index("最低")]))
+        pivots = df.iloc[zigzag_idx]
+        state._pivot_rows = {i: (index, values) for i, index, values in
+                             zip(zigzag_idx, pivots.index, pivots[state.columns].itertuples(index=False, name=None))}
+        return state
+
+    def update(self, bar, index=None):
+        """加入一根K棒；bar 為含 '時間','最高','最低','收盤' 等欄位的 dict 或 Series"""
+        if self.columns is None:
+            self.columns = list(bar.keys())
+        if index is None:
+            index = getattr(bar, "name", None)
+            index = self.n if index is None else index
+        values = tuple(bar[col] for col in self.columns)
+        if self.n == 0:
+            self.first_time = bar["時間"]
+        high, low = bar["最高"], bar["最低"]
+        self._window.append((index, values, high, low))
+        i_new = self.n
+        self.n += 1
+
+        depth = self.depth
+        if i_new == depth:
+            # 與批次版相同，以第 depth 根的收盤價作為初始轉折點
+            self.last_pivot_price = bar["收盤"]
+            self.zigzag_idx.append(depth)
+            self._pivot_rows[depth] = (index, values)
+
+        # 第 i 根的前後視窗剛好完整
+        i = i_new - depth
+        if i < depth:
+            return
+        pos = len(self._window) - 1 - depth
+        row_index, row_values, row_high, row_low = self._window[pos]
+        is_pivot_high = row_high == max(w[2] for w in self._window)
+        is_pivot_low = row_low == min(w[3] for w in self._window)
+        if not (is_pivot_high or is_pivot_low):
+            return
+        before = list(self.zigzag_idx[-1:])
+        self.direction, self.last_pivot_price = _advance(
+            self.direction, self.last_pivot_price, self.zigzag_idx, i, is_pivot_high, is_pivot_low,
+            row_high, row_low, self.threshold)
+        if self.zigzag_idx[-1] == i and before != [i]:
+            self._pivot_rows[i] = (row_index, row_values)
+            # 被取代的轉折點不再需要保存
+            if len(before) and before[0] not in self.zigzag_idx:
+                self._pivot_rows.pop(before[0], None)
+
+    def update_frame(self, df):
+        """依序加入 DataFrame 中的K棒（只需傳入新增的部分）"""
+        if self.columns is None:
+            self.columns = list(df.columns)
+        for index, values in zip(df.index, df[self.columns].itertuples(index=False, name=None)):
+            self.update(dict(zip(self.columns, values)), index=index)
+        return self
+
+    def continues(self, bars):
+        """
+        bars（BarStore）是否為已讀入資料的延續：第一根時間相同，且已讀入的最後一根未被改寫
+        合併週期（例如 4h）的最後一根在基礎K棒更新時會重新合併，改寫後不能只推進新增的K棒
+        """
+        if self.n == 0 or self.n > len(bars) or pd.Timestamp(bars.times[0]) != self.first_time:
+            return False
+        last = bars[self.n - 1:self.n].to_frame()
+        return self._window[-1][1] == tuple(last[self.columns].iloc[0])
+
+    def result(self):
+        """回傳與 calculate_zigzag 相同格式的 (swing_points, segment_info, inc_max, inc_min, dec_min, dec_max)"""
+        rows = [self._pivot_rows[i] for i in self.zigzag_idx]
+        swing_points = pd.DataFrame([values for _, values in rows], index=[index for index, _ in rows],
+                                    columns=self.columns)
+        return _build_swings(swing_points)
+
+
+def stream_zigzag(state, bars, threshold=5.0, depth=10):
+    """
+    將串流狀態推進到 bars（BarStore）結尾並回傳；state 為 None 或 bars 不是其延續時（資料被改寫、
+    合併週期的最後一根重新合併）重新建立，結果與 calculate_zigzag(bars) 相同
+    """
+    if state is None or not state.continues(bars):
+        return ZigZagState.from_frame(bars.to_frame(), threshold, depth)
+    return state.update_frame(bars[state.n:].to_frame())
+
+
+def pivot_mask_ladder(highs, lows, max_depth):
+    """
+    依序產生 depth = 1..max_depth 的 (depth, 轉折高點遮罩, 轉折低點遮罩)，與 pivot_masks 結果相同
+    置中滾動極值由前一個 depth 遞推：M_1[i] = max(h[i-1], h[i], h[i+1])，M_d[i] = max(M_{d-1}[i-1], M_{d-1}[i+1])
+    每個 depth 只需兩次位移比較，不必對每個 depth 重新計算長度 2d+1 的滾動視窗；視窗不完整處為 nan
+    """
+    highs = np.asarray(highs, dtype=np.float64)
+    lows = np.asarray(lows, dtype=np.float64)
+    roll_max = highs.copy()
+    roll_min = lows.copy()
+    for depth in range(1, max_depth + 1):
+        prev_max, prev_min = roll_max, roll_min
+        roll_max = np.full_like(highs, np.nan)
+        roll_min = np.full_like(lows, np.nan)
+        if depth == 1:
+            roll_max[1:-1] = np.maximum(np.maximum(prev_max[:-2], prev_max[1:-1]), prev_max[2:])
+            roll_min[1:-1] = np.minimum(np.minimum(prev_min[:-2], prev_min[1:-1]), prev_min[2:])
+        else:
+            roll_max[1:-1] = np.maximum(prev_max[:-2], prev_max[2:])
+            roll_min[1:-1] = np.minimum(prev_min[:-2], prev_min[2:])
+        yield depth, highs == roll_max, lows == roll_min
+
+
+def _zigzag_sweep(candidates, is_pivot_high, is_pivot_low, highs, lows, first_price, first_idx, thresholds,
+                  pivots, counts):
+    """
+    一次走訪候選K棒，同時推進所有 threshold 的轉折點狀態機（判斷與 _advance 相同）
+    pivots: (T, 上限) 轉折點位置，counts: 各 threshold 的轉折點數；就地寫入
+    """
+    n_thresholds = len(thresholds)
+    direction = np.zeros(n_thresholds, dtype=np.int64)
+    last_pivot_price = np.full(n_thresholds, first_price)
+    for t in range(n_thresholds):
+        pivots[t, 0] = first_idx
+        counts[t] = 1
+    for i in candidates:
+        pivot_high = is_pivot_high[i]
+        pivot_low = is_pivot_low[i]
+        high = highs[i]
+        low = lows[i]
+        for t in range(n_thresholds):
+            d = direction[t]
+            if d == 0:
+                if pivot_high:
+                    direction[t] = -1
+                    last_pivot_price[t] = high
+                    pivots[t, counts[t]] = i
+                    counts[t] += 1
+                elif pivot_low:
+                    direction[t] = 1
+                    last_pivot_price[t] = low
+                    pivots[t, counts[t]] = i
+                    counts[t] += 1
+            elif d == 1:
+                if pivot_high:
+                    if (high - last_pivot_price[t]) / last_pivot_price[t] * 100 >= thresholds[t]:
+                        last_pivot_price[t] = high
+                        pivots[t, counts[t]] = i
+                        counts[t] += 1
+                        direction[t] = -1
+                elif pivot_low and low < last_pivot_price[t]:
+                    last_pivot_price[t] = low
+                    pivots[t, counts[t] - 1] = i
+            else:
+                if pivot_low:
+                    if (last_pivot_price[t] - low) / last_pivot_price[t] * 100 >= thresholds[t]:
+                        last_pivot_price[t] = low
+                        pivots[t, counts[t]] = i
+                        counts[t] += 1
+                        direction[t] = 1
+                elif pivot_high and high > last_pivot_price[t]:
+                    last_pivot_price[t] = high
+                    pivots[t, counts[t] - 1] = i
+
+
+_zigzag_sweep_jit = njit(cache=True)(_zigzag_sweep) if njit is not None else None
+
+
+def _swing_summary(idx, highs, lows, closes):
+    # 與 _build_swings 相同的轉折價與漲跌幅，回傳 (波段數, 上漲數, 下跌數, 上漲中位數, 下跌中位數)
+    pivot_closes = closes[idx]
+    is_high = np.zeros(len(idx), dtype=bool)
+    is_high[1:] = pivot_closes[1:] > pivot_closes[:-1]
+    pivot_price = np.where(is_high, highs[idx], lows[idx])
+    pivot_price[0] = pivot_closes[0]
+    price_diff = np.diff(pivot_price)
+    pct = np.round(price_diff / pivot_price[:-1] * 100, 2)
+    rising = price_diff > 0
+    up, down = pct[rising], pct[~rising]
+    return (len(pct), len(up), len(down),
+            float(np.median(up)) if len(up) else np.nan, float(np.median(down)) if len(down) else np.nan)
+
+
+def zigzag_surface(df, thresholds=SURFACE_THRESHOLDS, depths=SURFACE_DEPTHS):
+    """
+    一次計算 threshold × depth 網格的波段數與上漲/下跌漲跌幅中位數，每格與 calculate_zigzag 的 segment_info 相同
+    轉折點遮罩以 pivot_mask_ladder 逐 depth 遞推；同一 depth 的所有 threshold 共用遮罩，並在同一次走訪中推進
+    df: K棒 DataFrame 或 bar_store.BarStore；回傳每格一列、欄位同 SURFACE_COLUMNS 的 DataFrame
+    """
+    if isinstance(df, BarStore):
+        highs, lows, closes = df.high, df.low, df.close
+    else:
+        highs, lows, closes = df["最高"].values, df["最低"].values, df["收盤"].values
+    highs = np.ascontiguousarray(highs, dtype=np.float64)
+    lows = np.ascontiguousarray(lows, dtype=np.float64)
+    closes = np.ascontiguousarray(closes, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    wanted = set(int(d) for d in depths)
+    n = len(highs)
+
+    rows = []
+    for depth, is_pivot_high, is_pivot_low in pivot_mask_ladder(highs, lows, max(wanted)):
+        if depth not in wanted:
+            continue
+        if n <= depth:
+            rows.extend((depth, t, 0, 0, 0, np.nan, np.nan) for t in thresholds.tolist())
+            continue
+        candidates = np.flatnonzero(is_pivot_high | is_pivot_low)
+        pivots = np.empty((len(thresholds), len(candidates) + 1), dtype=np.int64)
+        counts = np.zeros(len(thresholds), dtype=np.int64)
+        if _zigzag_sweep_jit is not None:
+            _zigzag_sweep_jit(candidates, is_pivot_high, is_pivot_low, highs, lows, closes[depth], depth,
+                              thresholds, pivots, counts)
+        else:
+            _zigzag_sweep(candidates.tolist(), is_pivot_high.tolist(), is_pivot_low.tolist(), highs.tolist(),
+                          lows.tolist(), closes[depth], depth, thresholds.tolist(), pivots, counts)
+        for t, threshold in enumerate(thresholds.tolist()):
+            rows.append((depth, threshold) + _swing_summary(pivots[t, :counts[t]], highs, lows, closes))
+    return pd.DataFrame(rows, columns=SURFACE_COLUMNS)